@@ -2,11 +2,10 @@
 # This bot uses Join Requests to manage temporary access to a private channel.
 # Updated for python-telegram-bot v20+ and .env configuration
 
+import asyncio
 import logging
 import os
-import requests
 from datetime import datetime, timedelta, timezone
-from collections import defaultdict
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -15,9 +14,10 @@ load_dotenv()
 # Make sure to install the required libraries:
 # pip install python-telegram-bot --upgrade
 # pip install python-dotenv
-# pip install requests
+# pip install httpx
 from telegram import Update
 from telegram.constants import ParseMode
+from telegram.error import BadRequest, TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -25,6 +25,14 @@ from telegram.ext import (
     ChatJoinRequestHandler, # <-- IMPORTANT: Using ChatJoinRequestHandler now
 )
 
+from backend_client import BackendError, close_backend, get_backend
+from expiry_engine import EXPIRY_ENGINE, EXPIRY_ENGINE_ENABLED
+from link_pool import LINK_POOL_ENABLED, LinkPool
+from membership_store import MembershipStore
+from telegram_scheduler import OutboundScheduler
+from update_processor import KeyedUpdateProcessor
+from validation_batcher import get_validation_batcher
+
 # --- CONFIGURATION ---
 # Variables are now loaded from the .env file
 BOT_TOKEN = os.getenv("BOT_TOKEN")
@@ -39,10 +47,14 @@ if ADMIN_USER_IDS_STR:
     # This splits the comma-separated string into a list of integers
     ADMIN_USER_IDS = [int(admin_id.strip()) for admin_id in ADMIN_USER_IDS_STR.split(',')]
 
-# This dictionary will store user data in memory.
-# For a real-world application, you should use a database (like SQLite, PostgreSQL) for persistence.
-# Structure: {user_id: {"kick_time": datetime_object}}
-expiring_users = defaultdict(dict)
+KICK_BATCH_SIZE = int(os.getenv("KICK_BATCH_SIZE", "100"))  # members removed per kick job run
+KICK_REASON = "Subscription expired"
+
+# Members this bot approved and when their access ends (SQLite, survives restarts)
+membership_store = MembershipStore()
+
+# Pre-created join-request links for CHANNEL_ID
+link_pool = LinkPool()
 
 # --- LOGGING SETUP ---
 # Enables logging to see errors and bot activity.
@@ -113,11 +125,14 @@ async def get_link_command(update: Update, context: CallbackContext) -> None:
         else:
             raise ValueError("Invalid time unit. Use 'm' for minutes or 'h' for hours.")
 
-        # Generate the invite link that requires approval (for testing)
-        invite_link = await context.bot.create_chat_invite_link(
-            chat_id=CHANNEL_ID,
-            creates_join_request=True 
-        )
+        # Take an invite link that requires approval (for testing) from the pool
+        if LINK_POOL_ENABLED:
+            invite_link_url, _ = await link_pool.allocate(CHANNEL_ID, f"admin:{update.effective_user.id}")
+        else:
+            invite_link_url = (await context.bot.create_chat_invite_link(
+                chat_id=CHANNEL_ID,
+                creates_join_request=True
+            )).invite_link
 
         # Calculate expiry time
         expiry_time = datetime.now() + timedelta(seconds=duration_seconds)
@@ -125,7 +140,7 @@ async def get_link_command(update: Update, context: CallbackContext) -> None:
         # Store this test link in backend database
         try:
             test_link_data = {
-                "link": invite_link.invite_link,
+                "link": invite_link_url,
                 "link_id": f"test_{int(datetime.now().timestamp())}_{value}{unit}",
                 "telegramUserId": None,
                 "userId": None,  # Test link without specific user
@@ -136,11 +151,7 @@ async def get_link_command(update: Update, context: CallbackContext) -> None:
             }
             
             # Send to backend to store
-            response = requests.post(
-                f"{BACKEND_URL}/api/telegram/store-test-link",
-                json=test_link_data,
-                timeout=10
-            )
+            response = await get_backend().store_test_link(test_link_data)
             
             if response.status_code == 200:
                 logger.info(f"✅ Test invite link stored in backend database")
@@ -153,7 +164,7 @@ async def get_link_command(update: Update, context: CallbackContext) -> None:
         # Send the link to the admin who requested it
         await update.message.reply_text(
             f"🔗 **Test Invite Link Generated ({duration_text}):**\n\n"
-            f"`{invite_link.invite_link}`\n\n"
+            f"`{invite_link_url}`\n\n"
             f"⏰ **User will be removed after:** {duration_text}\n"
             f"🕐 **Expiry time:** {expiry_time.strftime('%H:%M:%S')}\n\n"
             "✅ **This test link creates a temporary subscription that expires automatically.**\n\n"
@@ -164,7 +175,7 @@ async def get_link_command(update: Update, context: CallbackContext) -> None:
             parse_mode=ParseMode.MARKDOWN
         )
 
-        logger.info(f"Generated test invite link {invite_link.invite_link} with {duration_text} expiry for admin {update.effective_user.id}")
+        logger.info(f"Generated test invite link {invite_link_url} with {duration_text} expiry for admin {update.effective_user.id}")
 
     except (IndexError, ValueError) as e:
         await update.message.reply_text(
@@ -220,41 +231,34 @@ async def handle_join_request(update: Update, context: CallbackContext) -> None:
 
         logger.info(f"Validating join request with backend: {BACKEND_URL}/api/telegram/validate-join")
         
-        response = requests.post(
-            f"{BACKEND_URL}/api/telegram/validate-join",
-            json=validation_data,
-            timeout=30
-        )
+        result = await get_validation_batcher().validate(validation_data)
+
+        if result.get("approve", False):
+            # Approve the user
+            await context.bot.approve_chat_join_request(chat_id=chat.id, user_id=user.id)
+            logger.info(f"✅ Approved join request for {user.id} - validated by backend")
+
+            # Remember when this member has to be removed
+            if result.get("expires_at"):
+                kick_time = datetime.fromisoformat(result["expires_at"].replace("Z", "+00:00"))
+                membership_store.upsert(chat.id, user.id, kick_time.timestamp(), invite_link.invite_link)
+
+            # Send welcome message
+            try:
+                await context.bot.send_message(
+                    user.id,
+                    f"🎉 Welcome to {chat.title}! Your access is active and will be managed based on your subscription status."
+                )
+            except Exception as e:
+                logger.warning(f"Could not send welcome message to {user.id}: {e}")
 
-        if response.status_code == 200:
-            result = response.json()
-            
-            if result.get("approve", False):
-                # Approve the user
-                await context.bot.approve_chat_join_request(chat_id=chat.id, user_id=user.id)
-                logger.info(f"✅ Approved join request for {user.id} - validated by backend")
-
-                # Send welcome message
-                try:
-                    await context.bot.send_message(
-                        user.id,
-                        f"🎉 Welcome to {chat.title}! Your access is active and will be managed based on your subscription status."
-                    )
-                except Exception as e:
-                    logger.warning(f"Could not send welcome message to {user.id}: {e}")
-                
-            else:
-                # Decline the user
-                await context.bot.decline_chat_join_request(chat_id=chat.id, user_id=user.id)
-                logger.info(f"❌ Declined join request for {user.id} - reason: {result.get('reason', 'Backend validation failed')}")
-                
         else:
-            logger.error(f"Backend validation failed with status {response.status_code}: {response.text}")
-            # Decline by default if backend is unavailable
+            # Decline the user
             await context.bot.decline_chat_join_request(chat_id=chat.id, user_id=user.id)
+            logger.info(f"❌ Declined join request for {user.id} - reason: {result.get('reason', 'Backend validation failed')}")
             
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Failed to connect to backend for validation: {e}")
+    except BackendError as e:
+        logger.error(f"Backend validation failed: {e}")
         # Decline by default if backend is unavailable
         try:
             await context.bot.decline_chat_join_request(chat_id=chat.id, user_id=user.id)
@@ -271,24 +275,94 @@ async def handle_join_request(update: Update, context: CallbackContext) -> None:
 
 async def kick_expired_users(context: CallbackContext) -> None:
     """
-    This function is now primarily a placeholder since subscription expiry 
-    is handled by the backend ExpireUsersJob. The bot no longer needs to 
-    track kick times locally as the backend manages the full lifecycle.
-    
-    This could be used for additional cleanup if needed.
+    Remove members whose subscription has expired (only when EXPIRY_ENGINE=bot).
+
+    Candidates are the membership store's due rows (indexed on kick_time).
+    Each one is re-checked with the backend before the kick: a member who
+    renewed without rejoining gets their new kick time instead.
     """
-    logger.info("Kick job running - Backend handles subscription expiry management")
-    
-    # Optional: Clean up any leftover local data
-    if expiring_users:
-        logger.info(f"Cleaning up {len(expiring_users)} leftover local user records")
-        expiring_users.clear()
-        
-    # The backend ExpireUsersJob handles:
-    # 1. Finding expired payments
-    # 2. Removing users from Telegram channel
-    # 3. Updating user status in database
-    # 4. Cleaning up database records
+    due = await membership_store.due(limit=KICK_BATCH_SIZE)
+    if not due:
+        return
+
+    by_chat = {}
+    for chat_id, user_id, _ in due:
+        by_chat.setdefault(chat_id, []).append(user_id)
+
+    now = datetime.now(timezone.utc)
+    expired = []
+    for chat_id, user_ids in by_chat.items():
+        try:
+            response = await get_backend().expiring_members({
+                "telegram_user_ids": ",".join(str(user_id) for user_id in user_ids),
+                "channel_id": str(chat_id),
+                "limit": len(user_ids),
+            })
+            if response.status_code != 200:
+                raise BackendError(f"expiring members returned HTTP {response.status_code}")
+            memberships = {int(m["telegram_user_id"]): m for m in response.json().get("members", [])}
+        except BackendError as e:
+            # Without the backend's answer nobody is kicked; the next run tries again
+            logger.warning(f"⚠️ Could not re-check {len(user_ids)} due member(s) of {chat_id}, kicks postponed: {e}")
+            continue
+
+        for user_id in user_ids:
+            member = memberships.get(user_id)
+            if member is None:
+                # No active membership left: removed elsewhere, nothing to kick
+                logger.info(f"ℹ️ {user_id} has no active membership in {chat_id}, forgetting them")
+                membership_store.remove(chat_id, user_id)
+                continue
+            expires_at = datetime.fromisoformat(member["expires_at"].replace("Z", "+00:00"))
+            if expires_at > now:
+                logger.info(f"🔄 {user_id} renewed in {chat_id}, next kick at {expires_at.isoformat()}")
+                membership_store.upsert(chat_id, user_id, expires_at.timestamp())
+                continue
+            expired.append((chat_id, user_id, member["member_id"]))
+
+    if not expired:
+        await membership_store.flush()
+        return
+
+    logger.info(f"Kick job running - {len(expired)} member(s) due for removal")
+
+    async def kick(chat_id, user_id, member_id):
+        try:
+            await context.bot.ban_chat_member(chat_id=chat_id, user_id=user_id)
+            # Unban straight away so the user can rejoin with a new subscription
+            await context.bot.unban_chat_member(chat_id=chat_id, user_id=user_id, only_if_banned=True)
+            logger.info(f"👢 Removed expired member {user_id} from {chat_id}")
+        except BadRequest as e:
+            # Typically the user already left
+            logger.info(f"ℹ️ Could not remove {user_id} from {chat_id}, treating as gone: {e}")
+        except TelegramError as e:
+            # Kept in the store; the next run retries
+            logger.error(f"❌ Failed to remove {user_id} from {chat_id}: {e}")
+            return None
+
+        membership_store.remove(chat_id, user_id)
+
+        try:
+            await context.bot.send_message(
+                user_id,
+                "⏰ Your subscription has expired.\n\nTo continue accessing premium content, please renew your subscription."
+            )
+        except Exception as e:
+            logger.warning(f"Could not send expiry message to {user_id}: {e}")
+
+        return {"member_id": member_id, "kicked_at": datetime.now(timezone.utc).isoformat(), "reason": KICK_REASON}
+
+    kicks = [kick for kick in await asyncio.gather(*(kick(*member) for member in expired)) if kick]
+    await membership_store.flush()
+
+    # Close the memberships in the backend
+    if kicks:
+        try:
+            response = await get_backend().members_kicked({"kicks": kicks})
+            if response.status_code != 200:
+                raise BackendError(f"members/kicked returned HTTP {response.status_code}")
+        except BackendError as e:
+            logger.warning(f"Could not record {len(kicks)} kick(s) with the backend: {e}")
 
 
 # --- MAIN BOT SETUP ---
@@ -299,7 +373,27 @@ def main() -> None:
         logger.error("!!! One or more environment variables (BOT_TOKEN, CHANNEL_ID, ADMIN_USER_IDS) are not set. Please create and configure your .env file. !!!")
         return
 
-    application = Application.builder().token(BOT_TOKEN).build()
+    async def on_startup(application: Application) -> None:
+        await membership_store.open()
+        tracked = await membership_store.load()
+        logger.info(f"📂 Loaded {len(tracked)} tracked member(s) from the membership store")
+        if LINK_POOL_ENABLED:
+            await link_pool.start(application.bot, channels=[CHANNEL_ID])
+
+    async def on_shutdown(application: Application) -> None:
+        await link_pool.stop()
+        await membership_store.close()
+        await close_backend()
+
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(KeyedUpdateProcessor())
+        .rate_limiter(OutboundScheduler())
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
 
     # Add command handlers
     application.add_handler(CommandHandler("start", start_command))
@@ -308,9 +402,12 @@ def main() -> None:
     # Add the handler for join requests
     application.add_handler(ChatJoinRequestHandler(handle_join_request))
 
-    # Set up the recurring job to kick users
-    job_queue = application.job_queue
-    job_queue.run_repeating(kick_expired_users, interval=60, first=0)
+    # Set up the recurring job to kick users, unless the backend's cron owns expiries
+    if EXPIRY_ENGINE_ENABLED:
+        job_queue = application.job_queue
+        job_queue.run_repeating(kick_expired_users, interval=60, first=0)
+    else:
+        logger.info(f"⏭️ Kick job off - expired members are removed by the {EXPIRY_ENGINE} (EXPIRY_ENGINE)")
 
     # Start the Bot
     application.run_polling()
@@ -2,11 +2,14 @@
 # Multi-channel support with database integration
 # Compatible with python-telegram-bot v20+
 
+import asyncio
 import logging
 import os
-import requests
+import signal
+import time
 from datetime import datetime, timedelta, timezone
 from collections import defaultdict
+from aiohttp import web
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -14,6 +17,7 @@ load_dotenv()
 
 from telegram import Update
 from telegram.constants import ParseMode
+from telegram.error import TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -21,10 +25,46 @@ from telegram.ext import (
     ChatJoinRequestHandler,
 )
 
+from admin_reports import CHANNELS_LIST_LIMIT, channels_report, reload_report
+from backend_client import BackendError, backend_breaker, close_backend, get_backend
+from channel_registry import ChannelRecord, ChannelRegistry
+from control_server import ControlServer
+from expiry_engine import EXPIRY_ENGINE_ENABLED, EXPIRY_SYNC_INTERVAL, ExpiryEngine
+from handler_timing import attach_slow_request_log, phase, timed_handler
+from held_joins import HOLD_ENABLED, HeldJoinQueue
+from link_pool import LINK_POOL_ENABLED, LinkPool
+from metrics import (
+    CHANNEL_REGISTRY_SIZE, CHANNEL_SYNC_SECONDS, JOIN_REQUEST_SECONDS, JOIN_REQUESTS,
+    gauge, metrics_handler, monitor_event_loop,
+)
+from outbox import get_outbox
+from post_approval import get_post_approval
+from sharding import BOT_SHARD_INDEX, BOT_SHARDS, owns_channel
+from telegram_scheduler import OutboundScheduler
+from update_dedup import FRESH, JoinDeduplicator
+from update_processor import KeyedUpdateProcessor
+from validation_batcher import get_validation_batcher
+from verdict_cache import DeclineCache, JoinThrottle
+
 # --- CONFIGURATION ---
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:4000")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")  # load_test.py points this at a fake
 ADMIN_USER_IDS_STR = os.getenv("ADMIN_USER_IDS")
+CHANNEL_SYNC_INTERVAL = int(os.getenv("CHANNEL_SYNC_INTERVAL", "300"))  # seconds
+CHANNEL_FULL_RESYNC_INTERVAL = int(os.getenv("CHANNEL_FULL_RESYNC_INTERVAL", "3600"))  # seconds
+BACKEND_HEALTH_TTL = int(os.getenv("BACKEND_HEALTH_TTL", "30"))  # seconds /status reuses a health check
+
+# Update ingress: "polling" (default), "webhook", or "worker" (fed by bot_ingress.py, see sharding.py)
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # public base URL Telegram posts to, e.g. https://bot.example.com
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN")
+
+# Only the update types the bot handles: commands and join requests
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CHAT_JOIN_REQUEST]
 
 # Parse admin user IDs
 ADMIN_USER_IDS = []
@@ -32,7 +72,33 @@ if ADMIN_USER_IDS_STR:
     ADMIN_USER_IDS = [int(admin_id.strip()) for admin_id in ADMIN_USER_IDS_STR.split(',')]
 
 # Multi-channel management
-active_channels = {}  # {channel_id: {"admin_id": "xxx", "name": "xxx", "group_id": "xxx"}}
+channel_registry = ChannelRegistry()
+
+# Recent backend declines and per-user join rate limits
+decline_cache = DeclineCache()
+join_throttle = JoinThrottle()
+
+# Re-delivered join requests are dropped before any network I/O
+join_dedup = JoinDeduplicator()
+
+# Paces every Bot API call; approve/decline go ahead of DMs
+outbound_scheduler = OutboundScheduler()
+
+# Kicks members when their subscription expires (only this shard's channels)
+expiry_engine = ExpiryEngine(owns=owns_channel)
+
+# Pre-created join-request links, handed to the backend through the control API
+link_pool = LinkPool(is_active=lambda channel_id: channel_id in channel_registry)
+
+# Join requests left pending while the backend is unavailable, replayed once it recovers
+held_joins = HeldJoinQueue(backend_breaker)
+
+# Local API used by the backend to reach the bot
+control_server = ControlServer()
+
+# Last backend health check, shared by startup and /status
+backend_health = {"status": "❓ Not checked yet", "checked_at": 0.0}
+started_at = time.time()
 
 # --- LOGGING SETUP ---
 logging.basicConfig(
@@ -42,47 +108,112 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # --- CHANNEL MANAGEMENT ---
-async def load_active_channels():
-    """Load active channels and their configurations from the database"""
-    global active_channels
+
+# Sync state for /api/groups/active: ETag for "nothing changed", cursor for deltas
+channel_sync = {"etag": None, "cursor": None, "last_full_sync": None}
+
+
+async def load_active_channels(full=False):
+    """
+    Sync active channels from the database.
+
+    Sends If-None-Match so an unchanged registry costs one 304, and an
+    updated_since cursor so only changed groups are transferred. A full
+    resync runs on startup, on /reload and every CHANNEL_FULL_RESYNC_INTERVAL.
+    """
+    last_full = channel_sync["last_full_sync"]
+    if (
+        channel_sync["cursor"] is None
+        or last_full is None
+        or (datetime.now(timezone.utc) - last_full).total_seconds() >= CHANNEL_FULL_RESYNC_INTERVAL
+    ):
+        full = True
+
+    params = None if full else {"updated_since": channel_sync["cursor"]}
+    headers = {"If-None-Match": channel_sync["etag"]} if channel_sync["etag"] and not full else None
+
+    sync_started = time.perf_counter()
     try:
-        logger.info("Loading active channels from database...")
-        response = requests.get(f"{BACKEND_URL}/api/groups/active", timeout=30)
-        
-        if response.status_code == 200:
-            data = response.json()
-            channels_data = data.get('active_channels', [])
-            
-            active_channels.clear()
-            
-            for channel_data in channels_data:
-                channel_id = channel_data.get('channel_id')
-                if channel_id:
-                    active_channels[int(channel_id)] = {
-                        'admin_id': str(channel_data.get('admin_id', '')),
-                        'name': channel_data.get('name', 'Unknown Channel'),
-                        'group_id': str(channel_data.get('group_id', '')),
-                        'chat_title': channel_data.get('chat_title', 'Unknown Channel'),
-                        'is_legacy': channel_data.get('is_legacy', False),
-                        'channel_db_id': channel_data.get('channel_db_id', ''),
-                        'join_link': channel_data.get('join_link', '')
-                    }
-            
-            logger.info(f"✅ Loaded {len(active_channels)} active channels from database")
-            
-            # Log loaded channels (without sensitive data)
-            for channel_id, info in active_channels.items():
-                legacy_indicator = " [Legacy]" if info['is_legacy'] else ""
-                logger.info(f"  📺 Channel: {info['chat_title']} (ID: {channel_id}){legacy_indicator}")
-                
-        else:
+        response = await get_backend().active_groups(params=params, headers=headers)
+
+        if response.status_code == 304:
+            CHANNEL_SYNC_SECONDS.labels(mode="unchanged").observe(time.perf_counter() - sync_started)
+            logger.debug("Channel registry unchanged")
+            return
+
+        if response.status_code != 200:
             logger.warning(f"❌ Failed to load channels from database: HTTP {response.status_code}")
-            
-    except requests.exceptions.RequestException as e:
+            return
+
+        data = response.json()
+        incoming = {}
+        for channel_data in data.get('active_channels', []):
+            record = ChannelRecord.from_payload(channel_data)
+            # In sharded mode each worker holds only the channels it owns
+            if record and owns_channel(record.channel_id):
+                incoming[record.channel_id] = record
+
+        # Older backends ignore updated_since and always return the full list
+        is_delta = data.get('mode') == 'delta'
+        if is_delta:
+            # Changed bundles may have lost channels; deleted bundles (tombstones) lost all of them
+            removed = [
+                record.channel_id
+                for group_id in [*data.get('changed_groups', []), *data.get('removed_groups', [])]
+                for record in channel_registry.by_group(group_id)
+                if record.channel_id not in incoming
+            ]
+        else:
+            removed = [record.channel_id for record in channel_registry if record.channel_id not in incoming]
+
+        added = sum(1 for channel_id in incoming if channel_id not in channel_registry)
+        updated = sum(
+            1 for channel_id, record in incoming.items()
+            if channel_id in channel_registry and channel_registry.get(channel_id) != record
+        )
+
+        # Build a new snapshot and swap it in, so concurrent join requests
+        # never see a partially loaded registry
+        started = time.perf_counter()
+        if is_delta:
+            channel_registry.apply_delta(incoming.values(), removed)
+        else:
+            channel_registry.replace(incoming.values())
+        build_ms = (time.perf_counter() - started) * 1000
+        CHANNEL_SYNC_SECONDS.labels(mode="delta" if is_delta else "full").observe(time.perf_counter() - sync_started)
+
+        channel_sync["etag"] = response.headers.get("ETag")
+        channel_sync["cursor"] = data.get('cursor')
+        if not is_delta:
+            channel_sync["last_full_sync"] = datetime.now(timezone.utc)
+
+        if added or updated or removed or not is_delta:
+            logger.info(
+                f"✅ Channel sync ({'delta' if is_delta else 'full'}): "
+                f"+{added} ~{updated} -{len(removed)}, {len(channel_registry)} active channels "
+                f"(snapshot built in {build_ms:.1f} ms)"
+            )
+
+    except BackendError as e:
         logger.error(f"❌ Network error loading channels: {e}")
     except Exception as e:
         logger.error(f"❌ Unexpected error loading channels: {e}")
 
+async def check_backend_health(max_age=BACKEND_HEALTH_TTL):
+    """Backend status line, re-checked at most every `max_age` seconds"""
+    if time.time() - backend_health["checked_at"] < max_age:
+        return backend_health["status"]
+    try:
+        response = await get_backend().test_config()
+        if response.status_code == 200:
+            status = "✅ Connected"
+        else:
+            status = f"⚠️ HTTP {response.status_code}"
+    except Exception as e:
+        status = f"❌ Error: {str(e)[:50]}"
+    backend_health.update(status=status, checked_at=time.time())
+    return status
+
 # --- BOT COMMANDS ---
 
 async def start_command(update: Update, context: CallbackContext) -> None:
@@ -101,9 +232,9 @@ async def start_command(update: Update, context: CallbackContext) -> None:
             "• `/getlink <time>` - Generate test invite link\n"
             "   *Examples:* `/getlink 1m`, `/getlink 1h`, `/getlink 1d`\n"
             "• `/reload` - Reload channel configurations\n"
-            "• `/channels` - List managed channels\n"
+            "• `/channels [admin_id]` - List managed channels\n"
             "• `/status` - Bot status and statistics\n\n"
-            f"🏢 **Active Channels:** {len(active_channels)}\n"
+            f"🏢 **Active Channels:** {len(channel_registry)}\n"
             f"🔗 **Backend:** {BACKEND_URL}"
         )
     else:
@@ -118,7 +249,8 @@ async def start_command(update: Update, context: CallbackContext) -> None:
             "❓ Need help? Contact the channel administrator."
         )
     
-    await update.message.reply_text(welcome_message, parse_mode=ParseMode.MARKDOWN)
+    with phase("reply"):
+        await update.message.reply_text(welcome_message, parse_mode=ParseMode.MARKDOWN)
 
 
 async def reload_channels_command(update: Update, context: CallbackContext) -> None:
@@ -129,40 +261,44 @@ async def reload_channels_command(update: Update, context: CallbackContext) -> N
     
     await update.message.reply_text("🔄 Reloading channel configurations...")
     
-    old_count = len(active_channels)
-    await load_active_channels()
-    new_count = len(active_channels)
+    old_count, new_count = await reload_channels()
     
-    await update.message.reply_text(
-        f"✅ **Channels reloaded!**\n\n"
-        f"📊 **Before:** {old_count} channels\n"
-        f"📊 **After:** {new_count} channels\n"
-        f"🔄 **Change:** {'+' if new_count > old_count else ''}{new_count - old_count}"
-    )
+    with phase("reply"):
+        await update.message.reply_text(reload_report(old_count, new_count))
+
+
+async def reload_channels():
+    """Full channel reload; returns the channel count before and after"""
+    old_count = len(channel_registry)
+    with phase("channel_sync"):
+        await load_active_channels(full=True)
+    return old_count, len(channel_registry)
 
 
 async def channels_command(update: Update, context: CallbackContext) -> None:
-    """List managed channels (Admin only)"""
+    """List managed channels, optionally for one tenant: /channels [admin_id] (Admin only)"""
     if update.effective_user.id not in ADMIN_USER_IDS:
         await update.message.reply_text("⚠️ Access denied. Admin privileges required.")
         return
-    
-    if not active_channels:
-        await update.message.reply_text("📭 No active channels configured.")
-        return
-    
-    message_parts = ["📺 **Managed Channels:**\n"]
-    
-    for channel_id, info in active_channels.items():
-        status_emoji = "🟢" if info.get('status') == 'active' else "🟡"
-        message_parts.append(
-            f"{status_emoji} **{info['name']}**\n"
-            f"   📍 ID: `{channel_id}`\n"
-            f"   👤 Admin: `{info['admin_id']}`\n"
+
+    total, entries = channel_entries(context.args[0] if context.args else None)
+    with phase("reply"):
+        await update.message.reply_text(channels_report(total, entries), parse_mode=ParseMode.MARKDOWN)
+
+
+def channel_entries(admin_id=None):
+    """Channel count and the first CHANNELS_LIST_LIMIT formatted entries, optionally for one tenant"""
+    # Per-tenant listing goes through the admin_id index instead of a full scan
+    channels = channel_registry.by_admin(admin_id) if admin_id else list(channel_registry)
+    entries = []
+    for record in channels[:CHANNELS_LIST_LIMIT]:
+        legacy_indicator = " [Legacy]" if record.is_legacy else ""
+        entries.append(
+            f"🟢 **{record.name}**{legacy_indicator}\n"
+            f"   📍 ID: `{record.channel_id}`\n"
+            f"   👤 Admin: `{record.admin_id}`\n"
         )
-    
-    message = "\n".join(message_parts)
-    await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
+    return len(channels), entries
 
 
 async def status_command(update: Update, context: CallbackContext) -> None:
@@ -171,28 +307,61 @@ async def status_command(update: Update, context: CallbackContext) -> None:
         await update.message.reply_text("⚠️ Access denied. Admin privileges required.")
         return
     
-    # Test backend connection
-    backend_status = "❌ Disconnected"
-    try:
-        response = requests.get(f"{BACKEND_URL}/api/payment/test-config", timeout=10)
-        if response.status_code == 200:
-            backend_status = "✅ Connected"
-        else:
-            backend_status = f"⚠️ HTTP {response.status_code}"
-    except Exception as e:
-        backend_status = f"❌ Error: {str(e)[:50]}"
+    status_message = await status_report(context.application)
+    with phase("reply"):
+        await update.message.reply_text(status_message, parse_mode=ParseMode.MARKDOWN)
+
+
+async def status_report(application: Application) -> str:
+    """The /status text for this process (one shard when sharded)"""
+    with phase("backend_health"):
+        backend_status = await check_backend_health()
+
+    queue_stats = application.update_processor.stats()
+    cache_stats = decline_cache.stats()
+    dedup_stats = join_dedup.stats()
+    outbound_stats = outbound_scheduler.stats()
+    with phase("outbox_stats"):
+        outbox_stats = await get_outbox().stats()
+    expiry_stats = expiry_engine.stats()
+    pool_stats = link_pool.stats()
+    side_effects = get_post_approval().stats()
+    breaker_stats = backend_breaker.stats()
+    breaker_state = breaker_stats["state"].replace("_", "-")
+    if breaker_stats["state"] == "open":
+        breaker_state += f", probing again in {breaker_stats['retry_in']}s"
+    held_stats = held_joins.stats()
     
-    status_message = (
+    return (
         f"🤖 **Bot Status Report**\n\n"
         f"🔗 **Backend:** {backend_status}\n"
-        f"📺 **Channels:** {len(active_channels)} active\n"
+        f"🔌 **Backend circuit:** {breaker_state} ({breaker_stats['opened']} trips)\n"
+        f"⏸️ **Held joins:** {held_stats['waiting']} waiting, {held_stats['replayed']} replayed\n"
+        f"📺 **Channels:** {len(channel_registry)} active"
+        f"{f' (shard {BOT_SHARD_INDEX + 1}/{BOT_SHARDS})' if BOT_SHARDS > 1 else ''}\n"
         f"👥 **Admins:** {len(ADMIN_USER_IDS)} configured\n"
+        f"⚙️ **Updates:** {queue_stats['in_flight']} in flight, {queue_stats['queue_depth']} queued "
+        f"(max {queue_stats['max_workers']} workers)\n"
+        f"🧊 **Decline cache:** {cache_stats['size']} entries, {cache_stats['hits']} hits / "
+        f"{cache_stats['misses']} misses, {join_throttle.throttled} throttled\n"
+        f"🔁 **Dedup:** {dedup_stats['duplicates']} re-deliveries dropped of {dedup_stats['checks']} "
+        f"({dedup_stats['hit_rate']:.1%}), {dedup_stats['size']} keys\n"
+        f"📤 **Telegram API:** {outbound_stats['calls']} calls, {outbound_stats['queue_depth']} queued, "
+        f"{outbound_stats['retry_after']} RetryAfter; wait p95 join "
+        f"{outbound_stats['wait']['join']['p95_ms']} ms / DM {outbound_stats['wait']['message']['p95_ms']} ms\n"
+        f"📮 **Outbox:** {outbox_stats['pending']} pending, {outbox_stats['dead']} dead, "
+        f"{outbox_stats['delivered']} delivered\n"
+        f"🧵 **Post-approval:** {side_effects['running']} running, failed/exhausted: "
+        f"revoke {side_effects.get('revoke', {}).get('failed', 0)}/{side_effects.get('revoke', {}).get('exhausted', 0)}, "
+        f"DM {side_effects.get('dm', {}).get('failed', 0)}/{side_effects.get('dm', {}).get('exhausted', 0)}\n"
+        f"⏳ **Expiry:** {expiry_stats['scheduled']} scheduled, {expiry_stats['queued']} queued, "
+        f"{expiry_stats['kicked']} kicked (avg {expiry_stats['avg_lag']}s after expiry)\n"
+        f"🔗 **Link pool:** {pool_stats['free']} ready across {pool_stats['channels']} channel(s), "
+        f"{pool_stats['allocated']} handed out, {pool_stats['misses']} created on demand\n"
         f"🌐 **Backend URL:** `{BACKEND_URL}`\n"
-        f"⏰ **Uptime:** Bot running\n"
+        f"⏰ **Uptime:** {timedelta(seconds=int(time.time() - started_at))}\n"
         f"🔄 **Last Update:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
     )
-    
-    await update.message.reply_text(status_message, parse_mode=ParseMode.MARKDOWN)
 
 
 async def get_link_command(update: Update, context: CallbackContext) -> None:
@@ -239,24 +408,22 @@ async def get_link_command(update: Update, context: CallbackContext) -> None:
             "test_mode": True
         }
 
-        response = requests.post(
-            f"{BACKEND_URL}/api/invite/generate-test-link",
-            json=test_data,
-            timeout=30
-        )
+        with phase("backend"):
+            response = await get_backend().generate_test_link(test_data)
 
         if response.status_code == 200:
             result = response.json()
             invite_link = result.get("invite_link")
             
             if invite_link:
-                await update.message.reply_text(
-                    f"✅ **Test invite link generated!**\n\n"
-                    f"🔗 **Link:** {invite_link}\n"
-                    f"⏰ **Duration:** {duration_str}\n"
-                    f"⚠️ **Note:** This is a test link for verification purposes.",
-                    parse_mode=ParseMode.MARKDOWN
-                )
+                with phase("reply"):
+                    await update.message.reply_text(
+                        f"✅ **Test invite link generated!**\n\n"
+                        f"🔗 **Link:** {invite_link}\n"
+                        f"⏰ **Duration:** {duration_str}\n"
+                        f"⚠️ **Note:** This is a test link for verification purposes.",
+                        parse_mode=ParseMode.MARKDOWN
+                    )
             else:
                 await update.message.reply_text("❌ Failed to generate invite link.")
         else:
@@ -289,8 +456,67 @@ def parse_duration(duration_str):
 
 # --- JOIN REQUEST HANDLING ---
 
+def build_validation_payload(user, chat, invite_link, channel_info):
+    """Body for /api/telegram/validate-join"""
+    return {
+        "invite_link": invite_link.invite_link,
+        "telegram_user_id": str(user.id),
+        "channel_id": str(chat.id),
+        "user_info": {
+            "first_name": user.first_name,
+            "last_name": user.last_name,
+            "username": user.username
+        },
+        "channel_info": {
+            "admin_id": channel_info.admin_id,
+            "group_id": channel_info.group_id,
+            "channel_name": channel_info.name
+        }
+    }
+
+
+def welcome_message(chat_title):
+    return (
+        f"🎉 **Welcome to {chat_title}!**\n\n"
+        "Your access has been approved and is now active.\n\n"
+        "📋 **Important Notes:**\n"
+        "• Your access is time-limited based on your plan\n"
+        "• You'll receive notifications before expiry\n"
+        "• Your timer starts from the moment you joined\n"
+        "• Contact support for any issues\n\n"
+        "Enjoy your premium content! 🚀"
+    )
+
+
+def decline_message(chat_title, reason):
+    return (
+        f"❌ **Access Denied to {chat_title}**\n\n"
+        f"Reason: {reason}\n\n"
+        "Please contact support if you believe this is an error."
+    )
+
+
 async def handle_join_request(update: Update, context: CallbackContext) -> None:
     """Handle join requests with multi-channel support"""
+    started = time.perf_counter()
+    with phase("dedup"):
+        check = join_dedup.begin(update)
+    if check != FRESH:
+        logger.info(f"🔁 Dropped re-delivered join request (update {update.update_id}, {check})")
+        JOIN_REQUESTS.labels(channel=str(update.chat_join_request.chat.id), outcome="duplicate", reason=check).inc()
+        return
+
+    outcome, reason = "error", "unexpected_error"
+    try:
+        outcome, reason = await process_join_request(update, context)
+    finally:
+        join_dedup.finish(update, keep=outcome in ("approved", "held"))
+    JOIN_REQUEST_SECONDS.labels(outcome=outcome).observe(time.perf_counter() - started)
+    JOIN_REQUESTS.labels(channel=str(update.chat_join_request.chat.id), outcome=outcome, reason=reason).inc()
+
+
+async def process_join_request(update: Update, context: CallbackContext):
+    """Approve or decline one join request; returns (outcome, reason) for metrics"""
     chat = update.chat_join_request.chat
     user = update.chat_join_request.from_user
     invite_link = update.chat_join_request.invite_link
@@ -302,169 +528,292 @@ async def handle_join_request(update: Update, context: CallbackContext) -> None:
     logger.info(f"🔗 Using invite link: {invite_link_url}")
 
     # Check if this channel is managed by our system
-    if chat.id not in active_channels:
+    with phase("registry_lookup"):
+        channel_info = channel_registry.get(chat.id)
+    if channel_info is None:
         logger.warning(f"Join request for unmanaged channel {chat.id}. Declining.")
         try:
-            await context.bot.decline_chat_join_request(chat_id=chat.id, user_id=user.id)
+            with phase("decline"):
+                await context.bot.decline_chat_join_request(chat_id=chat.id, user_id=user.id)
             # Notify user
             try:
-                await context.bot.send_message(
-                    user.id,
-                    f"❌ Sorry, {chat.title} is not configured for automatic access management."
-                )
+                with phase("dm"):
+                    await context.bot.send_message(
+                        user.id,
+                        f"❌ Sorry, {chat.title} is not configured for automatic access management."
+                    )
             except:
                 pass  # User might have blocked the bot
         except Exception as e:
             logger.error(f"Failed to decline join request for unmanaged channel: {e}")
-        return
+        return "declined", "unmanaged_channel"
 
     if not invite_link:
         logger.warning(f"Join request from {user.id} has no invite link. Declining.")
         try:
-            await context.bot.decline_chat_join_request(chat_id=chat.id, user_id=user.id)
+            with phase("decline"):
+                await context.bot.decline_chat_join_request(chat_id=chat.id, user_id=user.id)
         except Exception as e:
             logger.error(f"Failed to decline join request for {user.id}: {e}")
-        return
+        return "declined", "no_invite_link"
+
+    # Repeat clicks on a link the backend already rejected are declined locally:
+    # no backend validation and no second decline DM
+    cache_key = (invite_link.invite_link, user.id, chat.id)
+    with phase("verdict_cache"):
+        cached_reason = decline_cache.get(cache_key)
+    if cached_reason is not None or not join_throttle.allow(user.id, chat.id):
+        reason = cached_reason or "Too many join requests"
+        try:
+            with phase("decline"):
+                await context.bot.decline_chat_join_request(chat_id=chat.id, user_id=user.id)
+            logger.info(f"❌ Declined join request for {user.id} locally - reason: {reason}")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not decline repeat join request for {user.id}: {e}")
+        return "declined", "cached_decline" if cached_reason is not None else "throttled"
 
     # Validate with backend
     try:
-        channel_info = active_channels[chat.id]
-        validation_data = {
-            "invite_link": invite_link.invite_link,
-            "telegram_user_id": str(user.id),
-            "channel_id": str(chat.id),
-            "user_info": {
-                "first_name": user.first_name,
-                "last_name": user.last_name,
-                "username": user.username
-            },
-            "channel_info": {
-                "admin_id": channel_info.get("admin_id"),
-                "group_id": channel_info.get("group_id"),
-                "channel_name": channel_info.get("name")
-            }
-        }
+        validation_data = build_validation_payload(user, chat, invite_link, channel_info)
 
         logger.info(f"Validating join request with backend...")
         
-        response = requests.post(
-            f"{BACKEND_URL}/api/telegram/validate-join",
-            json=validation_data,
-            timeout=30
-        )
+        with phase("backend_validation"):
+            result = await get_validation_batcher().validate(validation_data)
 
-        if response.status_code == 200:
-            result = response.json()
-            
-            if result.get("approve", False):
-                # Approve the user
-                try:
+        if result.get("approve", False):
+            # Approve the user
+            try:
+                with phase("approve"):
                     await context.bot.approve_chat_join_request(chat_id=chat.id, user_id=user.id)
-                    logger.info(f"✅ Approved join request for {user.id} - validated by backend")
-                except Exception as approve_error:
-                    error_msg = str(approve_error)
-                    if "Hide_requester_missing" in error_msg:
-                        logger.warning(f"⚠️ Join request for {user.id} already processed or expired")
-                        return  # Exit early, don't try to revoke link
-                    else:
-                        logger.error(f"❌ Failed to approve join request for {user.id}: {approve_error}")
-                        return
-
-                # IMMEDIATELY REVOKE THE INVITE LINK (one-time use)
-                if invite_link_url:
-                    try:
-                        await context.bot.revoke_chat_invite_link(chat_id=chat.id, invite_link=invite_link_url)
-                        logger.info(f"🚫 Revoked invite link after successful join: {invite_link_url}")
-                        
-                        # Notify backend about link revocation and join time
-                        join_data = {
-                            "invite_link": invite_link_url,
-                            "telegram_user_id": str(user.id),
-                            "channel_id": str(chat.id),
-                            "joined_at": datetime.now(timezone.utc).isoformat(),
-                            "action": "joined_and_revoked"
-                        }
-                        
-                        # Send join notification to backend (don't wait for response)
-                        try:
-                            requests.post(
-                                f"{BACKEND_URL}/api/telegram/user-joined",
-                                json=join_data,
-                                timeout=5
-                            )
-                            logger.info(f"📡 Notified backend of user join and link revocation")
-                        except Exception as backend_error:
-                            logger.warning(f"⚠️ Could not notify backend of join: {backend_error}")
-                            
-                    except Exception as revoke_error:
-                        logger.error(f"❌ Failed to revoke invite link: {revoke_error}")
-
-                # Send welcome message
-                try:
-                    welcome_msg = (
-                        f"🎉 **Welcome to {chat.title}!**\n\n"
-                        "Your access has been approved and is now active.\n\n"
-                        "📋 **Important Notes:**\n"
-                        "• Your access is time-limited based on your plan\n"
-                        "• You'll receive notifications before expiry\n"
-                        "• Your timer starts from the moment you joined\n"
-                        "• Contact support for any issues\n\n"
-                        "Enjoy your premium content! 🚀"
-                    )
-                    await context.bot.send_message(
-                        user.id,
-                        welcome_msg,
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                except Exception as e:
-                    logger.warning(f"Could not send welcome message to {user.id}: {e}")
-                
-            else:
-                # Decline the user
-                try:
+                logger.info(f"✅ Approved join request for {user.id} - validated by backend")
+            except Exception as approve_error:
+                error_msg = str(approve_error)
+                if "Hide_requester_missing" in error_msg:
+                    logger.warning(f"⚠️ Join request for {user.id} already processed or expired")
+                    return "error", "already_processed"  # Exit early, don't try to revoke link
+                else:
+                    logger.error(f"❌ Failed to approve join request for {user.id}: {approve_error}")
+                    return "error", "telegram_error"
+
+            # Record the join before returning: a local SQLite commit the outbox
+            # delivers to the backend, so it survives a shutdown or backend outage
+            join_data = {
+                "invite_link": invite_link_url,
+                "telegram_user_id": str(user.id),
+                "channel_id": str(chat.id),
+                "joined_at": datetime.now(timezone.utc).isoformat(),
+                "action": "joined",
+            }
+            try:
+                with phase("notify"):
+                    await get_outbox().enqueue("user_joined", join_data)
+            except Exception as outbox_error:
+                logger.error(f"❌ Could not queue join notification for {user.id}: {outbox_error}")
+
+            # Revoke and welcome DM run in the background
+            with phase("post_approval"):
+                get_post_approval().submit(
+                    context.bot, chat, user, invite_link_url, welcome_msg=welcome_message(chat.title),
+                )
+
+            return "approved", "valid_link"
+
+        else:
+            decline_cache.put(cache_key, result.get('reason', 'Validation failed'))
+
+            # Decline the user
+            try:
+                with phase("decline"):
                     await context.bot.decline_chat_join_request(chat_id=chat.id, user_id=user.id)
-                    logger.info(f"❌ Declined join request for {user.id} - reason: {result.get('reason', 'Backend validation failed')}")
-                except Exception as decline_error:
-                    error_msg = str(decline_error)
-                    if "Hide_requester_missing" in error_msg:
-                        logger.warning(f"⚠️ Join request for {user.id} already processed or expired")
-                        return
-                    else:
-                        logger.error(f"❌ Failed to decline join request for {user.id}: {decline_error}")
-                        return
-                
-                # Send decline reason to user if available
-                try:
-                    decline_msg = (
-                        f"❌ **Access Denied to {chat.title}**\n\n"
-                        f"Reason: {result.get('reason', 'Validation failed')}\n\n"
-                        "Please contact support if you believe this is an error."
-                    )
+                logger.info(f"❌ Declined join request for {user.id} - reason: {result.get('reason', 'Backend validation failed')}")
+            except Exception as decline_error:
+                error_msg = str(decline_error)
+                if "Hide_requester_missing" in error_msg:
+                    logger.warning(f"⚠️ Join request for {user.id} already processed or expired")
+                    return "error", "already_processed"
+                else:
+                    logger.error(f"❌ Failed to decline join request for {user.id}: {decline_error}")
+                    return "error", "telegram_error"
+
+            # Send decline reason to user if available
+            try:
+                decline_msg = decline_message(chat.title, result.get('reason', 'Validation failed'))
+                with phase("dm"):
                     await context.bot.send_message(
                         user.id,
                         decline_msg,
                         parse_mode=ParseMode.MARKDOWN
                     )
-                except Exception as e:
-                    logger.warning(f"Could not send decline message to {user.id}: {e}")
-                
-        else:
-            logger.error(f"Backend validation failed with status {response.status_code}: {response.text}")
-            await context.bot.decline_chat_join_request(chat_id=chat.id, user_id=user.id)
-            
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Failed to connect to backend for validation: {e}")
+            except Exception as e:
+                logger.warning(f"Could not send decline message to {user.id}: {e}")
+
+            return "declined", "backend_declined"
+
+    except BackendError as e:
+        logger.error(f"Backend validation failed: {e}")
+        if e.outage and HOLD_ENABLED:
+            held = await hold_join_request(update, context)
+            if held is not None:
+                return held
         try:
-            await context.bot.decline_chat_join_request(chat_id=chat.id, user_id=user.id)
+            with phase("decline"):
+                await context.bot.decline_chat_join_request(chat_id=chat.id, user_id=user.id)
             logger.info(f"Declined join request for {user.id} due to backend connection error")
         except Exception as decline_error:
             logger.error(f"Failed to decline join request for {user.id}: {decline_error}")
+        return "declined", "backend_error"
     except Exception as e:
         logger.error(f"Unexpected error processing join request for {user.id}: {e}")
         try:
-            await context.bot.decline_chat_join_request(chat_id=chat.id, user_id=user.id)
+            with phase("decline"):
+                await context.bot.decline_chat_join_request(chat_id=chat.id, user_id=user.id)
         except Exception as decline_error:
             logger.error(f"Failed to decline join request for {user.id}: {decline_error}")
+        return "error", "unexpected_error"
+
+
+async def hold_join_request(update: Update, context: CallbackContext):
+    """Leave a join request pending in Telegram until the backend is back; None if it could not be held"""
+    chat = update.chat_join_request.chat
+    user = update.chat_join_request.from_user
+    try:
+        with phase("hold"):
+            inserted = await held_joins.hold(chat.id, user.id, update.to_dict())
+    except Exception as e:
+        logger.error(f"❌ Could not hold join request for {user.id}: {e}")
+        return None
+
+    if inserted:
+        logger.info(f"⏸️ Holding join request for {user.id} in {chat.id} until the backend recovers")
+        try:
+            with phase("dm"):
+                await context.bot.send_message(
+                    user.id,
+                    f"⏳ We are verifying your access to {chat.title}. "
+                    f"Your request stays pending and will be approved automatically shortly."
+                )
+        except Exception as e:
+            logger.warning(f"Could not send hold message to {user.id}: {e}")
+    return "held", "backend_unavailable"
+
+
+async def replay_held_join(application: Application, update_data) -> bool:
+    """Run a held join request through the join path again; True once it no longer needs holding"""
+    update = Update.de_json(update_data, application.bot)
+    if update.chat_join_request.chat.id not in channel_registry:
+        return False  # channels not synced yet (the backend may still be down); try again later
+    outcome, reason = await process_join_request(update, CallbackContext(application))
+    if outcome != "held":
+        # A declined replay must not hide a later request on the same link
+        join_dedup.finish(update, keep=outcome == "approved")
+    JOIN_REQUESTS.labels(channel=str(update.chat_join_request.chat.id), outcome=outcome, reason=f"replay_{reason}").inc()
+    if outcome != "held":
+        logger.info(f"▶️ Replayed held join request for {update.chat_join_request.from_user.id}: {outcome}")
+    return outcome != "held"
+
+
+# --- CONTROL API ---
+
+async def invalidate_decline_cache(request: web.Request) -> web.Response:
+    """POST /cache/invalidate - called by the backend when a payment completes"""
+    try:
+        data = await request.json()
+        user_id = int(data["telegram_user_id"])
+        channel_id = int(data["channel_id"]) if data.get("channel_id") else None
+    except (ValueError, KeyError, TypeError):
+        return web.json_response({"error": "telegram_user_id is required"}, status=400)
+
+    removed = decline_cache.invalidate(user_id, invite_link=data.get("invite_link"), channel_id=channel_id)
+    join_throttle.reset(user_id, channel_id)
+    logger.info(f"🧊 Invalidated {removed} cached decline(s) for {user_id}")
+    return web.json_response({"success": True, "removed": removed})
+
+
+async def decline_cache_stats(request: web.Request) -> web.Response:
+    """GET /cache/stats"""
+    return web.json_response({**decline_cache.stats(), "throttle": join_throttle.stats()})
+
+
+async def allocate_pool_link(request: web.Request) -> web.Response:
+    """POST /links/allocate - hand out an unused join-request link for a channel"""
+    try:
+        data = await request.json()
+        channel_id = int(data["channel_id"])
+    except (ValueError, KeyError, TypeError):
+        return web.json_response({"error": "channel_id is required"}, status=400)
+    if not LINK_POOL_ENABLED:
+        return web.json_response({"error": "link pool is disabled"}, status=503)
+
+    try:
+        invite_link, pooled = await link_pool.allocate(channel_id, str(data.get("allocated_to") or ""))
+    except TelegramError as e:
+        logger.error(f"❌ Could not create a link for {channel_id}: {e}")
+        return web.json_response({"error": str(e)}, status=502)
+    return web.json_response({"success": True, "invite_link": invite_link, "pooled": pooled})
+
+
+async def link_pool_stats(request: web.Request) -> web.Response:
+    """GET /links/stats"""
+    return web.json_response(link_pool.stats())
+
+
+# --- SHARD WORKER ---
+
+# The application receiving updates forwarded by bot_ingress.py (worker mode)
+forwarded = {"application": None}
+
+
+async def receive_forwarded_updates(request: web.Request) -> web.Response:
+    """POST /updates - a JSON list of raw updates for this worker's shard"""
+    application = forwarded["application"]
+    try:
+        updates = await request.json()
+    except ValueError:
+        return web.json_response({"error": "expected a JSON list of updates"}, status=400)
+    for data in updates:
+        await application.update_queue.put(Update.de_json(data, application.bot))
+    return web.json_response({"accepted": len(updates)})
+
+
+async def run_admin_command(request: web.Request) -> web.Response:
+    """POST /admin/command {command, args} - this shard's part of /status, /channels or /reload"""
+    try:
+        body = await request.json()
+        command, args = body["command"], body.get("args") or []
+    except (ValueError, KeyError, TypeError):
+        return web.json_response({"error": "command is required"}, status=400)
+    if command == "status":
+        return web.json_response({"text": await status_report(forwarded["application"])})
+    if command == "channels":
+        total, entries = channel_entries(args[0] if args else None)
+        return web.json_response({"total": total, "entries": entries})
+    if command == "reload":
+        old_count, new_count = await reload_channels()
+        return web.json_response({"before": old_count, "after": new_count})
+    return web.json_response({"error": f"unknown command '{command}'"}, status=400)
+
+
+def run_worker(application: Application) -> None:
+    """Same lifecycle as run_polling, minus the updater: start, wait for SIGINT/SIGTERM, shut down"""
+    async def serve():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        await application.initialize()
+        await application.post_init(application)
+        await application.start()
+        try:
+            await stop.wait()
+        finally:
+            await application.stop()
+            await application.post_stop(application)
+            await application.shutdown()
+            await application.post_shutdown(application)
+
+    asyncio.run(serve())
 
 
 # --- MAIN BOT SETUP ---
@@ -475,67 +824,154 @@ def main() -> None:
         logger.error("❌ Missing required environment variables (BOT_TOKEN, ADMIN_USER_IDS)")
         return
 
-    logger.info("🚀 Starting Enhanced Telegram Channel Management Bot...")
+    if BOT_MODE == "webhook" and (not WEBHOOK_URL or not WEBHOOK_SECRET_TOKEN):
+        logger.error("❌ Webhook mode requires WEBHOOK_URL and WEBHOOK_SECRET_TOKEN")
+        return
 
-    # Test backend connection
-    try:
-        response = requests.get(f"{BACKEND_URL}/api/payment/test-config", timeout=10)
-        if response.status_code == 200:
+    logger.info("🚀 Starting Enhanced Telegram Channel Management Bot...")
+    attach_slow_request_log()
+
+    control_server.add_route("POST", "/cache/invalidate", invalidate_decline_cache)
+    control_server.add_route("GET", "/cache/stats", decline_cache_stats)
+    control_server.add_route("POST", "/links/allocate", allocate_pool_link)
+    control_server.add_route("GET", "/links/stats", link_pool_stats)
+    control_server.add_route("GET", "/metrics", metrics_handler, public=True)
+    if BOT_MODE == "worker":
+        control_server.add_route("POST", "/updates", receive_forwarded_updates)
+        control_server.add_route("POST", "/admin/command", run_admin_command)
+
+    background_tasks = []
+
+    # Test backend connection and start the control API once the event loop is running
+    async def on_startup(application: Application) -> None:
+        await get_outbox().start()
+        await join_dedup.start()
+        if BOT_MODE == "worker":
+            # The ingress buffers our updates until /updates answers, so load the shard first
+            await load_active_channels(full=True)
+        await control_server.start()
+        if EXPIRY_ENGINE_ENABLED:
+            await expiry_engine.start(application.bot)
+        else:
+            logger.info("⏭️ Expiry engine off - the backend kicks expired members (EXPIRY_ENGINE=backend)")
+        if LINK_POOL_ENABLED:
+            await link_pool.start(application.bot)
+        if HOLD_ENABLED:
+            await held_joins.start(lambda update_data: replay_held_join(application, update_data))
+        background_tasks.append(asyncio.create_task(monitor_event_loop()))
+
+        # Gauges read from live objects at scrape time
+        CHANNEL_REGISTRY_SIZE.set_function(lambda: len(channel_registry))
+        gauge("bot_update_queue_depth", "Updates waiting for a worker", lambda: application.update_processor.queue_depth)
+        gauge("bot_updates_in_flight", "Updates being processed", lambda: application.update_processor.in_flight)
+        gauge("bot_telegram_queue_depth", "Bot API calls waiting in the outbound scheduler",
+              lambda: outbound_scheduler.stats()["queue_depth"])
+        gauge("bot_decline_cache_size", "Cached decline verdicts", lambda: len(decline_cache))
+        gauge("bot_expiry_scheduled", "Member kicks scheduled by the expiry engine", lambda: len(expiry_engine))
+        gauge("bot_dedup_window_size", "Keys in the join request dedup window", lambda: len(join_dedup))
+        gauge("bot_held_joins_waiting", "Join requests held until the backend recovers", lambda: len(held_joins))
+        gauge("bot_post_approval_running", "Post-approval side effects in progress", lambda: len(get_post_approval()))
+        gauge("bot_link_pool_free", "Pre-created invite links ready to hand out", lambda: link_pool.stats()["free"])
+
+        backend_status = await check_backend_health(max_age=0)
+        if backend_status.startswith("✅"):
             logger.info(f"✅ Backend connection successful: {BACKEND_URL}")
         else:
-            logger.warning(f"⚠️ Backend responded with status {response.status_code}")
-    except Exception as e:
-        logger.error(f"❌ Failed to connect to backend at {BACKEND_URL}: {e}")
-        logger.info("Bot will continue but may not function properly without backend connection")
+            logger.error(f"❌ Failed to connect to backend at {BACKEND_URL}: {backend_status}")
+            logger.info("Bot will continue but may not function properly without backend connection")
+
+    # Side effects still need the bot, which closes at shutdown
+    async def on_stop(application: Application) -> None:
+        await held_joins.stop()
+        await get_post_approval().drain()
+
+    async def on_shutdown(application: Application) -> None:
+        for task in background_tasks:
+            task.cancel()
+        await control_server.stop()
+        await expiry_engine.stop()
+        await link_pool.stop()
+        await join_dedup.stop()
+        await get_outbox().stop()
+        await close_backend()
 
     # Create the Application
-    application = Application.builder().token(BOT_TOKEN).build()
-    
-    # Load active channels from database on startup
-    import asyncio
-    
-    # Use a proper async initialization
-    async def initialize():
-        await load_active_channels()
-    
-    # Run initialization in a way that doesn't interfere with the main loop
-    # We'll load channels after starting the application
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(TELEGRAM_API_URL)
+        .concurrent_updates(KeyedUpdateProcessor())
+        .rate_limiter(outbound_scheduler)
+        .post_init(on_startup)
+        .post_stop(on_stop)
+        .post_shutdown(on_shutdown)
+    )
+    if BOT_MODE == "worker":
+        # Updates arrive from the ingress process; never poll Telegram ourselves
+        builder = builder.updater(None)
+    application = builder.build()
+    forwarded["application"] = application
 
     # Add command handlers
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("getlink", get_link_command))
-    application.add_handler(CommandHandler("reload", reload_channels_command))
-    application.add_handler(CommandHandler("channels", channels_command))
-    application.add_handler(CommandHandler("status", status_command))
+    application.add_handler(CommandHandler("start", timed_handler(start_command)))
+    application.add_handler(CommandHandler("getlink", timed_handler(get_link_command)))
+    application.add_handler(CommandHandler("reload", timed_handler(reload_channels_command)))
+    application.add_handler(CommandHandler("channels", timed_handler(channels_command)))
+    application.add_handler(CommandHandler("status", timed_handler(status_command)))
 
     # Add join request handler
-    application.add_handler(ChatJoinRequestHandler(handle_join_request))
+    application.add_handler(ChatJoinRequestHandler(timed_handler(handle_join_request)))
 
-    # Schedule periodic channel reload (every 5 minutes)
+    # Schedule periodic channel sync (delta, with a periodic full resync)
     from telegram.ext import JobQueue
     job_queue = application.job_queue
     
     async def periodic_reload(context: CallbackContext):
-        """Periodically reload channel configurations"""
-        logger.info("🔄 Periodic channel configuration reload...")
+        """Periodically sync channel configurations"""
         await load_active_channels()
     
     # Add startup job to load channels immediately  
     async def startup_load(context):
-        await load_active_channels()
-    job_queue.run_once(startup_load, when=1)
+        await load_active_channels(full=True)
+    if BOT_MODE != "worker":
+        job_queue.run_once(startup_load, when=1)
     
     # Add periodic job
-    job_queue.run_repeating(periodic_reload, interval=300, first=300)  # Every 5 minutes
+    job_queue.run_repeating(periodic_reload, interval=CHANNEL_SYNC_INTERVAL, first=CHANNEL_SYNC_INTERVAL)
+
+    # Keep the expiry schedule fed (first run is a full load)
+    async def sync_expiries(context: CallbackContext):
+        try:
+            await expiry_engine.sync()
+        except Exception as e:
+            logger.error(f"❌ Expiry sync failed: {e}")
+
+    if EXPIRY_ENGINE_ENABLED:
+        job_queue.run_repeating(sync_expiries, interval=EXPIRY_SYNC_INTERVAL, first=1)
 
     # Run the bot
     logger.info("✅ Enhanced bot is now running with multi-channel support!")
     logger.info(f"👥 Authorized admins: {ADMIN_USER_IDS}")
     logger.info(f"🔗 Backend URL: {BACKEND_URL}")
-    logger.info(f"📺 Active channels: {len(active_channels)}")
+    logger.info(f"📺 Active channels: {len(channel_registry)}")
     
     try:
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        if BOT_MODE == "worker":
+            logger.info(f"🧩 Worker for shard {BOT_SHARD_INDEX + 1}/{BOT_SHARDS}, updates via POST /updates")
+            run_worker(application)
+        elif BOT_MODE == "webhook":
+            # Telegram pushes updates to us; every request must carry the secret token
+            logger.info(f"🌐 Webhook listening on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+            application.run_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET_TOKEN,
+                allowed_updates=ALLOWED_UPDATES,
+            )
+        else:
+            application.run_polling(allowed_updates=ALLOWED_UPDATES)
     except KeyboardInterrupt:
         logger.info("🛑 Bot stopped by user")
     except Exception as e:
@@ -0,0 +1,27 @@
+# Admin Command Replies
+# Text of the /channels and /reload replies, shared by the bot and by
+# bot_ingress.py, which merges the parts each shard worker returns into one
+# reply.
+
+# --- CONFIGURATION ---
+CHANNELS_LIST_LIMIT = 50  # channels shown by /channels
+
+
+def channels_report(total, entries):
+    """/channels reply: `entries` are formatted channel lines, `total` counts all matching channels"""
+    if not total:
+        return "📭 No active channels configured."
+    message_parts = [f"📺 **Managed Channels ({total}):**\n", *entries[:CHANNELS_LIST_LIMIT]]
+    if total > CHANNELS_LIST_LIMIT:
+        message_parts.append(f"…and {total - CHANNELS_LIST_LIMIT} more")
+    return "\n".join(message_parts)
+
+
+def reload_report(old_count, new_count):
+    """/reload reply"""
+    return (
+        f"✅ **Channels reloaded!**\n\n"
+        f"📊 **Before:** {old_count} channels\n"
+        f"📊 **After:** {new_count} channels\n"
+        f"🔄 **Change:** {'+' if new_count > old_count else ''}{new_count - old_count}"
+    )
@@ -0,0 +1,266 @@
+# Async Backend Client
+# Shared, pooled HTTP client for every bot -> backend call.
+# Uses httpx (already a python-telegram-bot dependency) so that a slow
+# backend never blocks the asyncio event loop.
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+
+import httpx
+from dotenv import load_dotenv
+
+from circuit_breaker import STATE_VALUES, CircuitBreaker
+from metrics import BACKEND_BREAKER_STATE, BACKEND_BREAKER_TRANSITIONS, BACKEND_REQUEST_SECONDS
+
+# Load environment variables
+load_dotenv()
+
+# --- CONFIGURATION ---
+BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:4000")
+BACKEND_MAX_CONNECTIONS = int(os.getenv("BACKEND_MAX_CONNECTIONS", "100"))
+BACKEND_MAX_KEEPALIVE = int(os.getenv("BACKEND_MAX_KEEPALIVE", "20"))
+BACKEND_KEEPALIVE_EXPIRY = float(os.getenv("BACKEND_KEEPALIVE_EXPIRY", "30"))
+BOT_API_SECRET = os.getenv("BOT_API_SECRET", "")  # must match the backend's BOT_API_SECRET
+BOT_API_SECRET_HEADER = "X-Bot-Api-Secret"
+
+logger = logging.getLogger(__name__)
+
+
+class BackendError(Exception):
+    """Raised when the backend could not be reached after all retries"""
+
+    def __init__(self, message="", status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+    @property
+    def outage(self) -> bool:
+        """True if the backend is down or broken (no answer, or a 5xx), not rejecting this request"""
+        return self.status_code is None or self.status_code >= 500
+
+
+class BackendUnavailable(BackendError):
+    """Raised without a request being sent while the backend circuit is open"""
+
+
+@dataclass(frozen=True)
+class EndpointPolicy:
+    """Timeout and retry policy for one backend endpoint"""
+    timeout: float
+    retries: int = 0
+    backoff: float = 0.25
+    # Retrying after the request was sent is only safe for idempotent calls.
+    # Connection failures (request never left) are always retried.
+    retry_after_send: bool = False
+
+
+# validate-join and its batch variant mark the invite link as used, so they are
+# only retried when the request never reached the backend. Read-only endpoints
+# retry freely.
+POLICIES = {
+    "health": EndpointPolicy(timeout=10, retries=2, retry_after_send=True),
+    "test_config": EndpointPolicy(timeout=10, retries=2, retry_after_send=True),
+    "active_groups": EndpointPolicy(timeout=30, retries=2, retry_after_send=True),
+    "validate_join": EndpointPolicy(timeout=10, retries=2),
+    "validate_join_batch": EndpointPolicy(timeout=15, retries=2),
+    "user_joined": EndpointPolicy(timeout=5, retries=3, retry_after_send=True),
+    "user_joined_batch": EndpointPolicy(timeout=15, retries=1, retry_after_send=True),
+    "generate_test_link": EndpointPolicy(timeout=30, retries=1),
+    "store_test_link": EndpointPolicy(timeout=10, retries=1),
+    "generate_channel_link": EndpointPolicy(timeout=30, retries=1),
+    "expiry_stats": EndpointPolicy(timeout=10, retries=2, retry_after_send=True),
+    "kick_expired": EndpointPolicy(timeout=30),
+    "check_expiry": EndpointPolicy(timeout=10, retries=2, retry_after_send=True),
+    "notify_kick": EndpointPolicy(timeout=10, retries=3, retry_after_send=True),
+    "channel_members": EndpointPolicy(timeout=10, retries=2, retry_after_send=True),
+    "request_recovery": EndpointPolicy(timeout=10, retries=1),
+    "expiring_members": EndpointPolicy(timeout=30, retries=2, retry_after_send=True),
+    "members_kicked": EndpointPolicy(timeout=15, retries=1, retry_after_send=True),
+}
+
+# Gateway errors mean the backend (or its proxy) is restarting
+RETRY_STATUSES = {502, 503, 504}
+
+# Failures where the request never reached the backend
+_NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def _breaker_changed(old_state, new_state):
+    BACKEND_BREAKER_STATE.set(STATE_VALUES[new_state])
+    BACKEND_BREAKER_TRANSITIONS.labels(state=new_state).inc()
+
+
+# Shared by every backend call: a run of failures opens it and calls fail fast
+backend_breaker = CircuitBreaker("Backend", on_change=_breaker_changed)
+
+
+class BackendClient:
+    """Keep-alive connection pool plus one coroutine per backend endpoint"""
+
+    def __init__(self, base_url=BACKEND_URL, policies=None, transport=None, breaker=backend_breaker):
+        self.base_url = base_url
+        self.policies = {**POLICIES, **(policies or {})}
+        self.breaker = breaker
+        self._transport = transport
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=httpx.Limits(
+                    max_connections=BACKEND_MAX_CONNECTIONS,
+                    max_keepalive_connections=BACKEND_MAX_KEEPALIVE,
+                    keepalive_expiry=BACKEND_KEEPALIVE_EXPIRY,
+                ),
+                headers={BOT_API_SECRET_HEADER: BOT_API_SECRET} if BOT_API_SECRET else None,
+                transport=self._transport,
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def request(self, endpoint, method, path, **kwargs) -> httpx.Response:
+        """Send a request using the timeout/retry policy of `endpoint`"""
+        if not self.breaker.allow():
+            BACKEND_REQUEST_SECONDS.labels(endpoint=endpoint, status="circuit_open").observe(0)
+            raise BackendUnavailable(f"{method} {path} skipped: backend circuit is open")
+
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = await self._send(endpoint, method, path, **kwargs)
+        except BackendError:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.abandon()
+            raise
+        else:
+            status = str(response.status_code)
+            if response.status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            return response
+        finally:
+            BACKEND_REQUEST_SECONDS.labels(endpoint=endpoint, status=status).observe(time.perf_counter() - started)
+
+    async def _send(self, endpoint, method, path, **kwargs) -> httpx.Response:
+        policy = self.policies[endpoint]
+        attempt = 0
+        while True:
+            try:
+                response = await self.client.request(method, path, timeout=policy.timeout, **kwargs)
+            except _NOT_SENT_ERRORS as e:
+                error = e
+            except httpx.HTTPError as e:
+                if not policy.retry_after_send:
+                    raise BackendError(f"{method} {path} failed: {e!r}") from e
+                error = e
+            else:
+                if response.status_code not in RETRY_STATUSES or not policy.retry_after_send:
+                    return response
+                if attempt >= policy.retries:
+                    return response
+                error = None
+
+            if attempt >= policy.retries:
+                raise BackendError(f"{method} {path} failed after {attempt + 1} attempt(s): {error!r}") from error
+
+            attempt += 1
+            delay = policy.backoff * (2 ** (attempt - 1))
+            logger.debug(f"Retrying {method} {path} in {delay:.2f}s (attempt {attempt + 1})")
+            await asyncio.sleep(delay)
+
+    # --- ENDPOINTS ---
+
+    async def health(self):
+        return await self.request("health", "GET", "/health")
+
+    async def test_config(self):
+        return await self.request("test_config", "GET", "/api/payment/test-config")
+
+    async def active_groups(self, params=None, headers=None):
+        return await self.request("active_groups", "GET", "/api/groups/active", params=params, headers=headers)
+
+    async def validate_join(self, payload):
+        return await self.request("validate_join", "POST", "/api/telegram/validate-join", json=payload)
+
+    async def validate_join_batch(self, payload):
+        return await self.request("validate_join_batch", "POST", "/api/telegram/validate-join/batch", json=payload)
+
+    async def user_joined(self, payload):
+        return await self.request("user_joined", "POST", "/api/telegram/user-joined", json=payload)
+
+    async def user_joined_batch(self, payload):
+        return await self.request("user_joined_batch", "POST", "/api/telegram/user-joined/batch", json=payload)
+
+    async def generate_test_link(self, payload):
+        return await self.request("generate_test_link", "POST", "/api/invite/generate-test-link", json=payload)
+
+    async def store_test_link(self, payload):
+        return await self.request("store_test_link", "POST", "/api/telegram/store-test-link", json=payload)
+
+    async def generate_channel_link(self, group_id, channel_db_id):
+        return await self.request(
+            "generate_channel_link", "POST",
+            f"/api/groups/{group_id}/channels/{channel_db_id}/generate-link",
+        )
+
+    async def expiry_stats(self):
+        return await self.request("expiry_stats", "GET", "/api/admin/expiry-stats")
+
+    async def kick_expired(self):
+        return await self.request("kick_expired", "POST", "/api/admin/kick-expired")
+
+    async def check_expiry(self, telegram_user_id):
+        return await self.request("check_expiry", "GET", f"/api/telegram/check-expiry/{telegram_user_id}")
+
+    async def notify_kick(self, payload):
+        return await self.request("notify_kick", "POST", "/api/telegram/notify-kick", json=payload)
+
+    async def channel_members(self):
+        return await self.request("channel_members", "GET", "/api/channel-members")
+
+    async def request_recovery(self, payload):
+        return await self.request("request_recovery", "POST", "/api/telegram/request-recovery", json=payload)
+
+    async def expiring_members(self, params):
+        return await self.request("expiring_members", "GET", "/api/telegram/expiring", params=params)
+
+    async def members_kicked(self, payload):
+        return await self.request("members_kicked", "POST", "/api/telegram/members/kicked", json=payload)
+
+
+# --- SHARED INSTANCE ---
+# Long-running bots share one pool; scripts can use `async with BackendClient()`.
+_backend = None
+
+
+def get_backend() -> BackendClient:
+    global _backend
+    if _backend is None:
+        _backend = BackendClient()
+    return _backend
+
+
+async def close_backend(*_args) -> None:
+    """Close the shared pool (usable directly as an Application post_shutdown hook)"""
+    global _backend
+    if _backend is not None:
+        await _backend.close()
+        _backend = None
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+# Hot Path Microbenchmarks
+# Times the per-request code paths of TG_Automation_Enhanced.py in-process:
+# channel registry lookups and reloads (10k/100k channels), validation
+# payloads, welcome/decline messages, parse_duration and the join request
+# decision logic with Telegram and the backend replaced by no-op fakes.
+#
+#   python bench.py                      # run and print results
+#   python bench.py --save               # record bench_baseline.json
+#   python bench.py --compare            # fail if anything is >15% slower than the baseline
+#   python bench.py --compare --threshold 0.25 --filter registry
+#
+# Each benchmark reports the best of several repeats (ns per operation),
+# which is the least noisy number to compare between runs on one machine.
+# Baselines are machine-specific - record one before changing code.
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+from telegram import Chat, ChatInviteLink, ChatJoinRequest, Update, User
+
+import TG_Automation_Enhanced as bot
+import post_approval
+from channel_registry import ChannelRecord, ChannelRegistry
+from update_dedup import FRESH, JoinDeduplicator
+from verdict_cache import DeclineCache, JoinThrottle
+
+# --- CONFIGURATION ---
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+DEFAULT_THRESHOLD = 0.15  # fraction slower than the baseline that counts as a regression
+DEFAULT_REPEATS = 5
+TARGET_SECONDS = 0.2  # per repeat, for benchmarks whose loop count is calibrated
+JOIN_POOL_SIZE = 2000  # distinct users per join-decision repeat
+
+FIRST_CHANNEL_ID = -1001000000000
+BOT_USER = User(id=123456, is_bot=True, first_name="Bench Bot", username="bench_bot")
+
+
+# --- FIXTURES ---
+
+def channel_payloads(count):
+    """/api/groups/active entries for `count` channels spread over bundles of 10"""
+    return [
+        {
+            "channel_id": str(FIRST_CHANNEL_ID - index),
+            "admin_id": f"admin-{index % 50}",
+            "name": f"Bundle {index // 10}",
+            "group_id": f"group-{index // 10}",
+            "chat_title": f"Channel {index}",
+            "channel_db_id": f"channel-{index}",
+            "join_link": f"https://t.me/+bench{index}",
+        }
+        for index in range(count)
+    ]
+
+
+def build_registry(count):
+    return ChannelRegistry(ChannelRecord.from_payload(payload) for payload in channel_payloads(count))
+
+
+def join_update(user_id, channel_id, update_id=1):
+    user = User(id=user_id, is_bot=False, first_name="Bench", last_name="User", username=f"user{user_id}")
+    chat = Chat(id=channel_id, type=Chat.CHANNEL, title=f"Channel {channel_id}")
+    invite_link = ChatInviteLink(
+        invite_link=f"https://t.me/+bench{user_id}", creator=BOT_USER,
+        creates_join_request=True, is_primary=False, is_revoked=False,
+    )
+    request = ChatJoinRequest(
+        chat=chat, from_user=user, date=datetime.now(timezone.utc),
+        user_chat_id=user_id, invite_link=invite_link,
+    )
+    return Update(update_id=update_id, chat_join_request=request)
+
+
+class FakeBot:
+    """context.bot with every Bot API call answered instantly"""
+
+    async def approve_chat_join_request(self, chat_id, user_id):
+        return True
+
+    async def decline_chat_join_request(self, chat_id, user_id):
+        return True
+
+    async def revoke_chat_invite_link(self, chat_id, invite_link):
+        return None
+
+    async def send_message(self, chat_id, text, **kwargs):
+        return None
+
+
+class FakeContext:
+    bot = FakeBot()
+
+
+class FakeBatcher:
+    def __init__(self, verdict):
+        self.verdict = verdict
+
+    async def validate(self, payload):
+        return self.verdict
+
+
+class FakeOutbox:
+    async def enqueue(self, kind, payload):
+        return None
+
+
+# --- BENCHMARKS ---
+# Each factory returns (run, ops): run(loops) performs `loops * ops` operations.
+
+def bench_registry_get(count, hit=True):
+    registry = build_registry(count)
+    step = max(1, count // 1000)
+    ids = [FIRST_CHANNEL_ID - index for index in range(0, count, step)][:1000]
+    if not hit:
+        ids = [channel_id - count for channel_id in ids]
+    get = registry.get
+
+    def run(loops):
+        for _ in range(loops):
+            for channel_id in ids:
+                get(channel_id)
+    return run, len(ids)
+
+
+def bench_registry_reload(count):
+    payloads = channel_payloads(count)
+    registry = ChannelRegistry()
+
+    def run(loops):
+        for _ in range(loops):
+            records = [ChannelRecord.from_payload(payload) for payload in payloads]
+            registry.replace(records)
+    return run, 1
+
+
+def bench_registry_delta(count, changed=100):
+    registry = build_registry(count)
+    upserts = [ChannelRecord.from_payload(payload) for payload in channel_payloads(changed)]
+    for record in upserts:
+        record.chat_title += " (renamed)"
+
+    def run(loops):
+        for _ in range(loops):
+            registry.apply_delta(upserts, ())
+    return run, 1
+
+
+def bench_validation_payload():
+    request = join_update(42, FIRST_CHANNEL_ID).chat_join_request
+    channel_info = build_registry(1).get(FIRST_CHANNEL_ID)
+    build = bot.build_validation_payload
+
+    def run(loops):
+        for _ in range(loops):
+            build(request.from_user, request.chat, request.invite_link, channel_info)
+    return run, 1
+
+
+def bench_welcome_message():
+    render = bot.welcome_message
+
+    def run(loops):
+        for _ in range(loops):
+            render("Premium Signals 📈")
+    return run, 1
+
+
+def bench_decline_message():
+    render = bot.decline_message
+
+    def run(loops):
+        for _ in range(loops):
+            render("Premium Signals 📈", "Invite link has expired")
+    return run, 1
+
+
+def bench_parse_duration():
+    inputs = ["30m", "2h", "7d", "45", "bogus"]
+    parse = bot.parse_duration
+
+    def run(loops):
+        for _ in range(loops):
+            for value in inputs:
+                parse(value)
+    return run, len(inputs)
+
+
+def bench_dedup_check(duplicate):
+    """JoinDeduplicator.begin/finish with a full 100k-key window (memory tier only)"""
+    dedup = JoinDeduplicator(max_entries=100_000, persist_path="")
+    for index in range(100_000):
+        dedup.window.add(f"u:{-index}")
+    updates = [join_update(1_000_000 + index, FIRST_CHANNEL_ID, index) for index in range(JOIN_POOL_SIZE)]
+
+    def run(loops):
+        for _ in range(loops):
+            for update in updates:
+                if dedup.begin(update) == FRESH or not duplicate:
+                    dedup.finish(update, keep=duplicate)
+                    if not duplicate:
+                        dedup.window.discard(f"u:{update.update_id}")
+    return run, len(updates)
+
+
+def bench_join_decision(path):
+    """process_join_request end to end with Telegram, backend and outbox faked out (side effects included)"""
+    channel_count = 10000
+    registry = build_registry(channel_count)
+    managed = FIRST_CHANNEL_ID
+    unmanaged = FIRST_CHANNEL_ID - channel_count
+    updates = [
+        join_update(1_000_000 + index, unmanaged if path == "unmanaged" else managed, index)
+        for index in range(JOIN_POOL_SIZE)
+    ]
+    batcher = FakeBatcher({"approve": path != "declined", "reason": "Invite link has expired"})
+    outbox = FakeOutbox()
+    context = FakeContext()
+
+    # process_join_request reads these module globals at call time
+    bot.channel_registry = registry
+    bot.get_validation_batcher = lambda: batcher
+    bot.get_outbox = lambda: outbox
+
+    def run(loops):
+        async def main():
+            post_approval._pipeline = None  # its semaphore belongs to one event loop
+            for _ in range(loops):
+                # Fresh verdict cache and throttle so every pass takes the same path
+                bot.decline_cache = DeclineCache()
+                bot.join_throttle = JoinThrottle()
+                if path == "cached":
+                    for update in updates:
+                        request = update.chat_join_request
+                        bot.decline_cache.put((request.invite_link.invite_link, request.from_user.id, managed), "cached")
+                for update in updates:
+                    await bot.process_join_request(update, context)
+                await bot.get_post_approval().drain()
+        asyncio.run(main())
+    return run, len(updates)
+
+
+BENCHMARKS = {
+    "registry_get_hit_10k": lambda: bench_registry_get(10_000),
+    "registry_get_hit_100k": lambda: bench_registry_get(100_000),
+    "registry_get_miss_100k": lambda: bench_registry_get(100_000, hit=False),
+    "registry_reload_10k": lambda: bench_registry_reload(10_000),
+    "registry_reload_100k": lambda: bench_registry_reload(100_000),
+    "registry_delta_100k": lambda: bench_registry_delta(100_000),
+    "validation_payload": bench_validation_payload,
+    "welcome_message": bench_welcome_message,
+    "decline_message": bench_decline_message,
+    "parse_duration": bench_parse_duration,
+    "dedup_check_fresh": lambda: bench_dedup_check(duplicate=False),
+    "dedup_check_duplicate": lambda: bench_dedup_check(duplicate=True),
+    "join_decision_approved": lambda: bench_join_decision("approved"),
+    "join_decision_declined": lambda: bench_join_decision("declined"),
+    "join_decision_cached": lambda: bench_join_decision("cached"),
+    "join_decision_unmanaged": lambda: bench_join_decision("unmanaged"),
+}
+
+
+# --- RUNNER ---
+
+def calibrate(run, ops):
+    """Loops per repeat so one repeat takes about TARGET_SECONDS"""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        run(loops)
+        elapsed = time.perf_counter() - started
+        if elapsed >= TARGET_SECONDS / 10 or loops >= 1_000_000:
+            return max(1, int(loops * TARGET_SECONDS / max(elapsed, 1e-9)))
+        loops *= 10
+
+
+def measure(name, repeats):
+    run, ops = BENCHMARKS[name]()
+    loops = calibrate(run, ops)
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        run(loops)
+        samples.append((time.perf_counter() - started) / (loops * ops) * 1e9)
+    return {
+        "best_ns": round(min(samples), 1),
+        "median_ns": round(statistics.median(samples), 1),
+        "ops": loops * ops,
+    }
+
+
+def format_ns(ns):
+    if ns >= 1e6:
+        return f"{ns / 1e6:.2f} ms"
+    if ns >= 1e3:
+        return f"{ns / 1e3:.2f} µs"
+    return f"{ns:.0f} ns"
+
+
+def compare(results, baseline, threshold):
+    """Print the change against the baseline; returns the names that regressed"""
+    regressions = []
+    print(f"\n📊 COMPARED WITH BASELINE ({baseline.get('recorded_at', 'unknown date')}, threshold {threshold:.0%})")
+    print("=" * 72)
+    for name, result in results.items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            print(f"   🆕 {name:<28} {format_ns(result['best_ns']):>12}   (not in baseline)")
+            continue
+        change = result["best_ns"] / previous["best_ns"] - 1
+        if change > threshold:
+            regressions.append(name)
+            icon = "❌"
+        elif change < -threshold:
+            icon = "🚀"
+        else:
+            icon = "✅"
+        print(f"   {icon} {name:<28} {format_ns(previous['best_ns']):>12} → {format_ns(result['best_ns']):>12}  "
+              f"{change:+.1%}")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the bot's per-request hot paths")
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="compare with the baseline and fail on regressions")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown before --compare fails (0.15 = 15%%)")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="timed repeats per benchmark")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # The decision benchmarks measure the logic, not log formatting and I/O
+    logging.disable(logging.WARNING)
+
+    names = [name for name in BENCHMARKS if args.filter in name]
+    if not names:
+        print(f"❌ No benchmark matches '{args.filter}'")
+        sys.exit(2)
+
+    print("⏱️ BOT HOT PATH BENCHMARKS")
+    print("=" * 72)
+    print(f"   🐍 Python {platform.python_version()} on {platform.machine()}, best of {args.repeats}")
+    results = {}
+    for name in names:
+        results[name] = measure(name, args.repeats)
+        print(f"   {name:<30} {format_ns(results[name]['best_ns']):>12} per op "
+              f"(median {format_ns(results[name]['median_ns'])})")
+
+    exit_code = 0
+    if args.compare:
+        try:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            print(f"\n❌ No baseline at {args.baseline} - run with --save first")
+            sys.exit(2)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} benchmark(s) regressed: {', '.join(regressions)}")
+            exit_code = 1
+        else:
+            print("\n✅ No regressions")
+
+    if args.save:
+        baseline = {
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": results,
+        }
+        # Keep entries for benchmarks that were filtered out of this run
+        if args.filter and os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline["results"] = {**json.load(f).get("results", {}), **results}
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\n💾 Baseline written to {args.baseline}")
+
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+# Sharded Bot Ingress
+# The only process that receives updates from Telegram when the bot runs on
+# several cores. It starts BOT_SHARDS copies of TG_Automation_Enhanced.py in
+# worker mode, forwards each update to the worker that owns its chat (see
+# sharding.py) and restarts workers that die.
+#
+#   BOT_SHARDS=4 python bot_ingress.py
+#
+# Worker i serves its control API on BOT_CONTROL_PORT + 1 + i and keeps its
+# outbox in its own SQLite file; the ingress control API on BOT_CONTROL_PORT
+# fans /cache/invalidate out to every worker, sends /links/allocate to the
+# worker owning the channel and reports shard health on GET /shards.
+#
+# All workers share one bot token, so each gets 1/BOT_SHARDS of the Telegram
+# rate budget. Admin /status, /channels and /reload would otherwise reach only
+# the shard owning the admin's private chat; the ingress asks every worker and
+# sends one merged reply.
+
+import asyncio
+import logging
+import os
+import signal
+import sys
+import time
+from collections import deque
+
+import httpx
+from aiohttp import web
+from dotenv import load_dotenv
+from telegram import Bot, Update
+from telegram.constants import MessageLimit, ParseMode
+from telegram.error import TelegramError
+
+load_dotenv()
+
+from admin_reports import channels_report, reload_report
+from control_server import BOT_CONTROL_PORT, BOT_CONTROL_TOKEN, TOKEN_HEADER, ControlServer
+from sharding import BOT_SHARDS, HashRing, update_chat_id
+from telegram_scheduler import (
+    TELEGRAM_ACTION_BURST, TELEGRAM_ACTION_RATE, TELEGRAM_GLOBAL_BURST, TELEGRAM_GLOBAL_RATE,
+)
+
+# --- CONFIGURATION ---
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN")
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "bot_outbox.db")
+SLOW_REQUEST_LOG = os.getenv("SLOW_REQUEST_LOG", "slow_requests.log")
+LINK_POOL_PATH = os.getenv("LINK_POOL_PATH", "bot_links.db")
+HOLD_QUEUE_PATH = os.getenv("HOLD_QUEUE_PATH", "bot_held_joins.db")
+DEDUP_PERSIST_PATH = os.getenv("DEDUP_PERSIST_PATH", "bot_dedup.db")
+ADMIN_USER_IDS = {int(admin_id) for admin_id in os.getenv("ADMIN_USER_IDS", "").split(",") if admin_id.strip()}
+
+BOT_SHARD_QUEUE_MAX = int(os.getenv("BOT_SHARD_QUEUE_MAX", "10000"))  # updates buffered per worker
+BOT_SHARD_FORWARD_BATCH = int(os.getenv("BOT_SHARD_FORWARD_BATCH", "100"))
+BOT_SHARD_RESTART_DELAY = float(os.getenv("BOT_SHARD_RESTART_DELAY", "1"))  # seconds, doubles per crash
+BOT_SHARD_RESTART_MAX_DELAY = float(os.getenv("BOT_SHARD_RESTART_MAX_DELAY", "30"))
+BOT_SHARD_STABLE_AFTER = float(os.getenv("BOT_SHARD_STABLE_AFTER", "60"))  # uptime that resets the backoff
+BOT_SHARD_STOP_TIMEOUT = float(os.getenv("BOT_SHARD_STOP_TIMEOUT", "20"))
+BOT_SHARD_COMMAND_TIMEOUT = float(os.getenv("BOT_SHARD_COMMAND_TIMEOUT", "60"))  # seconds per shard for /reload etc.
+
+# Admin commands answered for all shards at once (see Ingress.fan_out_command)
+FAN_OUT_COMMANDS = {"status", "channels", "reload"}
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "TG_Automation_Enhanced.py")
+
+# Same update types the bot handles
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CHAT_JOIN_REQUEST]
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger("bot_ingress")
+
+
+def shard_path(path, index):
+    """bot_outbox.db -> bot_outbox.shard2.db"""
+    if not path:
+        return path
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.shard{index}{ext}"
+
+
+def shard_budget(total, shards, minimum):
+    """One worker's share of a rate or burst the shards split between them"""
+    return max(minimum, total / shards)
+
+
+def admin_command(update):
+    """(command, args, chat_id) for an admin's /status, /channels or /reload; None for anything else"""
+    message = update.get("message") or {}
+    words = (message.get("text") or "").split()
+    if not words or not words[0].startswith("/"):
+        return None
+    command = words[0][1:].split("@")[0].lower()
+    if command not in FAN_OUT_COMMANDS or (message.get("from") or {}).get("id") not in ADMIN_USER_IDS:
+        return None
+    return command, words[1:], message["chat"]["id"]
+
+
+class ShardWorker:
+    """One worker process: its forward buffer, the forwarding loop and its supervisor"""
+
+    def __init__(self, index, client):
+        self.index = index
+        self.client = client
+        self.control_port = BOT_CONTROL_PORT + 1 + index
+        self.url = f"http://127.0.0.1:{self.control_port}"
+        self.buffer = deque()
+        self._ready = asyncio.Event()
+        self._stopping = False
+        self.process = None
+        self.started_at = None
+        self.restarts = 0
+        self.forwarded = 0
+        self.dropped = 0
+        self._tasks = []
+
+    def env(self):
+        env = dict(
+            os.environ,
+            BOT_MODE="worker",
+            BOT_SHARDS=str(BOT_SHARDS),
+            BOT_SHARD_INDEX=str(self.index),
+            BOT_CONTROL_PORT=str(self.control_port),
+            OUTBOX_PATH=shard_path(OUTBOX_PATH, self.index),
+            LINK_POOL_PATH=shard_path(LINK_POOL_PATH, self.index),
+            HOLD_QUEUE_PATH=shard_path(HOLD_QUEUE_PATH, self.index),
+            DEDUP_PERSIST_PATH=shard_path(DEDUP_PERSIST_PATH, self.index),
+            # One bot token: the shards split its Telegram budget instead of each using all of it
+            TELEGRAM_GLOBAL_RATE=str(shard_budget(TELEGRAM_GLOBAL_RATE, BOT_SHARDS, 0.1)),
+            TELEGRAM_GLOBAL_BURST=str(int(shard_budget(TELEGRAM_GLOBAL_BURST, BOT_SHARDS, 1))),
+            TELEGRAM_ACTION_RATE=str(shard_budget(TELEGRAM_ACTION_RATE, BOT_SHARDS, 0.1)),
+            TELEGRAM_ACTION_BURST=str(int(shard_budget(TELEGRAM_ACTION_BURST, BOT_SHARDS, 1))),
+        )
+        if SLOW_REQUEST_LOG:
+            env["SLOW_REQUEST_LOG"] = shard_path(SLOW_REQUEST_LOG, self.index)
+        return env
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._supervise()), asyncio.create_task(self._forward())]
+
+    def submit(self, update):
+        if len(self.buffer) >= BOT_SHARD_QUEUE_MAX:
+            self.buffer.popleft()
+            self.dropped += 1
+            logger.warning(f"⚠️ Shard {self.index} buffer full, dropped its oldest update")
+        self.buffer.append(update)
+        self._ready.set()
+
+    async def _supervise(self):
+        delay = BOT_SHARD_RESTART_DELAY
+        while not self._stopping:
+            self.process = await asyncio.create_subprocess_exec(
+                sys.executable, WORKER_SCRIPT, env=self.env(), cwd=os.path.dirname(WORKER_SCRIPT),
+            )
+            self.started_at = time.monotonic()
+            logger.info(f"🧩 Shard {self.index} worker started (pid {self.process.pid}, control port {self.control_port})")
+            code = await self.process.wait()
+            if self._stopping:
+                return
+
+            uptime = time.monotonic() - self.started_at
+            if uptime >= BOT_SHARD_STABLE_AFTER:
+                delay = BOT_SHARD_RESTART_DELAY
+            self.restarts += 1
+            logger.error(f"💥 Shard {self.index} worker exited with code {code} after {uptime:.0f}s, "
+                         f"restarting in {delay:.0f}s ({len(self.buffer)} updates buffered)")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, BOT_SHARD_RESTART_MAX_DELAY)
+
+    async def _forward(self):
+        """Send buffered updates in order; while the worker is down they wait in the buffer"""
+        headers = {TOKEN_HEADER: BOT_CONTROL_TOKEN} if BOT_CONTROL_TOKEN else {}
+        while True:
+            if not self.buffer:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            batch = [self.buffer[i] for i in range(min(len(self.buffer), BOT_SHARD_FORWARD_BATCH))]
+            try:
+                response = await self.client.post(f"{self.url}/updates", json=batch, headers=headers)
+                response.raise_for_status()
+            except httpx.HTTPError:
+                # Worker starting up or restarting; keep the batch and try again
+                await asyncio.sleep(0.5)
+                continue
+            for _ in batch:
+                self.buffer.popleft()
+            self.forwarded += len(batch)
+
+    async def drain(self, timeout):
+        deadline = time.monotonic() + timeout
+        while self.buffer and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+    async def stop(self):
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.process is not None and self.process.returncode is None:
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                await asyncio.wait_for(self.process.wait(), BOT_SHARD_STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ Shard {self.index} worker did not stop in time, killing it")
+                self.process.kill()
+                await self.process.wait()
+
+    def stats(self):
+        alive = self.process is not None and self.process.returncode is None
+        return {
+            "shard": self.index,
+            "pid": self.process.pid if alive else None,
+            "alive": alive,
+            "uptime": round(time.monotonic() - self.started_at) if alive else 0,
+            "restarts": self.restarts,
+            "buffered": len(self.buffer),
+            "forwarded": self.forwarded,
+            "dropped": self.dropped,
+        }
+
+
+class Ingress:
+    """Receives updates from Telegram and routes them to shard workers"""
+
+    def __init__(self, shards=BOT_SHARDS):
+        self.ring = HashRing(shards)
+        self.bot = Bot(BOT_TOKEN, base_url=TELEGRAM_API_URL)
+        self.client = httpx.AsyncClient(timeout=httpx.Timeout(10.0, connect=2.0))
+        self.workers = [ShardWorker(index, self.client) for index in range(shards)]
+        self.control_server = ControlServer()
+        self.control_server.add_route("GET", "/shards", self.shards_handler)
+        self.control_server.add_route("POST", "/cache/invalidate", self.invalidate_handler)
+        self.control_server.add_route("POST", "/links/allocate", self.allocate_link_handler)
+        self.received = 0
+        self._commands = set()  # running fan_out_command tasks
+
+    def route(self, update):
+        command = admin_command(update)
+        if command is not None:
+            task = asyncio.create_task(self.fan_out_command(*command))
+            self._commands.add(task)
+            task.add_done_callback(self._commands.discard)
+            self.received += 1
+            return
+        chat_id = update_chat_id(update)
+        shard = self.ring.shard_for(chat_id) if chat_id is not None else 0
+        self.workers[shard].submit(update)
+        self.received += 1
+
+    # --- UPDATE SOURCES ---
+
+    async def poll(self):
+        await self.bot.delete_webhook()
+        offset = None
+        while True:
+            try:
+                updates = await self.bot.get_updates(
+                    offset=offset, timeout=30, allowed_updates=ALLOWED_UPDATES,
+                    read_timeout=40,
+                )
+            except TelegramError as e:
+                logger.warning(f"⚠️ getUpdates failed, retrying: {e}")
+                await asyncio.sleep(2)
+                continue
+            for update in updates:
+                self.route(update.to_dict())
+                offset = update.update_id + 1
+
+    async def webhook_handler(self, request):
+        if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET_TOKEN:
+            return web.Response(status=403)
+        self.route(await request.json())
+        return web.Response()
+
+    async def serve_webhook(self):
+        app = web.Application()
+        app.router.add_post(f"/{WEBHOOK_PATH}", self.webhook_handler)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, WEBHOOK_LISTEN, WEBHOOK_PORT).start()
+        await self.bot.set_webhook(
+            url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET_TOKEN,
+            allowed_updates=ALLOWED_UPDATES,
+        )
+        logger.info(f"🌐 Webhook listening on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+    # --- ADMIN COMMANDS ---
+
+    async def fan_out_command(self, command, args, chat_id):
+        """Run an admin command on every worker and send one merged reply"""
+        try:
+            if command == "reload":
+                await self.bot.send_message(chat_id, f"🔄 Reloading channel configurations on {len(self.workers)} shard(s)...")
+            headers = {TOKEN_HEADER: BOT_CONTROL_TOKEN} if BOT_CONTROL_TOKEN else {}
+            results = await asyncio.gather(
+                *(self.client.post(f"{w.url}/admin/command", json={"command": command, "args": args},
+                                   headers=headers, timeout=BOT_SHARD_COMMAND_TIMEOUT) for w in self.workers),
+                return_exceptions=True,
+            )
+            replies, failed = [], []
+            for worker, result in zip(self.workers, results):
+                if isinstance(result, Exception) or result.status_code != 200:
+                    failed.append(str(worker.index))
+                else:
+                    replies.append((worker.index, result.json()))
+
+            if command == "status":
+                parts = [f"🧩 **Shard {index + 1}/{len(self.workers)}**\n{reply['text']}" for index, reply in replies]
+            elif command == "channels":
+                total = sum(reply["total"] for _, reply in replies)
+                entries = [entry for _, reply in replies for entry in reply["entries"]]
+                parts = [channels_report(total, entries)]
+            else:
+                parts = [reload_report(sum(reply["before"] for _, reply in replies),
+                                       sum(reply["after"] for _, reply in replies))]
+            if failed:
+                parts.append(f"⚠️ No answer from shard(s) {', '.join(failed)}")
+
+            for text in self._pack(parts):
+                await self.bot.send_message(chat_id, text, parse_mode=ParseMode.MARKDOWN)
+        except Exception as e:
+            logger.error(f"❌ /{command} for {chat_id} failed: {e}")
+
+    @staticmethod
+    def _pack(parts, limit=MessageLimit.MAX_TEXT_LENGTH):
+        """Join reply parts into as few messages as fit Telegram's length limit"""
+        messages = []
+        for part in parts:
+            if messages and len(messages[-1]) + 2 + len(part) <= limit:
+                messages[-1] += "\n\n" + part
+            else:
+                messages.append(part[:limit])
+        return messages
+
+    # --- CONTROL API ---
+
+    async def shards_handler(self, request):
+        """GET /shards - worker health and forwarding counters"""
+        return web.json_response({"received": self.received, "shards": [w.stats() for w in self.workers]})
+
+    async def invalidate_handler(self, request):
+        """POST /cache/invalidate - fan out to every worker (the verdict cache is per worker)"""
+        body = await request.read()
+        headers = {"Content-Type": "application/json"}
+        if BOT_CONTROL_TOKEN:
+            headers[TOKEN_HEADER] = BOT_CONTROL_TOKEN
+        results = await asyncio.gather(
+            *(self.client.post(f"{w.url}/cache/invalidate", content=body, headers=headers) for w in self.workers),
+            return_exceptions=True,
+        )
+        removed = sum(
+            r.json().get("removed", 0) for r in results
+            if not isinstance(r, Exception) and r.status_code == 200
+        )
+        failed = sum(1 for r in results if isinstance(r, Exception) or r.status_code != 200)
+        return web.json_response({"success": failed == 0, "removed": removed, "failed_shards": failed})
+
+    async def allocate_link_handler(self, request):
+        """POST /links/allocate - the owning worker keeps that channel's link pool"""
+        body = await request.read()
+        try:
+            channel_id = int((await request.json())["channel_id"])
+        except (ValueError, KeyError, TypeError):
+            return web.json_response({"error": "channel_id is required"}, status=400)
+        worker = self.workers[self.ring.shard_for(channel_id)]
+        headers = {"Content-Type": "application/json"}
+        if BOT_CONTROL_TOKEN:
+            headers[TOKEN_HEADER] = BOT_CONTROL_TOKEN
+        try:
+            response = await self.client.post(f"{worker.url}/links/allocate", content=body, headers=headers)
+        except httpx.HTTPError as e:
+            return web.json_response({"error": f"shard {worker.index} unavailable: {e}"}, status=503)
+        return web.Response(body=response.content, status=response.status_code, content_type="application/json")
+
+    # --- LIFECYCLE ---
+
+    async def run(self):
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        await self.bot.initialize()
+        await self.control_server.start()
+        for worker in self.workers:
+            worker.start()
+        logger.info(f"🚀 Ingress started: {len(self.workers)} shard(s), mode {BOT_MODE}")
+
+        source = asyncio.create_task(self.serve_webhook() if BOT_MODE == "webhook" else self.poll())
+        stopped = asyncio.create_task(stop.wait())
+        await asyncio.wait({source, stopped}, return_when=asyncio.FIRST_COMPLETED)
+        if source.done() and source.exception():
+            logger.error(f"❌ Update source failed: {source.exception()}")
+
+        logger.info("🛑 Ingress stopping: draining shard buffers")
+        source.cancel()
+        stopped.cancel()
+        await asyncio.gather(source, stopped, return_exceptions=True)
+        for task in list(self._commands):
+            task.cancel()
+        await asyncio.gather(*self._commands, return_exceptions=True)
+        await asyncio.gather(*(worker.drain(5) for worker in self.workers))
+        await asyncio.gather(*(worker.stop() for worker in self.workers))
+        await self.control_server.stop()
+        await self.client.aclose()
+        await self.bot.shutdown()
+
+
+def main():
+    if not BOT_TOKEN:
+        logger.error("❌ Missing required environment variable BOT_TOKEN")
+        return
+    if BOT_MODE == "webhook" and (not WEBHOOK_URL or not WEBHOOK_SECRET_TOKEN):
+        logger.error("❌ Webhook mode requires WEBHOOK_URL and WEBHOOK_SECRET_TOKEN")
+        return
+    asyncio.run(Ingress().run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+# Channel Registry
+# Compact, indexed view of the channels the bot manages.
+#
+# Every reload builds a new immutable ChannelSnapshot and swaps it in with a
+# single assignment, so a join request running during a reload sees either
+# the old or the new registry - never a half-built or empty one. A delta
+# copies the current snapshot's indexes and rewrites only the entries of the
+# channels it touches.
+
+import sys
+from datetime import datetime, timezone
+
+
+def _intern(value):
+    # admin/group ids and bundle names repeat across channels; share one copy
+    return sys.intern(str(value)) if value else ''
+
+
+class ChannelRecord:
+    """One managed channel (slotted to keep 100k channels small)"""
+
+    __slots__ = (
+        "channel_id", "admin_id", "name", "group_id", "chat_title",
+        "is_legacy", "channel_db_id", "join_link",
+    )
+
+    def __init__(self, channel_id, admin_id='', name='Unknown Channel', group_id='',
+                 chat_title='Unknown Channel', is_legacy=False, channel_db_id='', join_link=''):
+        self.channel_id = channel_id
+        self.admin_id = admin_id
+        self.name = name
+        self.group_id = group_id
+        self.chat_title = chat_title
+        self.is_legacy = is_legacy
+        self.channel_db_id = channel_db_id
+        self.join_link = join_link
+
+    @classmethod
+    def from_payload(cls, channel_data):
+        """Build a record from one /api/groups/active entry (None if it has no channel_id)"""
+        channel_id = channel_data.get('channel_id')
+        if not channel_id:
+            return None
+        return cls(
+            channel_id=int(channel_id),
+            admin_id=_intern(channel_data.get('admin_id')),
+            name=_intern(channel_data.get('name') or 'Unknown Channel'),
+            group_id=_intern(channel_data.get('group_id')),
+            chat_title=channel_data.get('chat_title') or 'Unknown Channel',
+            is_legacy=bool(channel_data.get('is_legacy', False)),
+            channel_db_id=_intern(channel_data.get('channel_db_id')),
+            join_link=channel_data.get('join_link') or '',
+        )
+
+    def _values(self):
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def __eq__(self, other):
+        return isinstance(other, ChannelRecord) and self._values() == other._values()
+
+    def __hash__(self):
+        return hash(self.channel_id)
+
+    def __repr__(self):
+        return f"ChannelRecord({self.channel_id}, {self.chat_title!r})"
+
+
+class ChannelSnapshot:
+    """Immutable set of records plus secondary indexes (do not mutate after build)"""
+
+    __slots__ = ("by_channel", "by_admin", "by_group", "by_channel_db_id", "built_at")
+
+    def __init__(self, records=()):
+        by_channel = {}
+        for record in records:
+            by_channel[record.channel_id] = record
+
+        by_admin = {}
+        by_group = {}
+        by_channel_db_id = {}
+        for record in by_channel.values():
+            by_admin.setdefault(record.admin_id, []).append(record)
+            by_group.setdefault(record.group_id, []).append(record)
+            if record.channel_db_id:
+                by_channel_db_id[record.channel_db_id] = record
+
+        self.by_channel = by_channel
+        self.by_admin = {key: tuple(value) for key, value in by_admin.items()}
+        self.by_group = {key: tuple(value) for key, value in by_group.items()}
+        self.by_channel_db_id = by_channel_db_id
+        self.built_at = datetime.now(timezone.utc)
+
+    def __len__(self):
+        return len(self.by_channel)
+
+    def with_changes(self, upserts=(), removed_ids=()):
+        """New snapshot with `upserts` added/replaced and `removed_ids` dropped (self is untouched)"""
+        upserts = {record.channel_id: record for record in upserts}
+        changed_ids = set(upserts).union(removed_ids)
+        old = [self.by_channel[channel_id] for channel_id in changed_ids if channel_id in self.by_channel]
+
+        by_channel = dict(self.by_channel)
+        for channel_id in removed_ids:
+            by_channel.pop(channel_id, None)
+        by_channel.update(upserts)
+
+        by_channel_db_id = dict(self.by_channel_db_id)
+        for record in old:
+            if record.channel_db_id and by_channel_db_id.get(record.channel_db_id) is record:
+                del by_channel_db_id[record.channel_db_id]
+        for record in upserts.values():
+            if record.channel_db_id:
+                by_channel_db_id[record.channel_db_id] = record
+
+        snapshot = ChannelSnapshot.__new__(ChannelSnapshot)
+        snapshot.by_channel = by_channel
+        snapshot.by_admin = self._reindex(self.by_admin, 'admin_id', old, upserts, changed_ids)
+        snapshot.by_group = self._reindex(self.by_group, 'group_id', old, upserts, changed_ids)
+        snapshot.by_channel_db_id = by_channel_db_id
+        snapshot.built_at = datetime.now(timezone.utc)
+        return snapshot
+
+    @staticmethod
+    def _reindex(index, field, old, upserts, changed_ids):
+        # Only the buckets an old or new record lives in can change
+        index = dict(index)
+        added = {}
+        for record in upserts.values():
+            added.setdefault(getattr(record, field), []).append(record)
+        for key in added.keys() | {getattr(record, field) for record in old}:
+            bucket = [record for record in index.get(key, ()) if record.channel_id not in changed_ids]
+            bucket.extend(added.get(key, ()))
+            if bucket:
+                index[key] = tuple(bucket)
+            else:
+                index.pop(key, None)
+        return index
+
+
+class ChannelRegistry:
+    """O(1) channel lookups against the current snapshot"""
+
+    def __init__(self, records=()):
+        self._snapshot = ChannelSnapshot(records)
+
+    @property
+    def snapshot(self) -> ChannelSnapshot:
+        return self._snapshot
+
+    def __len__(self):
+        return len(self._snapshot.by_channel)
+
+    def __contains__(self, channel_id):
+        return channel_id in self._snapshot.by_channel
+
+    def __iter__(self):
+        return iter(self._snapshot.by_channel.values())
+
+    def get(self, channel_id):
+        return self._snapshot.by_channel.get(channel_id)
+
+    def by_admin(self, admin_id):
+        return self._snapshot.by_admin.get(str(admin_id), ())
+
+    def by_group(self, group_id):
+        return self._snapshot.by_group.get(str(group_id), ())
+
+    def by_channel_db_id(self, channel_db_id):
+        return self._snapshot.by_channel_db_id.get(str(channel_db_id))
+
+    def replace(self, records):
+        """Swap in a snapshot built from `records` (full reload)"""
+        self._snapshot = ChannelSnapshot(records)
+
+    def apply_delta(self, upserts=(), removed_ids=()):
+        """Swap in a snapshot with `upserts` added/replaced and `removed_ids` dropped"""
+        self._snapshot = self._snapshot.with_changes(upserts, removed_ids)
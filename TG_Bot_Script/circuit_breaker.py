@@ -0,0 +1,98 @@
+# Circuit Breaker
+# Stops calling a dependency that keeps failing. After BACKEND_BREAKER_FAILURES
+# consecutive failures the circuit opens and calls fail fast; once
+# BACKEND_BREAKER_OPEN_SECONDS have passed a single probe call is let through
+# (half-open), and its result closes the circuit or opens it again.
+
+import logging
+import os
+import time
+
+# --- CONFIGURATION ---
+BACKEND_BREAKER_FAILURES = int(os.getenv("BACKEND_BREAKER_FAILURES", "5"))  # consecutive failures that open it
+BACKEND_BREAKER_OPEN_SECONDS = float(os.getenv("BACKEND_BREAKER_OPEN_SECONDS", "15"))  # before the probe
+
+# Breaker states (the numbers are what the state gauge reports)
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe"""
+
+    def __init__(self, name, failure_threshold=BACKEND_BREAKER_FAILURES, open_seconds=BACKEND_BREAKER_OPEN_SECONDS,
+                 on_change=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.on_change = on_change  # callback(old_state, new_state)
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._set_state(HALF_OPEN)
+        return self._state
+
+    def allow(self) -> bool:
+        """True if a call may go out now (in half-open state, only the probe)"""
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self._failures = 0
+        self._probe_in_flight = False
+        if self._state != CLOSED:
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        self._failures += 1
+        self._probe_in_flight = False
+        if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+            self._opened_at = time.monotonic()
+            self.opened += 1
+            self._set_state(OPEN)
+
+    def abandon(self):
+        """A call allowed through ended without a result (cancelled); let another probe go"""
+        self._probe_in_flight = False
+
+    def _set_state(self, new_state):
+        old_state, self._state = self._state, new_state
+        if new_state == OPEN:
+            logger.error(f"🔌 {self.name} circuit opened after {self._failures} failure(s); "
+                         f"probing again in {self.open_seconds:.0f}s")
+        elif new_state == CLOSED:
+            logger.info(f"🔌 {self.name} circuit closed")
+        if self.on_change is not None:
+            self.on_change(old_state, new_state)
+
+    def retry_in(self) -> float:
+        """Seconds until the next probe is allowed (0 unless open)"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "retry_in": round(self.retry_in(), 1),
+        }
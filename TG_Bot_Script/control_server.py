@@ -0,0 +1,63 @@
+# Bot Control API
+# Small local HTTP server the backend (and operators) use to talk to the
+# running bot. Other modules register their routes on it.
+
+import hmac
+import logging
+import os
+
+from aiohttp import web
+
+# --- CONFIGURATION ---
+BOT_CONTROL_HOST = os.getenv("BOT_CONTROL_HOST", "127.0.0.1")
+BOT_CONTROL_PORT = int(os.getenv("BOT_CONTROL_PORT", "8081"))
+BOT_CONTROL_TOKEN = os.getenv("BOT_CONTROL_TOKEN", "")
+# Local development only: serve every route without a token
+BOT_CONTROL_INSECURE = os.getenv("BOT_CONTROL_INSECURE", "false").lower() == "true"
+
+TOKEN_HEADER = "X-Bot-Control-Token"
+
+logger = logging.getLogger(__name__)
+
+
+class ControlServer:
+    """aiohttp server with shared-token authentication on non-public routes"""
+
+    def __init__(self, host=BOT_CONTROL_HOST, port=BOT_CONTROL_PORT, token=BOT_CONTROL_TOKEN,
+                 insecure=BOT_CONTROL_INSECURE):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.insecure = insecure
+        self._public_paths = set()
+        self._app = web.Application(middlewares=[self._authenticate])
+        self._runner = None
+
+    def add_route(self, method, path, handler, public=False):
+        """Register a handler; public routes skip the token check (e.g. /metrics)"""
+        self._app.router.add_route(method, path, handler)
+        if public:
+            self._public_paths.add(path)
+
+    @web.middleware
+    async def _authenticate(self, request, handler):
+        if self.token and request.path not in self._public_paths:
+            supplied = request.headers.get(TOKEN_HEADER, "")
+            if not hmac.compare_digest(supplied, self.token):
+                return web.json_response({"error": "Unauthorized"}, status=401)
+        return await handler(request)
+
+    async def start(self):
+        if not self.token:
+            if not self.insecure:
+                raise RuntimeError("BOT_CONTROL_TOKEN is not set; set it, or BOT_CONTROL_INSECURE=true for local testing")
+            logger.warning("⚠️ Control API running without authentication (BOT_CONTROL_INSECURE=true)")
+        self._runner = web.AppRunner(self._app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"🛠️ Control API listening on http://{self.host}:{self.port}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
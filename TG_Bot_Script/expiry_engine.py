@@ -0,0 +1,326 @@
+# Membership Expiry Engine
+# Keeps the next EXPIRY_HORIZON seconds of member expiries in a min-heap and
+# kicks each member within about a second of their expiry, instead of a
+# backend cron scanning every expired member once a minute.
+#
+# The heap is filled from /api/telegram/expiring: a full load at startup, then
+# every sync fetches the newly reachable time window plus the members changed
+# since the last cursor (renewals, kicks, new joins). Due members go onto a
+# queue drained by a fixed pool of workers doing ban -> unban -> DM; the calls
+# pass through the bot's outbound scheduler, so a midnight spike of thousands
+# of expiries is paced rather than piled up. Completed kicks are reported to
+# the backend through the outbox.
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+from telegram.error import BadRequest, TelegramError
+
+from backend_client import BackendError, get_backend
+from outbox import get_outbox
+
+# --- CONFIGURATION ---
+# Who kicks expired members: "backend" (its per-minute cron) or "bot" (this engine). The
+# backend reads the same EXPIRY_ENGINE setting, so exactly one side kicks; set both alike.
+EXPIRY_ENGINE = os.getenv("EXPIRY_ENGINE", "backend").strip().lower()
+EXPIRY_ENGINE_ENABLED = EXPIRY_ENGINE == "bot"
+EXPIRY_HORIZON = int(os.getenv("EXPIRY_HORIZON", "3600"))  # seconds of upcoming expiries held in memory
+EXPIRY_SYNC_INTERVAL = int(os.getenv("EXPIRY_SYNC_INTERVAL", "30"))  # seconds
+EXPIRY_FULL_RESYNC_INTERVAL = int(os.getenv("EXPIRY_FULL_RESYNC_INTERVAL", "21600"))  # seconds
+EXPIRY_PREFIRE_SYNC_AGE = float(os.getenv("EXPIRY_PREFIRE_SYNC_AGE", "5"))  # refresh renewals before kicking
+EXPIRY_WORKERS = int(os.getenv("EXPIRY_WORKERS", "8"))
+EXPIRY_PAGE_SIZE = int(os.getenv("EXPIRY_PAGE_SIZE", "2000"))
+EXPIRY_RETRY_DELAY = int(os.getenv("EXPIRY_RETRY_DELAY", "60"))  # seconds before retrying a failed kick
+EXPIRY_MAX_ATTEMPTS = int(os.getenv("EXPIRY_MAX_ATTEMPTS", "3"))
+
+KICK_REASON = "Subscription expired"
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+class ExpiryEntry:
+    """One scheduled kick"""
+
+    __slots__ = ("member_id", "telegram_user_id", "channel_id", "expires_at", "channel_title", "attempts")
+
+    def __init__(self, member_id, telegram_user_id, channel_id, expires_at, channel_title=None, attempts=0):
+        self.member_id = member_id
+        self.telegram_user_id = telegram_user_id
+        self.channel_id = channel_id
+        self.expires_at = expires_at
+        self.channel_title = channel_title
+        self.attempts = attempts
+
+    @classmethod
+    def from_payload(cls, member):
+        return cls(
+            member_id=member["member_id"],
+            telegram_user_id=int(member["telegram_user_id"]),
+            channel_id=int(member["channel_id"]),
+            expires_at=_parse_time(member["expires_at"]),
+            channel_title=member.get("channel_title"),
+        )
+
+
+class ExpiryEngine:
+    """Min-heap of upcoming expiries plus a rate-limited kick pipeline"""
+
+    def __init__(self, backend_factory=get_backend, outbox_factory=get_outbox, horizon=EXPIRY_HORIZON,
+                 workers=EXPIRY_WORKERS, prefire_sync_age=EXPIRY_PREFIRE_SYNC_AGE,
+                 full_resync_interval=EXPIRY_FULL_RESYNC_INTERVAL, page_size=EXPIRY_PAGE_SIZE, owns=None):
+        self.backend_factory = backend_factory
+        self.outbox_factory = outbox_factory
+        self.horizon = horizon
+        self.workers = workers
+        self.prefire_sync_age = prefire_sync_age
+        self.full_resync_interval = full_resync_interval
+        self.page_size = page_size
+        self.owns = owns  # channel_id -> bool; None schedules every channel
+        self.bot = None
+        self._entries = {}  # {member_id: ExpiryEntry} - the live schedule
+        self._heap = []  # [(expires_at, seq, entry)]; stale items are skipped when popped
+        self._seq = itertools.count()
+        self._kicked = {}  # {member_id: expires_at} kicked but maybe not yet recorded by the backend
+        self._queue = None
+        self._wakeup = None
+        self._tasks = []
+        self._sync_lock = None
+        self._cursor = None
+        self._loaded_until = None
+        self._last_sync = 0.0
+        self._last_full_sync = 0.0
+        self.kicked = 0
+        self.failed = 0
+        self._lag_total = 0.0
+        self._lag_max = 0.0
+
+    # --- SCHEDULE ---
+
+    def __len__(self):
+        return len(self._entries)
+
+    def schedule(self, entry):
+        """Add or move a member's kick (ignored beyond the loaded horizon)"""
+        if self._kicked.get(entry.member_id) == entry.expires_at:
+            return
+        current = self._entries.get(entry.member_id)
+        if current is not None and current.expires_at == entry.expires_at:
+            return
+        if self._loaded_until is not None and entry.expires_at > self._loaded_until:
+            self.cancel(entry.member_id)
+            return
+        self._entries[entry.member_id] = entry
+        heapq.heappush(self._heap, (entry.expires_at, next(self._seq), entry))
+        if self._wakeup is not None and self._heap[0][2] is entry:
+            self._wakeup.set()
+
+    def cancel(self, member_id):
+        self._entries.pop(member_id, None)
+
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, entry = heapq.heappop(self._heap)
+            if self._entries.get(entry.member_id) is entry:
+                del self._entries[entry.member_id]
+                due.append(entry)
+        return due
+
+    def _next_due(self):
+        while self._heap and self._entries.get(self._heap[0][2].member_id) is not self._heap[0][2]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    # --- SYNC ---
+
+    async def _fetch(self, params):
+        """All pages for one query; returns (members, cursor)"""
+        members, cursor, after_id = [], None, None
+        while True:
+            page_params = dict(params, limit=self.page_size)
+            if after_id:
+                page_params["after_id"] = after_id
+            response = await self.backend_factory().expiring_members(page_params)
+            if response.status_code != 200:
+                raise BackendError(f"expiring members returned HTTP {response.status_code}")
+            data = response.json()
+            page = data.get("members", [])
+            members.extend(page)
+            cursor = cursor or data.get("cursor")
+            if not data.get("has_more") or not page:
+                return members, cursor
+            after_id = page[-1]["member_id"]
+
+    async def sync(self, full=False):
+        """Pull new expiries and changes from the backend"""
+        async with self._sync_lock:
+            now = time.time()
+            until = now + self.horizon
+            full = full or self._cursor is None or now - self._last_full_sync >= self.full_resync_interval
+
+            if full:
+                members, cursor = await self._fetch({"until": _iso(until)})
+                self._entries = {}
+                self._heap = []
+            else:
+                window, _ = await self._fetch({"from": _iso(self._loaded_until), "until": _iso(until)})
+                changed, cursor = await self._fetch({"updated_since": self._cursor})
+                members = window + changed
+
+            self._loaded_until = until
+            for member in members:
+                try:
+                    entry = ExpiryEntry.from_payload(member)
+                except (KeyError, TypeError, ValueError) as e:
+                    logger.warning(f"⚠️ Skipping malformed expiry record {member.get('member_id')}: {e}")
+                    continue
+                if self.owns is not None and not self.owns(entry.channel_id):
+                    continue
+                if member.get("is_active", True):
+                    self.schedule(entry)
+                else:
+                    self.cancel(entry.member_id)
+
+            # Forget kicks the backend has had time to record
+            for member_id, expires_at in list(self._kicked.items()):
+                if expires_at < now - self.horizon:
+                    del self._kicked[member_id]
+
+            self._cursor = cursor or self._cursor
+            self._last_sync = now
+            if full:
+                self._last_full_sync = now
+                logger.info(f"⏳ Expiry sync (full): {len(self._entries)} kicks scheduled in the next {self.horizon}s")
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    # --- LIFECYCLE ---
+
+    async def start(self, bot):
+        self.bot = bot
+        self._queue = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._sync_lock = asyncio.Lock()
+        self._tasks = [asyncio.create_task(self._timer_loop())]
+        self._tasks += [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"⏳ Expiry engine started with {self.workers} kick workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _timer_loop(self):
+        while True:
+            self._wakeup.clear()
+            next_due = self._next_due()
+            now = time.time()
+
+            if next_due is not None and next_due <= now:
+                # Catch renewals that happened since the last sync before kicking anyone
+                if now - self._last_sync > self.prefire_sync_age:
+                    try:
+                        await self.sync()
+                    except Exception as e:
+                        logger.warning(f"⚠️ Pre-kick expiry sync failed, using cached schedule: {e}")
+                        self._last_sync = now
+                    continue
+                for entry in self._pop_due(now):
+                    # Claimed from here on, so a resync cannot schedule the same kick twice
+                    self._kicked[entry.member_id] = entry.expires_at
+                    self._queue.put_nowait(entry)
+                continue
+
+            timeout = None if next_due is None else next_due - now
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self):
+        while True:
+            entry = await self._queue.get()
+            try:
+                await self._kick(entry)
+            except Exception as e:
+                logger.error(f"❌ Unexpected error kicking {entry.telegram_user_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    # --- KICK PIPELINE ---
+
+    async def _kick(self, entry):
+        user_id, channel_id = entry.telegram_user_id, entry.channel_id
+        try:
+            await self.bot.ban_chat_member(chat_id=channel_id, user_id=user_id)
+            # Unban straight away so the user can rejoin with a new subscription
+            await self.bot.unban_chat_member(chat_id=channel_id, user_id=user_id, only_if_banned=True)
+        except BadRequest as e:
+            # Typically the user already left; nothing left to remove
+            logger.info(f"ℹ️ Could not remove {user_id} from {channel_id}, treating as gone: {e}")
+        except TelegramError as e:
+            entry.attempts += 1
+            if entry.attempts >= EXPIRY_MAX_ATTEMPTS:
+                self.failed += 1
+                logger.error(f"❌ Giving up kicking {user_id} from {channel_id}: {e}")
+                return
+            logger.warning(f"⚠️ Kick of {user_id} from {channel_id} failed, retrying in {EXPIRY_RETRY_DELAY}s: {e}")
+            retry = ExpiryEntry(entry.member_id, user_id, channel_id, time.time() + EXPIRY_RETRY_DELAY,
+                                entry.channel_title, entry.attempts)
+            self._kicked.pop(entry.member_id, None)
+            self._entries[retry.member_id] = retry
+            heapq.heappush(self._heap, (retry.expires_at, next(self._seq), retry))
+            self._wakeup.set()
+            return
+
+        kicked_at = time.time()
+        lag = max(0.0, kicked_at - entry.expires_at)
+        self.kicked += 1
+        self._lag_total += lag
+        self._lag_max = max(self._lag_max, lag)
+        logger.info(f"👢 Removed expired member {user_id} from {channel_id} ({lag:.1f}s after expiry)")
+
+        try:
+            await self.outbox_factory().enqueue("member_kicked", {
+                "member_id": entry.member_id,
+                "kicked_at": _iso(kicked_at),
+                "reason": KICK_REASON,
+            })
+        except Exception as e:
+            logger.error(f"❌ Could not queue kick record for {user_id}: {e}")
+
+        try:
+            await self.bot.send_message(
+                user_id,
+                f"⏰ Your subscription to channel {entry.channel_title or 'Premium Channel'} has expired.\n\n"
+                "To continue accessing premium content, please renew your subscription.\n\n"
+                "📞 Contact support for assistance.",
+            )
+        except Exception as e:
+            logger.debug(f"Could not send expiry message to {user_id}: {e}")
+
+    def stats(self):
+        next_due = self._next_due()
+        return {
+            "scheduled": len(self._entries),
+            "next_in": round(max(0.0, next_due - time.time()), 1) if next_due is not None else None,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "kicked": self.kicked,
+            "failed": self.failed,
+            "avg_lag": round(self._lag_total / self.kicked, 2) if self.kicked else 0.0,
+            "max_lag": round(self._lag_max, 2),
+        }
@@ -1,17 +1,20 @@
 #!/usr/bin/env python3
-import requests
+import asyncio
 import json
 from datetime import datetime
 import os
 from dotenv import load_dotenv
 
+from backend_client import close_backend, get_backend
+
 # Load environment variables
 load_dotenv()
 
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:4000")
 
-def diagnose_channel_links():
+async def diagnose_channel_links():
     """Diagnose and fix channel link issues"""
+    backend = get_backend()
     
     print("🔍 CHANNEL LINKS DIAGNOSTIC & FIX TOOL")
     print("=" * 60)
@@ -19,7 +22,7 @@ def diagnose_channel_links():
     # Step 1: Check current active channels
     print("\n1️⃣ CHECKING CURRENT ACTIVE CHANNELS")
     try:
-        response = requests.get(f"{BACKEND_URL}/api/groups/active", timeout=10)
+        response = await backend.active_groups()
         if response.status_code == 200:
             data = response.json()
             channels = data.get('active_channels', [])
@@ -107,5 +110,11 @@ def diagnose_channel_links():
     print("   • Frontend is trying to display channel.join_link but it's null")
     print("   • Need to generate and store proper invite links")
 
+async def main():
+    try:
+        await diagnose_channel_links()
+    finally:
+        await close_backend()
+
 if __name__ == "__main__":
-    diagnose_channel_links()
+    asyncio.run(main())
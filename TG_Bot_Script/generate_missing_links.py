@@ -1,107 +1,306 @@
 #!/usr/bin/env python3
-import requests
+# Bulk Invite Link Generation
+# Generates join links for every active channel that is missing one, several
+# channels at a time.
+#
+#   python generate_missing_links.py                 # generate, resuming from the checkpoint
+#   python generate_missing_links.py --dry-run       # only list what would be generated
+#   python generate_missing_links.py --json > report.json
+#
+# - LINK_GEN_CONCURRENCY requests run at once
+# - a flood wait (HTTP 429 + retry_after) pauses every request, then the channel is retried
+# - each finished channel is appended to the checkpoint file, so a rerun skips it
+import argparse
+import asyncio
 import json
-from datetime import datetime
 import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+
 from dotenv import load_dotenv
 
+from backend_client import BackendError, close_backend, get_backend
+
 # Load environment variables
 load_dotenv()
 
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:4000")
+LINK_GEN_CONCURRENCY = int(os.getenv("LINK_GEN_CONCURRENCY", "8"))
+LINK_GEN_MAX_ATTEMPTS = int(os.getenv("LINK_GEN_MAX_ATTEMPTS", "3"))  # per channel, flood waits not counted
+LINK_GEN_MAX_FLOOD_WAIT = float(os.getenv("LINK_GEN_MAX_FLOOD_WAIT", "300"))  # give up on longer waits
+LINK_GEN_CHECKPOINT = os.getenv("LINK_GEN_CHECKPOINT", "generate_links_checkpoint.jsonl")
 
-def generate_missing_links():
-    """Generate missing invite links for all channels"""
-    
-    print("🔧 GENERATING MISSING CHANNEL INVITE LINKS")
-    print("=" * 60)
-    
-    # Step 1: Get channels that need links
-    print("\n1️⃣ GETTING CHANNELS NEEDING LINKS")
-    try:
-        response = requests.get(f"{BACKEND_URL}/api/groups/active", timeout=10)
-        if response.status_code != 200:
-            print(f"   ❌ Failed to get active channels: {response.status_code}")
-            return
-        
-        data = response.json()
-        channels = data.get('active_channels', [])
-        missing_links = [ch for ch in channels if not ch.get('join_link')]
-        
-        print(f"   📊 Total channels: {len(channels)}")
-        print(f"   ⚠️ Channels missing links: {len(missing_links)}")
-        
-        if not missing_links:
-            print("   ✅ All channels already have invite links!")
-            return
-            
-    except Exception as e:
-        print(f"   ❌ Error getting channels: {e}")
-        return
-    
-    # Step 2: Generate links for each channel
-    print(f"\n2️⃣ GENERATING INVITE LINKS")
-    success_count = 0
-    
-    for i, channel in enumerate(missing_links, 1):
-        name = channel.get('name', 'Unknown')
-        group_id = channel.get('group_id')
-        channel_db_id = channel.get('channel_db_id')
-        
-        print(f"\n   {i}/{len(missing_links)} Generating link for: {name}")
-        print(f"      Group ID: {group_id}")
-        print(f"      Channel DB ID: {channel_db_id}")
-        
+# Older backends report flood limits as a 500 with Telegram's message inside
+RETRY_AFTER_PATTERN = re.compile(r"retry after (\d+)", re.IGNORECASE)
+
+# Human-readable progress; goes to stderr when stdout carries the JSON report
+out = sys.stdout
+
+
+def say(message=""):
+    print(message, file=out, flush=True)
+
+
+def channel_key(channel):
+    return f"{channel.get('group_id')}:{channel.get('channel_db_id')}"
+
+
+def load_checkpoint(path):
+    """Channels finished by earlier runs: {key: join_link}"""
+    done = {}
+    if not path or not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash
+            done[entry["key"]] = entry.get("join_link")
+    return done
+
+
+def retry_after(response):
+    """Seconds Telegram asked us to wait, or None if this was not a flood limit"""
+    if response.status_code == 429:
         try:
-            # Call the generateChannelJoinLink API
-            url = f"{BACKEND_URL}/api/groups/{group_id}/channels/{channel_db_id}/generate-link"
-            response = requests.post(url, timeout=30)
-            
-            if response.status_code == 200:
-                result = response.json()
-                invite_link = result.get('inviteLink', 'N/A')
-                print(f"      ✅ Generated: {invite_link[:50]}...")
-                success_count += 1
+            return float(response.json().get("retry_after") or response.headers.get("Retry-After") or 1)
+        except ValueError:
+            return float(response.headers.get("Retry-After") or 1)
+    if response.status_code >= 500:
+        match = RETRY_AFTER_PATTERN.search(response.text)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+class FloodGate:
+    """Shared pause: a flood wait on one request holds back all of them (the limit is per bot)"""
+
+    def __init__(self):
+        self.resume_at = 0.0
+        self.waits = 0
+        self.waited = 0.0
+
+    def pause(self, seconds):
+        resume_at = time.monotonic() + seconds
+        if resume_at > self.resume_at:
+            self.resume_at = resume_at
+            self.waits += 1
+            self.waited += seconds
+
+    async def wait(self):
+        while (delay := self.resume_at - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+
+async def generate_one(backend, channel, gate, max_attempts, max_flood_wait):
+    """Generate one channel's link; returns a result entry for the report"""
+    started = time.perf_counter()
+    result = {
+        "group_id": channel.get("group_id"),
+        "channel_db_id": channel.get("channel_db_id"),
+        "name": channel.get("name", "Unknown"),
+        "status": "failed",
+        "join_link": None,
+        "error": None,
+        "attempts": 0,
+    }
+    while result["attempts"] < max_attempts:
+        await gate.wait()
+        result["attempts"] += 1
+        try:
+            response = await backend.generate_channel_link(result["group_id"], result["channel_db_id"])
+        except BackendError as e:
+            result["error"] = str(e)
+            await asyncio.sleep(min(2 ** result["attempts"], 10))
+            continue
+
+        if response.status_code == 200:
+            body = response.json()
+            result["status"] = "generated"
+            result["join_link"] = body.get("joinLink") or body.get("inviteLink")
+            result["error"] = None
+            break
+
+        wait = retry_after(response)
+        if wait is not None:
+            if wait > max_flood_wait:
+                result["error"] = f"flood wait of {wait:.0f}s exceeds {max_flood_wait:.0f}s"
+                break
+            gate.pause(wait)
+            result["attempts"] -= 1  # flood waits are not the channel's fault
+            say(f"   🐢 Flood wait {wait:.0f}s (from {result['name']}), pausing all requests")
+            continue
+
+        result["error"] = f"HTTP {response.status_code}: {response.text[:200]}"
+        if response.status_code < 500:
+            break  # 4xx (missing group/channel, access denied) will not fix itself
+
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000)
+    return result
+
+
+async def generate_missing_links(args):
+    """Generate missing invite links for all channels; returns the report"""
+    backend = get_backend()
+    started_at = datetime.now(timezone.utc)
+    started = time.perf_counter()
+
+    say("🔧 GENERATING MISSING CHANNEL INVITE LINKS" + (" (DRY RUN)" if args.dry_run else ""))
+    say("=" * 60)
+
+    # Step 1: Get channels that need links
+    say("\n1️⃣ GETTING CHANNELS NEEDING LINKS")
+    response = await backend.active_groups()
+    if response.status_code != 200:
+        raise BackendError(f"Failed to get active channels: HTTP {response.status_code}")
+    channels = response.json().get('active_channels', [])
+    missing_links = [ch for ch in channels if not ch.get('join_link')]
+
+    checkpoint = {} if args.fresh else load_checkpoint(args.checkpoint)
+    results = []
+    todo = []
+    for channel in missing_links:
+        if not channel.get('group_id') or not channel.get('channel_db_id'):
+            results.append({
+                "group_id": channel.get("group_id"), "channel_db_id": channel.get("channel_db_id"),
+                "name": channel.get("name", "Unknown"), "status": "skipped",
+                "join_link": None, "error": "legacy channel without a bundle channel id", "attempts": 0,
+            })
+        elif channel_key(channel) in checkpoint:
+            results.append({
+                "group_id": channel["group_id"], "channel_db_id": channel["channel_db_id"],
+                "name": channel.get("name", "Unknown"), "status": "checkpointed",
+                "join_link": checkpoint[channel_key(channel)], "error": None, "attempts": 0,
+            })
+        else:
+            todo.append(channel)
+
+    say(f"   📊 Total channels: {len(channels)}")
+    say(f"   ⚠️ Channels missing links: {len(missing_links)}")
+    say(f"   ⏭️ Already done in an earlier run: {sum(1 for r in results if r['status'] == 'checkpointed')}")
+    say(f"   🚀 To generate: {len(todo)} ({args.concurrency} at a time)")
+
+    # Step 2: Generate links, bounded concurrency
+    gate = FloodGate()
+    if args.dry_run:
+        for channel in todo:
+            say(f"   • would generate: {channel.get('name', 'Unknown')} ({channel_key(channel)})")
+            results.append({
+                "group_id": channel["group_id"], "channel_db_id": channel["channel_db_id"],
+                "name": channel.get("name", "Unknown"), "status": "dry_run",
+                "join_link": None, "error": None, "attempts": 0,
+            })
+    elif todo:
+        say(f"\n2️⃣ GENERATING INVITE LINKS")
+        semaphore = asyncio.Semaphore(args.concurrency)
+        checkpoint_file = open(args.checkpoint, "a") if args.checkpoint else None
+        finished = 0
+
+        async def run(channel):
+            nonlocal finished
+            async with semaphore:
+                result = await generate_one(backend, channel, gate, args.max_attempts, args.max_flood_wait)
+            finished += 1
+            if result["status"] == "generated":
+                say(f"   ✅ {finished}/{len(todo)} {result['name']}: {(result['join_link'] or 'N/A')[:50]}")
+                if checkpoint_file:
+                    checkpoint_file.write(json.dumps({
+                        "key": channel_key(channel),
+                        "join_link": result["join_link"],
+                        "at": datetime.now(timezone.utc).isoformat(),
+                    }) + "\n")
+                    checkpoint_file.flush()
             else:
-                print(f"      ❌ Failed: HTTP {response.status_code}")
-                print(f"      Response: {response.text[:100]}")
-                
-        except Exception as e:
-            print(f"      ❌ Error: {e}")
-    
-    # Step 3: Verify results
-    print(f"\n3️⃣ VERIFICATION")
-    print(f"   ✅ Successfully generated: {success_count}/{len(missing_links)} links")
-    
-    if success_count > 0:
-        print(f"\n   🔄 Checking updated channel links...")
+                say(f"   ❌ {finished}/{len(todo)} {result['name']}: {result['error']}")
+            return result
+
         try:
-            response = requests.get(f"{BACKEND_URL}/api/groups/active", timeout=10)
+            results += await asyncio.gather(*(run(channel) for channel in todo))
+        finally:
+            if checkpoint_file:
+                checkpoint_file.close()
+
+    # Step 3: Verify results with one fresh registry download
+    still_missing = None
+    generated = sum(1 for r in results if r["status"] == "generated")
+    if generated and args.verify:
+        say(f"\n3️⃣ VERIFICATION")
+        try:
+            response = await backend.active_groups()
             if response.status_code == 200:
-                data = response.json()
-                updated_channels = data.get('active_channels', [])
-                
-                print(f"   📊 Updated channels status:")
-                for channel in updated_channels:
-                    name = channel.get('name', 'Unknown')
-                    join_link = channel.get('join_link', 'MISSING')
-                    status = "✅ HAS LINK" if join_link and join_link != 'MISSING' else "❌ MISSING"
-                    print(f"      • {name}: {status}")
-                    
-        except Exception as e:
-            print(f"   ⚠️ Could not verify results: {e}")
-    
-    print(f"\n🎯 SUMMARY:")
-    if success_count == len(missing_links):
-        print("   🎉 ALL CHANNEL LINKS GENERATED SUCCESSFULLY!")
-        print("   ✅ The 'undefined' issue should now be resolved")
-        print("   🔄 Frontend should now show proper channel links")
-    elif success_count > 0:
-        print(f"   ⚠️ Partial success: {success_count}/{len(missing_links)} links generated")
-        print("   🔧 Some channels may still show 'undefined'")
+                still_missing = [
+                    channel_key(ch) for ch in response.json().get('active_channels', [])
+                    if not ch.get('join_link') and ch.get('channel_db_id')
+                ]
+                say(f"   📊 Channels still missing a link: {len(still_missing)}")
+        except BackendError as e:
+            say(f"   ⚠️ Could not verify results: {e}")
+
+    failed = sum(1 for r in results if r["status"] == "failed")
+    report = {
+        "started_at": started_at.isoformat(),
+        "duration_s": round(time.perf_counter() - started, 2),
+        "backend_url": BACKEND_URL,
+        "dry_run": args.dry_run,
+        "concurrency": args.concurrency,
+        "total_channels": len(channels),
+        "missing": len(missing_links),
+        "generated": generated,
+        "failed": failed,
+        "skipped": sum(1 for r in results if r["status"] == "skipped"),
+        "checkpointed": sum(1 for r in results if r["status"] == "checkpointed"),
+        "flood_waits": gate.waits,
+        "flood_wait_seconds": round(gate.waited, 1),
+        "still_missing": still_missing,
+        "results": results,
+    }
+
+    say(f"\n🎯 SUMMARY ({report['duration_s']}s):")
+    if args.dry_run:
+        say(f"   📝 Dry run: {len(todo)} link(s) would be generated")
+    elif failed == 0:
+        say(f"   🎉 {generated} link(s) generated, nothing failed")
     else:
-        print("   ❌ No links were generated successfully")
-        print("   🔧 Manual intervention may be required")
+        say(f"   ⚠️ {generated} generated, {failed} failed - rerun to retry only the failed channels")
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate join links for channels that are missing one")
+    parser.add_argument("--concurrency", type=int, default=LINK_GEN_CONCURRENCY, help="requests in flight")
+    parser.add_argument("--max-attempts", type=int, default=LINK_GEN_MAX_ATTEMPTS, help="attempts per channel")
+    parser.add_argument("--max-flood-wait", type=float, default=LINK_GEN_MAX_FLOOD_WAIT,
+                        help="give up on a channel when Telegram asks for a longer wait (seconds)")
+    parser.add_argument("--checkpoint", default=LINK_GEN_CHECKPOINT, help="checkpoint file ('' to disable)")
+    parser.add_argument("--fresh", action="store_true", help="ignore the checkpoint from earlier runs")
+    parser.add_argument("--dry-run", action="store_true", help="list channels without generating links")
+    parser.add_argument("--no-verify", dest="verify", action="store_false",
+                        help="skip re-downloading the channel list afterwards")
+    parser.add_argument("--json", action="store_true", help="print the JSON report on stdout")
+    return parser.parse_args()
+
+
+async def main():
+    global out
+    args = parse_args()
+    if args.json:
+        out = sys.stderr
+    try:
+        report = await generate_missing_links(args)
+    except BackendError as e:
+        say(f"   ❌ Error getting channels: {e}")
+        report = {"error": str(e)}
+    finally:
+        await close_backend()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    return 0 if not report.get("error") and not report.get("failed") else 1
+
 
 if __name__ == "__main__":
-    generate_missing_links()
+    sys.exit(asyncio.run(main()))
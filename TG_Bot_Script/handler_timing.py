@@ -0,0 +1,115 @@
+# Handler Timing
+# Breaks every handler invocation into named phases (registry lookup, backend
+# validation, approve, ...) so a slow join can be pinned on the backend,
+# Telegram or our own code.
+#
+#   application.add_handler(ChatJoinRequestHandler(timed_handler(handle_join_request)))
+#   ...
+#   with phase("backend_validation"):
+#       result = await validate(...)
+#
+# Invocations slower than SLOW_REQUEST_THRESHOLD are logged with their
+# per-phase breakdown; the bot calls attach_slow_request_log() at startup to
+# also write them to a dedicated file.
+
+import contextvars
+import functools
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Histogram
+
+from metrics import LATENCY_BUCKETS, REGISTRY
+
+# --- CONFIGURATION ---
+SLOW_REQUEST_THRESHOLD = float(os.getenv("SLOW_REQUEST_THRESHOLD", "2"))  # seconds
+SLOW_REQUEST_LOG = os.getenv("SLOW_REQUEST_LOG", "slow_requests.log")  # empty: main log only
+
+HANDLER_SECONDS = Histogram(
+    "bot_handler_seconds", "Handler invocation time",
+    ["handler"], buckets=LATENCY_BUCKETS, registry=REGISTRY,
+)
+HANDLER_PHASE_SECONDS = Histogram(
+    "bot_handler_phase_seconds", "Time spent in each phase of a handler",
+    ["handler", "phase"], buckets=LATENCY_BUCKETS, registry=REGISTRY,
+)
+
+slow_logger = logging.getLogger("slow_requests")
+_slow_file = None
+
+_current = contextvars.ContextVar("handler_timer", default=None)
+
+
+class HandlerTimer:
+    """Phase durations for one handler invocation"""
+
+    __slots__ = ("handler", "phases", "started")
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.phases = {}  # {phase: seconds}, in first-seen order
+        self.started = time.perf_counter()
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+
+@contextmanager
+def phase(name):
+    """Time a block as phase `name` of the running handler (no-op outside one)"""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - started)
+
+
+def attach_slow_request_log(path=SLOW_REQUEST_LOG):
+    """Also write slow invocations to `path` (once; no-op when empty)"""
+    global _slow_file
+    if not path or _slow_file is not None:
+        return
+    _slow_file = logging.FileHandler(path)
+    _slow_file.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+    slow_logger.addHandler(_slow_file)
+
+
+def _describe(update):
+    parts = [f"update {update.update_id}"] if getattr(update, "update_id", None) is not None else []
+    if getattr(update, "effective_chat", None):
+        parts.append(f"chat {update.effective_chat.id}")
+    if getattr(update, "effective_user", None):
+        parts.append(f"user {update.effective_user.id}")
+    return ", ".join(parts)
+
+
+def timed_handler(func, threshold=None):
+    """Wrap a PTB callback so each invocation is timed and broken down by phase"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(update, context):
+        timer = HandlerTimer(name)
+        token = _current.set(timer)
+        try:
+            return await func(update, context)
+        finally:
+            _current.reset(token)
+            total = time.perf_counter() - timer.started
+            HANDLER_SECONDS.labels(handler=name).observe(total)
+            for phase_name, seconds in timer.phases.items():
+                HANDLER_PHASE_SECONDS.labels(handler=name, phase=phase_name).observe(seconds)
+
+            limit = SLOW_REQUEST_THRESHOLD if threshold is None else threshold
+            if total >= limit:
+                breakdown = [f"{phase_name}={seconds:.3f}s" for phase_name, seconds in timer.phases.items()]
+                breakdown.append(f"other={max(0.0, total - sum(timer.phases.values())):.3f}s")
+                slow_logger.warning(f"🐢 {name} took {total:.3f}s ({_describe(update)}): {' '.join(breakdown)}")
+
+    return wrapper
@@ -0,0 +1,169 @@
+# Held Join Requests
+# While the backend is unavailable, join requests are not declined: they stay
+# pending in Telegram (an admin can still approve them later) and are recorded
+# here, in SQLite, so they survive a bot restart.
+#
+# Once the backend circuit is no longer open, a background task replays the
+# held requests through the normal join path, oldest first, at most
+# HOLD_REPLAY_RATE per second so the recovering backend is not flooded. A
+# request that is still held after a replay is retried later with backoff.
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from circuit_breaker import OPEN
+from metrics import HELD_JOIN_REQUESTS
+
+# --- CONFIGURATION ---
+HOLD_ENABLED = os.getenv("HOLD_ENABLED", "true").lower() == "true"
+HOLD_QUEUE_PATH = os.getenv("HOLD_QUEUE_PATH", "bot_held_joins.db")
+HOLD_REPLAY_RATE = float(os.getenv("HOLD_REPLAY_RATE", "5"))  # replays per second
+HOLD_RETRY_BACKOFF = float(os.getenv("HOLD_RETRY_BACKOFF", "10"))  # seconds, doubled per failed replay
+HOLD_RETRY_BACKOFF_MAX = float(os.getenv("HOLD_RETRY_BACKOFF_MAX", "300"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS held (
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    update_json TEXT NOT NULL,
+    held_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    PRIMARY KEY (chat_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS held_due ON held (next_attempt_at);
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class HeldJoinQueue:
+    """Durable queue of join requests waiting for the backend to come back"""
+
+    def __init__(self, breaker, path=HOLD_QUEUE_PATH, replay_rate=HOLD_REPLAY_RATE,
+                 retry_backoff=HOLD_RETRY_BACKOFF, retry_backoff_max=HOLD_RETRY_BACKOFF_MAX):
+        self.breaker = breaker
+        self.path = path
+        self.replay_rate = replay_rate
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        # sqlite3 connections are not thread-safe; all DB work runs on this one thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="held")
+        self._db = None
+        self._replayer = None
+        self._size = 0
+        self.held = 0
+        self.replayed = 0
+
+    # --- DATABASE (runs on the queue thread) ---
+
+    def _open(self):
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.executescript(SCHEMA)
+        return self._db.execute("SELECT COUNT(*) FROM held").fetchone()[0]
+
+    def _insert(self, chat_id, user_id, update_json):
+        now = time.time()
+        # A request that is already held keeps its place and retry schedule
+        cursor = self._db.execute(
+            "INSERT INTO held (chat_id, user_id, update_json, held_at, next_attempt_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (chat_id, user_id) DO NOTHING",
+            (chat_id, user_id, update_json, now, now),
+        )
+        return cursor.rowcount == 1
+
+    def _next_due(self):
+        return self._db.execute(
+            "SELECT chat_id, user_id, update_json, attempts FROM held WHERE next_attempt_at <= ? "
+            "ORDER BY next_attempt_at, held_at LIMIT 1",
+            (time.time(),),
+        ).fetchone()
+
+    def _delete(self, chat_id, user_id):
+        self._db.execute("DELETE FROM held WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
+
+    def _reschedule(self, chat_id, user_id, next_attempt_at):
+        self._db.execute(
+            "UPDATE held SET attempts = attempts + 1, next_attempt_at = ? WHERE chat_id = ? AND user_id = ?",
+            (next_attempt_at, chat_id, user_id),
+        )
+
+    async def _run_db(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    # --- PUBLIC API ---
+
+    async def start(self, replay):
+        """Open the queue and start replaying; `replay(update_dict)` returns True once the request is settled"""
+        self._size = await self._run_db(self._open)
+        self._replayer = asyncio.create_task(self._replay_loop(replay))
+        logger.info(f"⏸️ Held join queue ready at {self.path}: {self._size} request(s) waiting")
+
+    async def stop(self):
+        if self._replayer is not None:
+            self._replayer.cancel()
+            try:
+                await self._replayer
+            except asyncio.CancelledError:
+                pass
+            self._replayer = None
+        if self._db is not None:
+            await self._run_db(self._db.close)
+            self._db = None
+        self._executor.shutdown(wait=False)
+
+    async def hold(self, chat_id, user_id, update_dict) -> bool:
+        """Durably hold one join request; returns False if it was already held"""
+        inserted = await self._run_db(self._insert, chat_id, user_id, json.dumps(update_dict))
+        if inserted:
+            self._size += 1
+            self.held += 1
+            HELD_JOIN_REQUESTS.labels(event="held").inc()
+        return inserted
+
+    async def _replay_loop(self, replay):
+        interval = 1 / self.replay_rate if self.replay_rate > 0 else 1
+        while True:
+            row = None
+            try:
+                if self._size and self.breaker.state != OPEN:
+                    row = await self._run_db(self._next_due)
+            except Exception as e:
+                logger.error(f"❌ Could not read held join requests: {e}")
+            if row is None:
+                # Nothing due, or the backend is still down
+                await asyncio.sleep(max(1.0, self.breaker.retry_in()))
+                continue
+
+            chat_id, user_id, update_json, attempts = row
+            settled = False
+            try:
+                settled = await replay(json.loads(update_json))
+            except Exception as e:
+                logger.error(f"❌ Replay of held join request for {user_id} failed: {e}")
+            try:
+                if settled:
+                    await self._run_db(self._delete, chat_id, user_id)
+                    self._size -= 1
+                    self.replayed += 1
+                    HELD_JOIN_REQUESTS.labels(event="replayed").inc()
+                else:
+                    delay = min(self.retry_backoff_max, self.retry_backoff * 2 ** attempts)
+                    await self._run_db(self._reschedule, chat_id, user_id, time.time() + delay)
+                    HELD_JOIN_REQUESTS.labels(event="replay_failed").inc()
+            except Exception as e:
+                logger.error(f"❌ Could not update held join request for {user_id}: {e}")
+            await asyncio.sleep(interval)
+
+    def __len__(self):
+        return self._size
+
+    def stats(self):
+        return {"waiting": self._size, "held": self.held, "replayed": self.replayed}
@@ -0,0 +1,219 @@
+# Invite Link Pool
+# Keeps a warm pool of pre-created join-request links per channel, so handing
+# a paying user their link is a local lookup instead of a createChatInviteLink
+# call made while they wait.
+#
+# Links live in SQLite; allocation claims a row with a conditional UPDATE, so
+# a link is handed out at most once even across restarts. A background task
+# tops every pooled channel up to LINK_POOL_TARGET links, at most
+# LINK_POOL_REFILL_RATE creations per second, which spreads the Telegram calls
+# of a payment burst over the quiet time before and after it.
+#
+# A channel joins the pool the first time a link is allocated for it (or via
+# LINK_POOL_CHANNELS); that first allocation is created on the spot.
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from telegram.error import RetryAfter, TelegramError
+
+# --- CONFIGURATION ---
+LINK_POOL_ENABLED = os.getenv("LINK_POOL_ENABLED", "true").lower() == "true"
+LINK_POOL_PATH = os.getenv("LINK_POOL_PATH", "bot_links.db")
+LINK_POOL_TARGET = int(os.getenv("LINK_POOL_TARGET", "20"))  # unallocated links kept per channel
+LINK_POOL_REFILL_RATE = float(os.getenv("LINK_POOL_REFILL_RATE", "1"))  # link creations per second
+LINK_POOL_FAILURE_BACKOFF = int(os.getenv("LINK_POOL_FAILURE_BACKOFF", "300"))  # seconds a failing channel rests
+LINK_POOL_CHANNELS = [
+    int(channel_id) for channel_id in os.getenv("LINK_POOL_CHANNELS", "").split(",") if channel_id.strip()
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS links (
+    invite_link TEXT PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    allocated_at REAL,
+    allocated_to TEXT
+);
+CREATE INDEX IF NOT EXISTS links_free ON links (channel_id, allocated_at);
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class LinkPool:
+    """Per-channel pool of unused join-request links"""
+
+    def __init__(self, path=LINK_POOL_PATH, target=LINK_POOL_TARGET, refill_rate=LINK_POOL_REFILL_RATE,
+                 failure_backoff=LINK_POOL_FAILURE_BACKOFF, is_active=None):
+        self.path = path
+        self.target = target
+        self.refill_rate = refill_rate
+        self.failure_backoff = failure_backoff
+        self.is_active = is_active  # channel_id -> bool; inactive channels are not refilled
+        self.bot = None
+        # sqlite3 connections are not thread-safe; all DB work runs on this one thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="links")
+        self._db = None
+        self._free = {}  # {channel_id: deque of unallocated links} - mirrors the DB
+        self._resting = {}  # {channel_id: monotonic time refills may resume}
+        self._wakeup = None
+        self._refiller = None
+        self.allocated = 0
+        self.misses = 0
+        self.created = 0
+        self.failed = 0
+
+    # --- DATABASE (runs on the pool thread) ---
+
+    def _open(self):
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.executescript(SCHEMA)
+
+    def _load_free(self):
+        return self._db.execute(
+            "SELECT channel_id, invite_link FROM links WHERE allocated_at IS NULL ORDER BY created_at"
+        ).fetchall()
+
+    def _insert(self, invite_link, channel_id, allocated_to=None):
+        now = time.time()
+        self._db.execute(
+            "INSERT INTO links (invite_link, channel_id, created_at, allocated_at, allocated_to) VALUES (?, ?, ?, ?, ?)",
+            (invite_link, channel_id, now, now if allocated_to is not None else None, allocated_to),
+        )
+
+    def _claim(self, invite_link, allocated_to):
+        cursor = self._db.execute(
+            "UPDATE links SET allocated_at = ?, allocated_to = ? WHERE invite_link = ? AND allocated_at IS NULL",
+            (time.time(), allocated_to, invite_link),
+        )
+        return cursor.rowcount == 1
+
+    async def _run_db(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    # --- LIFECYCLE ---
+
+    async def start(self, bot, channels=LINK_POOL_CHANNELS):
+        self.bot = bot
+        await self._run_db(self._open)
+        for channel_id, invite_link in await self._run_db(self._load_free):
+            self._free.setdefault(channel_id, deque()).append(invite_link)
+        for channel_id in channels:
+            self._free.setdefault(int(channel_id), deque())
+        self._wakeup = asyncio.Event()
+        self._refiller = asyncio.create_task(self._refill_loop())
+        logger.info(f"🔗 Link pool ready at {self.path}: {sum(map(len, self._free.values()))} link(s) "
+                    f"for {len(self._free)} channel(s), target {self.target} per channel")
+
+    async def stop(self):
+        if self._refiller is not None:
+            self._refiller.cancel()
+            try:
+                await self._refiller
+            except asyncio.CancelledError:
+                pass
+            self._refiller = None
+        if self._db is not None:
+            await self._run_db(self._db.close)
+            self._db = None
+        self._executor.shutdown(wait=False)
+
+    # --- ALLOCATION ---
+
+    async def allocate(self, channel_id, allocated_to=""):
+        """
+        Hand out one unused link for `channel_id`; returns (invite_link, pooled).
+
+        pooled is False when the pool was empty and the link was created on the spot.
+        Raises TelegramError if that creation fails.
+        """
+        channel_id = int(channel_id)
+        free = self._free.setdefault(channel_id, deque())
+        # popleft() runs without awaiting, so two callers never get the same
+        # link; the conditional UPDATE guards against a stale in-memory copy
+        while free:
+            invite_link = free.popleft()
+            if await self._run_db(self._claim, invite_link, allocated_to):
+                self.allocated += 1
+                self._wakeup.set()
+                return invite_link, True
+
+        self.misses += 1
+        self._wakeup.set()
+        invite_link = await self._create(channel_id)
+        await self._run_db(self._insert, invite_link, channel_id, allocated_to)
+        self.allocated += 1
+        return invite_link, False
+
+    async def _create(self, channel_id):
+        link = await self.bot.create_chat_invite_link(
+            chat_id=channel_id, creates_join_request=True, name=f"pool {int(time.time())}",
+        )
+        self.created += 1
+        return link.invite_link
+
+    # --- REFILL ---
+
+    def _neediest(self):
+        """Channel furthest below target that is not resting after a failure"""
+        now = time.monotonic()
+        best, best_deficit = None, 0
+        for channel_id, free in self._free.items():
+            deficit = self.target - len(free)
+            if deficit <= best_deficit or self._resting.get(channel_id, 0) > now:
+                continue
+            if self.is_active is None or self.is_active(channel_id):
+                best, best_deficit = channel_id, deficit
+        return best
+
+    async def _refill_loop(self):
+        interval = 1 / self.refill_rate if self.refill_rate > 0 else 1
+        while True:
+            channel_id = self._neediest()
+            if channel_id is None:
+                self._wakeup.clear()
+                # Wake on allocations, and periodically for rested or newly active channels
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=min(self.failure_backoff, 30))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                invite_link = await self._create(channel_id)
+                await self._run_db(self._insert, invite_link, channel_id)
+                self._free[channel_id].append(invite_link)
+            except RetryAfter as e:
+                # The scheduler already waited out what it could; back off the whole pool
+                logger.warning(f"🐢 Link pool flood-limited, pausing refills: {e}")
+                await asyncio.sleep(self.failure_backoff)
+            except TelegramError as e:
+                # Usually the bot lost its admin rights in this channel
+                self.failed += 1
+                self._resting[channel_id] = time.monotonic() + self.failure_backoff
+                logger.warning(f"⚠️ Could not pre-create a link for {channel_id}, resting it "
+                               f"{self.failure_backoff}s: {e}")
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"❌ Link pool refill failed for {channel_id}: {e}")
+            await asyncio.sleep(interval)
+
+    def stats(self):
+        free = sum(map(len, self._free.values()))
+        return {
+            "channels": len(self._free),
+            "free": free,
+            "below_target": sum(1 for links in self._free.values() if len(links) < self.target),
+            "allocated": self.allocated,
+            "misses": self.misses,
+            "created": self.created,
+            "failed": self.failed,
+        }
@@ -0,0 +1,523 @@
+#!/usr/bin/env python3
+# Join Pipeline Load Test
+# Runs TG_Automation_Enhanced.py against a fake Telegram Bot API and a fake
+# backend on localhost, feeds it synthetic chat_join_request updates at a
+# target rate and reports throughput, latency percentiles and error counts.
+# Nothing leaves the machine - no bot token, channel or backend is needed.
+#
+#   python load_test.py --rps 200 --duration 30
+#   python load_test.py --rps 50 --backend-latency-ms 300 --backend-error-rate 0.05
+#
+# Latency is measured from the moment an update is handed to the bot's
+# getUpdates call until the fake API receives its approve/decline.
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import secrets
+import signal
+import socket
+import sys
+import tempfile
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+
+import httpx
+from aiohttp import web
+from prometheus_client.parser import text_string_to_metric_families
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "TG_Automation_Enhanced.py")
+BOT_TOKEN = "123456:load-test"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Load Test Bot", "username": "load_test_bot"}
+FIRST_USER_ID = 10_000_000
+FIRST_CHANNEL_ID = -1001000000000
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+async def read_params(request):
+    """Bot API parameters arrive form-encoded (values JSON-encoded) or as a JSON body"""
+    if request.content_type == "application/json":
+        return await request.json()
+    params = {}
+    for key, value in (await request.post()).items():
+        try:
+            params[key] = json.loads(value)
+        except (TypeError, ValueError):
+            params[key] = value
+    return params
+
+
+# --- FAKE TELEGRAM BOT API ---
+
+class FakeTelegram:
+    """Serves getUpdates from a queue of synthetic join requests and records what the bot does with them"""
+
+    def __init__(self, latency_ms=0.0, error_rate=0.0):
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.updates = deque()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._new_updates = asyncio.Event()
+        self.polling = asyncio.Event()
+        self.emitted_at = {}   # {(chat_id, user_id): perf_counter when the update was queued}
+        self.latencies = []    # seconds from emit to approve/decline
+        self.decisions = Counter()  # approved / declined / duplicate
+        self.calls = Counter()      # Bot API method -> count
+        self.injected_errors = 0
+        self.last_decision_at = None
+
+    def emit(self, chat_id, user_id, invite_link):
+        now = time.time()
+        self.updates.append({
+            "update_id": next(self._update_ids),
+            "chat_join_request": {
+                "chat": {"id": chat_id, "type": "channel", "title": f"Load Test {chat_id}"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+                "user_chat_id": user_id,
+                "date": int(now),
+                "invite_link": {
+                    "invite_link": invite_link,
+                    "creator": BOT_USER,
+                    "creates_join_request": True,
+                    "is_primary": False,
+                    "is_revoked": False,
+                },
+            },
+        })
+        self.emitted_at[(chat_id, user_id)] = time.perf_counter()
+        self._new_updates.set()
+
+    @property
+    def pending(self):
+        return len(self.emitted_at)
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        params = await read_params(request)
+        self.calls[method] += 1
+
+        if method == "getUpdates":
+            return self._ok(await self._get_updates(params))
+
+        if self.latency:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * self.latency)
+
+        if method in ("approveChatJoinRequest", "declineChatJoinRequest"):
+            if self.error_rate and random.random() < self.error_rate:
+                self.injected_errors += 1
+                return self._error(400, "Bad Request: injected by load test")
+            self._decide(method, params)
+            return self._ok(True)
+        if method == "getMe":
+            return self._ok(BOT_USER)
+        if method in ("sendMessage", "copyMessage", "forwardMessage"):
+            return self._ok({
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "text": params.get("text", ""),
+            })
+        if method == "revokeChatInviteLink":
+            return self._ok({
+                "invite_link": params.get("invite_link", ""),
+                "creator": BOT_USER,
+                "creates_join_request": True,
+                "is_primary": False,
+                "is_revoked": True,
+            })
+        # deleteWebhook, banChatMember, unbanChatMember, ...
+        return self._ok(True)
+
+    async def _get_updates(self, params):
+        self.polling.set()
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        while self.updates and self.updates[0]["update_id"] < offset:
+            self.updates.popleft()
+        if not self.updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        return list(itertools.islice(self.updates, limit))
+
+    def _decide(self, method, params):
+        key = (int(params["chat_id"]), int(params["user_id"]))
+        emitted_at = self.emitted_at.pop(key, None)
+        if emitted_at is None:
+            self.decisions["duplicate"] += 1
+            return
+        now = time.perf_counter()
+        self.latencies.append(now - emitted_at)
+        self.decisions["approved" if method == "approveChatJoinRequest" else "declined"] += 1
+        self.last_decision_at = now
+
+    @staticmethod
+    def _ok(result):
+        return web.json_response({"ok": True, "result": result})
+
+    @staticmethod
+    def _error(code, description):
+        return web.json_response({"ok": False, "error_code": code, "description": description}, status=code)
+
+    def app(self):
+        app = web.Application(client_max_size=10 * 1024 * 1024)
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        return app
+
+
+# --- FAKE BACKEND ---
+
+class FakeBackend:
+    """The backend routes the bot uses, with configurable latency, error and decline rates"""
+
+    def __init__(self, channels, latency_ms=20.0, error_rate=0.0, decline_rate=0.0):
+        self.channels = channels
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.decline_rate = decline_rate
+        self.down = False  # during a simulated outage every call is answered 503
+        self.requests = Counter()  # route -> count
+        self.injected_errors = 0
+        self.validated = Counter()  # approve / decline
+        self.joins_recorded = 0
+
+    async def _delay(self):
+        if self.latency:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * self.latency)
+
+    def _fail(self):
+        if self.down:
+            self.injected_errors += 1
+            return web.json_response({"error": "outage simulated by load test"}, status=503)
+        if self.error_rate and random.random() < self.error_rate:
+            self.injected_errors += 1
+            return web.json_response({"error": "injected by load test"}, status=500)
+        return None
+
+    def _verdict(self):
+        if self.decline_rate and random.random() < self.decline_rate:
+            self.validated["decline"] += 1
+            return {"approve": False, "reason": "Declined by load test"}
+        self.validated["approve"] += 1
+        return {"approve": True, "reason": "Valid link"}
+
+    @web.middleware
+    async def count(self, request, handler):
+        resource = request.match_info.route.resource
+        self.requests[resource.canonical if resource is not None else request.path] += 1
+        return await handler(request)
+
+    async def test_config(self, request):
+        return web.json_response({"success": True})
+
+    async def active_groups(self, request):
+        return web.json_response({
+            "active_channels": [
+                {
+                    "channel_id": str(channel_id),
+                    "admin_id": "load-test-admin",
+                    "name": f"Load Test Bundle {index}",
+                    "group_id": f"group-{index}",
+                    "chat_title": f"Load Test {channel_id}",
+                    "channel_db_id": f"channel-{index}",
+                }
+                for index, channel_id in enumerate(self.channels)
+            ],
+            "mode": "full",
+            "cursor": datetime.now(timezone.utc).isoformat(),
+        })
+
+    async def validate_join(self, request):
+        await self._delay()
+        return self._fail() or web.json_response(self._verdict())
+
+    async def validate_join_batch(self, request):
+        body = await request.json()
+        await self._delay()
+        return self._fail() or web.json_response({"results": [self._verdict() for _ in body.get("requests", [])]})
+
+    async def user_joined(self, request):
+        await self._delay()
+        failed = self._fail()
+        if failed:
+            return failed
+        self.joins_recorded += 1
+        return web.json_response({"success": True})
+
+    async def user_joined_batch(self, request):
+        body = await request.json()
+        await self._delay()
+        failed = self._fail()
+        if failed:
+            return failed
+        events = body.get("events", [])
+        self.joins_recorded += len(events)
+        return web.json_response({"results": [{"success": True} for _ in events]})
+
+    async def expiring_members(self, request):
+        return web.json_response({
+            "members": [],
+            "has_more": False,
+            "cursor": datetime.now(timezone.utc).isoformat(),
+        })
+
+    async def members_kicked(self, request):
+        body = await request.json()
+        return web.json_response({"results": [{"success": True} for _ in body.get("kicks", [])]})
+
+    def app(self):
+        app = web.Application(middlewares=[self.count], client_max_size=10 * 1024 * 1024)
+        app.router.add_get("/api/payment/test-config", self.test_config)
+        app.router.add_get("/api/groups/active", self.active_groups)
+        app.router.add_post("/api/telegram/validate-join", self.validate_join)
+        app.router.add_post("/api/telegram/validate-join/batch", self.validate_join_batch)
+        app.router.add_post("/api/telegram/user-joined", self.user_joined)
+        app.router.add_post("/api/telegram/user-joined/batch", self.user_joined_batch)
+        app.router.add_get("/api/telegram/expiring", self.expiring_members)
+        app.router.add_post("/api/telegram/members/kicked", self.members_kicked)
+        return app
+
+
+# --- DRIVER ---
+
+async def start_site(app, port):
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def generate_load(telegram, channels, rps, duration):
+    """Queue join requests at `rps` for `duration` seconds (unique user per request)"""
+    total = int(rps * duration)
+    started = time.perf_counter()
+    for index in range(total):
+        due = started + index / rps
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        user_id = FIRST_USER_ID + index
+        telegram.emit(channels[index % len(channels)], user_id, f"https://t.me/+loadtest{user_id}")
+    return total, time.perf_counter() - started
+
+
+async def scrape_bot_metrics(control_port):
+    """Join outcomes and reasons as counted by the bot itself"""
+    try:
+        async with httpx.AsyncClient(timeout=5) as client:
+            response = await client.get(f"http://127.0.0.1:{control_port}/metrics")
+    except httpx.HTTPError:
+        return {}
+    if response.status_code != 200:
+        return {}
+    reasons = Counter()
+    for family in text_string_to_metric_families(response.text):
+        if family.name == "bot_join_requests":
+            for sample in family.samples:
+                if sample.name.endswith("_total"):
+                    reasons[f"{sample.labels['outcome']}/{sample.labels['reason']}"] += int(sample.value)
+    return dict(reasons)
+
+
+def start_bot(args, workdir, telegram_port, backend_port, control_port):
+    env = dict(
+        os.environ,
+        BOT_TOKEN=BOT_TOKEN,
+        ADMIN_USER_IDS="1",
+        BOT_MODE="polling",
+        TELEGRAM_API_URL=f"http://127.0.0.1:{telegram_port}/bot",
+        BACKEND_URL=f"http://127.0.0.1:{backend_port}",
+        BOT_CONTROL_HOST="127.0.0.1",
+        BOT_CONTROL_PORT=str(control_port),
+        BOT_CONTROL_TOKEN=secrets.token_hex(16),
+        OUTBOX_PATH=os.path.join(workdir, "bot_outbox.db"),
+        LINK_POOL_PATH=os.path.join(workdir, "bot_links.db"),
+        HOLD_QUEUE_PATH=os.path.join(workdir, "bot_held_joins.db"),
+        DEDUP_PERSIST_PATH=os.path.join(workdir, "bot_dedup.db"),
+        SLOW_REQUEST_LOG=os.path.join(workdir, "slow_requests.log"),
+        PYTHONUNBUFFERED="1",
+    )
+    log = open(os.path.join(workdir, "bot.log"), "w")
+    return asyncio.create_subprocess_exec(
+        sys.executable, args.bot_script,
+        cwd=os.path.dirname(os.path.abspath(args.bot_script)),
+        env=env, stdout=log, stderr=asyncio.subprocess.STDOUT,
+    )
+
+
+async def stop_bot(process, timeout):
+    if process.returncode is not None:
+        return
+    process.send_signal(signal.SIGINT)
+    try:
+        await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+async def run(args):
+    channels = [FIRST_CHANNEL_ID - index for index in range(args.channels)]
+    telegram = FakeTelegram(latency_ms=args.telegram_latency_ms, error_rate=args.telegram_error_rate)
+    backend = FakeBackend(
+        channels, latency_ms=args.backend_latency_ms,
+        error_rate=args.backend_error_rate, decline_rate=args.decline_rate,
+    )
+    telegram_port, backend_port, control_port = free_port(), free_port(), free_port()
+    runners = [
+        await start_site(telegram.app(), telegram_port),
+        await start_site(backend.app(), backend_port),
+    ]
+    workdir = tempfile.mkdtemp(prefix="tg_load_test_")
+
+    print("🧪 JOIN PIPELINE LOAD TEST")
+    print("=" * 60)
+    print(f"   🎯 Target: {args.rps:g} req/s for {args.duration:g}s across {args.channels} channel(s)")
+    print(f"   🗄️ Backend: {args.backend_latency_ms:g} ms, {args.backend_error_rate:.1%} errors, "
+          f"{args.decline_rate:.1%} declines")
+    print(f"   📡 Telegram: {args.telegram_latency_ms:g} ms, {args.telegram_error_rate:.1%} errors")
+    print(f"   📁 Bot logs: {workdir}")
+
+    process = await start_bot(args, workdir, telegram_port, backend_port, control_port)
+    try:
+        try:
+            await asyncio.wait_for(telegram.polling.wait(), args.startup_timeout)
+        except asyncio.TimeoutError:
+            print(f"❌ Bot did not start polling within {args.startup_timeout:g}s - see {workdir}/bot.log")
+            return None
+        # Let the startup channel sync land before the first join request
+        await asyncio.sleep(1)
+
+        print("\n🚀 Sending join requests...")
+        if args.backend_outage:
+            outage_start, outage_seconds = args.backend_outage
+            loop = asyncio.get_running_loop()
+            loop.call_later(outage_start, setattr, backend, "down", True)
+            loop.call_later(outage_start + outage_seconds, setattr, backend, "down", False)
+            print(f"   🔌 Backend outage from {outage_start:g}s to {outage_start + outage_seconds:g}s")
+        started = time.perf_counter()
+        sent, send_seconds = await generate_load(telegram, channels, args.rps, args.duration)
+
+        drain_deadline = time.perf_counter() + args.drain_timeout
+        while telegram.pending and time.perf_counter() < drain_deadline and process.returncode is None:
+            await asyncio.sleep(0.1)
+
+        bot_reasons = await scrape_bot_metrics(control_port)
+    finally:
+        await stop_bot(process, args.stop_timeout)
+        for runner in runners:
+            await runner.cleanup()
+
+    finished_at = telegram.last_decision_at or time.perf_counter()
+    latencies = sorted(telegram.latencies)
+    answered = len(latencies)
+    report = {
+        "target_rps": args.rps,
+        "sent": sent,
+        "send_seconds": round(send_seconds, 3),
+        "answered": answered,
+        "unanswered": telegram.pending,
+        "throughput_rps": round(answered / max(finished_at - started, 1e-9), 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 1),
+            "p95": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99": round(percentile(latencies, 0.99) * 1000, 1),
+            "max": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        },
+        "decisions": dict(telegram.decisions),
+        "errors": {
+            "backend_injected": backend.injected_errors,
+            "telegram_injected": telegram.injected_errors,
+            "unanswered": telegram.pending,
+        },
+        "telegram_calls": dict(telegram.calls),
+        "backend_requests": dict(backend.requests),
+        "backend_joins_recorded": backend.joins_recorded,
+        "bot_outcomes": bot_reasons,
+        "bot_exit_code": process.returncode,
+        "workdir": workdir,
+    }
+    return report
+
+
+def print_report(report):
+    latency = report["latency_ms"]
+    print("\n📊 RESULTS")
+    print("=" * 60)
+    print(f"   📨 Sent: {report['sent']} in {report['send_seconds']}s")
+    print(f"   ✅ Answered: {report['answered']}  ⏳ Unanswered: {report['unanswered']}")
+    print(f"   🚀 Throughput: {report['throughput_rps']} req/s (target {report['target_rps']:g})")
+    print(f"   ⏱️ Latency: p50 {latency['p50']} ms, p95 {latency['p95']} ms, "
+          f"p99 {latency['p99']} ms, max {latency['max']} ms")
+    print(f"   🧾 Decisions: {report['decisions']}")
+    print(f"   ❌ Errors: {report['errors']}")
+    print(f"   📡 Telegram calls: {report['telegram_calls']}")
+    print(f"   🗄️ Backend requests: {report['backend_requests']} "
+          f"({report['backend_joins_recorded']} joins recorded)")
+    if report["bot_outcomes"]:
+        print(f"   🤖 Bot outcomes: {report['bot_outcomes']}")
+
+
+def outage_window(value):
+    try:
+        start, seconds = (float(part) for part in value.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected START,SECONDS")
+    return start, seconds
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline load test for the join request pipeline")
+    parser.add_argument("--rps", type=float, default=50, help="join requests per second")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of load")
+    parser.add_argument("--channels", type=int, default=10, help="managed channels to spread requests over")
+    parser.add_argument("--backend-latency-ms", type=float, default=20, help="mean backend response time")
+    parser.add_argument("--backend-error-rate", type=float, default=0.0, help="fraction of backend calls answered 500")
+    parser.add_argument("--backend-outage", type=outage_window, metavar="START,SECONDS",
+                        help="answer every backend call 503 for SECONDS, starting START seconds into the load")
+    parser.add_argument("--decline-rate", type=float, default=0.0, help="fraction of validations the backend declines")
+    parser.add_argument("--telegram-latency-ms", type=float, default=0, help="mean Bot API response time")
+    parser.add_argument("--telegram-error-rate", type=float, default=0.0,
+                        help="fraction of approve/decline calls answered 400")
+    parser.add_argument("--drain-timeout", type=float, default=30, help="seconds to wait for stragglers after the load")
+    parser.add_argument("--stop-timeout", type=float, default=60,
+                        help="seconds the bot gets to finish queued DMs and revokes on shutdown")
+    parser.add_argument("--startup-timeout", type=float, default=30, help="seconds to wait for the bot to start polling")
+    parser.add_argument("--bot-script", default=BOT_SCRIPT, help="bot entry point to run")
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    report = asyncio.run(run(args))
+    if report is None:
+        sys.exit(1)
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Report written to {args.json_path}")
+    sys.exit(0 if report["unanswered"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# Membership Store
+# SQLite persistence for the single-channel bot's members and their kick
+# times, so expiry state survives restarts.
+#
+# Writes are buffered and committed together (one transaction per flush);
+# the kick job asks for due rows only, served by the index on kick_time.
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# --- CONFIGURATION ---
+MEMBERSHIP_DB_PATH = os.getenv("MEMBERSHIP_DB_PATH", "bot_members.db")
+MEMBERSHIP_FLUSH_INTERVAL = float(os.getenv("MEMBERSHIP_FLUSH_INTERVAL", "1"))  # seconds
+MEMBERSHIP_FLUSH_MAX = int(os.getenv("MEMBERSHIP_FLUSH_MAX", "500"))  # buffered writes before an early flush
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS members (
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    kick_time REAL NOT NULL,
+    joined_at REAL NOT NULL,
+    invite_link TEXT,
+    PRIMARY KEY (chat_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS members_kick_time ON members (kick_time);
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class MembershipStore:
+    """Members with a kick time, persisted in SQLite (WAL) with buffered writes"""
+
+    def __init__(self, path=MEMBERSHIP_DB_PATH, flush_interval=MEMBERSHIP_FLUSH_INTERVAL,
+                 flush_max=MEMBERSHIP_FLUSH_MAX):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_max = flush_max
+        # sqlite3 connections are not thread-safe; all DB work runs on this one thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="members")
+        self._db = None
+        self._buffer = {}  # {(chat_id, user_id): (kick_time, joined_at, invite_link) or None to delete}
+        self._flush_handle = None
+        self._flushing = None
+
+    # --- DATABASE (runs on the store thread) ---
+
+    def _open(self):
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def _write(self, ops):
+        upserts = [
+            (chat_id, user_id, *values)
+            for (chat_id, user_id), values in ops.items() if values is not None
+        ]
+        deletes = [key for key, values in ops.items() if values is None]
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT INTO members (chat_id, user_id, kick_time, joined_at, invite_link) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (chat_id, user_id) DO UPDATE SET "
+                "kick_time = excluded.kick_time, joined_at = excluded.joined_at, "
+                "invite_link = COALESCE(excluded.invite_link, members.invite_link)",
+                upserts,
+            )
+            self._db.executemany("DELETE FROM members WHERE chat_id = ? AND user_id = ?", deletes)
+
+    def _select_all(self):
+        return self._db.execute("SELECT chat_id, user_id, kick_time FROM members").fetchall()
+
+    def _select_due(self, now, limit):
+        return self._db.execute(
+            "SELECT chat_id, user_id, kick_time FROM members WHERE kick_time <= ? ORDER BY kick_time LIMIT ?",
+            (now, limit),
+        ).fetchall()
+
+    async def _run_db(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    # --- PUBLIC API ---
+
+    async def open(self):
+        await self._run_db(self._open)
+
+    async def close(self):
+        """Flush buffered writes and close the database"""
+        await self.flush()
+        if self._db is not None:
+            await self._run_db(self._db.close)
+            self._db = None
+        self._executor.shutdown(wait=False)
+
+    async def load(self):
+        """Warm start: every stored member as [(chat_id, user_id, kick_time)]"""
+        return await self._run_db(self._select_all)
+
+    def upsert(self, chat_id, user_id, kick_time, invite_link=None):
+        """Record (or move) a member's kick time; committed on the next flush"""
+        self._buffer[(chat_id, user_id)] = (kick_time, time.time(), invite_link)
+        self._schedule_flush()
+
+    def remove(self, chat_id, user_id):
+        self._buffer[(chat_id, user_id)] = None
+        self._schedule_flush()
+
+    async def due(self, now=None, limit=100):
+        """Members whose kick time has passed, oldest first"""
+        await self.flush()
+        return await self._run_db(self._select_due, time.time() if now is None else now, limit)
+
+    def _schedule_flush(self):
+        loop = asyncio.get_running_loop()
+        if len(self._buffer) >= self.flush_max:
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+                self._flush_handle = None
+            loop.create_task(self.flush())
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.flush_interval, lambda: loop.create_task(self.flush()))
+
+    async def flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        # One flush at a time, so an older batch can never land after a newer one
+        while self._flushing is not None:
+            await self._flushing
+        if not self._buffer or self._db is None:
+            return
+
+        ops, self._buffer = self._buffer, {}
+        self._flushing = asyncio.get_running_loop().create_future()
+        try:
+            await self._run_db(self._write, ops)
+        except Exception as e:
+            logger.error(f"❌ Failed to persist {len(ops)} membership change(s), will retry: {e}")
+            # Put them back unless a newer write for the same member arrived meanwhile
+            for key, values in ops.items():
+                self._buffer.setdefault(key, values)
+            self._schedule_flush()
+        finally:
+            self._flushing.set_result(None)
+            self._flushing = None
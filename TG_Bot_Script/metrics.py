@@ -0,0 +1,113 @@
+# Bot Metrics
+# Prometheus metrics for the bot, served by the control API at GET /metrics.
+#
+# Modules record into the metrics below; gauges that mirror live objects
+# (update queue, expiry schedule, ...) are wired up by the bot at startup.
+
+import asyncio
+import os
+
+from aiohttp import web
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+
+# --- CONFIGURATION ---
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv("EVENT_LOOP_LAG_INTERVAL", "0.5"))  # seconds between probes
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+REGISTRY = CollectorRegistry()
+
+# --- JOIN REQUESTS ---
+JOIN_REQUEST_SECONDS = Histogram(
+    "bot_join_request_seconds", "End-to-end join request handling time",
+    ["outcome"], buckets=LATENCY_BUCKETS, registry=REGISTRY,
+)
+JOIN_REQUESTS = Counter(
+    "bot_join_requests_total", "Join requests handled, by channel, outcome and reason",
+    ["channel", "outcome", "reason"], registry=REGISTRY,
+)
+
+DEDUP_CHECKS = Counter(
+    "bot_dedup_checks_total", "Join request updates checked for re-delivery, by result",
+    ["result"], registry=REGISTRY,
+)
+
+# --- POST-APPROVAL ---
+POST_APPROVAL_TASKS = Counter(
+    "bot_post_approval_tasks_total", "Post-approval side effects finished, by task and status",
+    ["task", "status"], registry=REGISTRY,
+)
+POST_APPROVAL_TASK_SECONDS = Histogram(
+    "bot_post_approval_task_seconds", "Post-approval side effect duration (including retries)",
+    ["task"], buckets=LATENCY_BUCKETS, registry=REGISTRY,
+)
+
+# --- BACKEND ---
+BACKEND_REQUEST_SECONDS = Histogram(
+    "bot_backend_request_seconds", "Backend API call latency (including retries)",
+    ["endpoint", "status"], buckets=LATENCY_BUCKETS, registry=REGISTRY,
+)
+BACKEND_BREAKER_STATE = Gauge(
+    "bot_backend_breaker_state", "Backend circuit breaker state (0 closed, 1 half-open, 2 open)", registry=REGISTRY,
+)
+BACKEND_BREAKER_TRANSITIONS = Counter(
+    "bot_backend_breaker_transitions_total", "Backend circuit breaker state changes, by new state",
+    ["state"], registry=REGISTRY,
+)
+HELD_JOIN_REQUESTS = Counter(
+    "bot_held_join_requests_total", "Join requests held while the backend was unavailable, and how they ended",
+    ["event"], registry=REGISTRY,
+)
+
+# --- TELEGRAM API ---
+TELEGRAM_CALLS = Counter(
+    "bot_telegram_api_calls_total", "Bot API calls sent, by method",
+    ["method"], registry=REGISTRY,
+)
+TELEGRAM_ERRORS = Counter(
+    "bot_telegram_api_errors_total", "Bot API calls that failed, by method and error type",
+    ["method", "error"], registry=REGISTRY,
+)
+TELEGRAM_QUEUE_WAIT_SECONDS = Histogram(
+    "bot_telegram_queue_wait_seconds", "Time a Bot API call waited in the outbound scheduler",
+    ["priority"], buckets=LATENCY_BUCKETS, registry=REGISTRY,
+)
+
+# --- CHANNEL REGISTRY ---
+CHANNEL_REGISTRY_SIZE = Gauge(
+    "bot_channel_registry_size", "Channels currently managed by the bot", registry=REGISTRY,
+)
+CHANNEL_SYNC_SECONDS = Histogram(
+    "bot_channel_sync_seconds", "Channel registry sync duration (fetch + rebuild)",
+    ["mode"], buckets=LATENCY_BUCKETS, registry=REGISTRY,
+)
+
+# --- RUNTIME ---
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "bot_event_loop_lag_seconds", "How late the event loop woke up a sleeping probe",
+    buckets=LAG_BUCKETS, registry=REGISTRY,
+)
+START_TIME = Gauge("bot_start_time_seconds", "Unix time the bot started", registry=REGISTRY)
+START_TIME.set_to_current_time()
+
+
+def gauge(name, documentation, func):
+    """Register a gauge whose value is read from `func` at scrape time"""
+    metric = Gauge(name, documentation, registry=REGISTRY)
+    metric.set_function(func)
+    return metric
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    """GET /metrics - Prometheus text exposition"""
+    return web.Response(body=generate_latest(REGISTRY), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+async def monitor_event_loop(interval=EVENT_LOOP_LAG_INTERVAL):
+    """Sleep `interval` in a loop and record how much later than asked we woke up"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - started - interval))
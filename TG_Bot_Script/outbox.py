@@ -0,0 +1,307 @@
+# Backend Event Outbox
+# Bot -> backend notifications (user joined, ...) are committed to a local
+# SQLite database (WAL mode) first and delivered by a background task, so the
+# join path never waits on the backend and an outage or restart loses nothing.
+#
+# Enqueues that arrive while a write is in progress are committed together in
+# the next transaction; delivery sends due events in batches (every flush
+# interval, or as soon as a full batch is queued) and backs off exponentially
+# per event on failure.
+
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend_client import BackendError, get_backend
+
+# --- CONFIGURATION ---
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "bot_outbox.db")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_FLUSH_INTERVAL = float(os.getenv("OUTBOX_FLUSH_INTERVAL", "2"))  # longest an event waits for a batch, seconds
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "2"))  # seconds
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "300"))  # seconds
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "50"))  # then parked as dead
+
+# Delivery outcomes
+DELIVERED = "delivered"
+RETRY = "retry"
+DEAD = "dead"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    dead INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (dead, next_attempt_at);
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def _batch_outcomes(results, count):
+    """Map a batch route's per-event {success, retryable} results onto delivery outcomes"""
+    outcomes = []
+    for index in range(count):
+        result = results[index] if index < len(results) else {}
+        if result.get("success"):
+            outcomes.append(DELIVERED)
+        else:
+            outcomes.append(RETRY if result.get("retryable", True) else DEAD)
+    return outcomes
+
+
+async def send_user_joined(payloads):
+    """Deliver user-joined events; falls back to one call per event on backends without the batch route"""
+    backend = get_backend()
+    response = await backend.user_joined_batch({"events": payloads})
+    if response.status_code == 200:
+        return _batch_outcomes(response.json().get("results", []), len(payloads))
+    if response.status_code != 404:
+        raise BackendError(f"user-joined batch returned HTTP {response.status_code}")
+
+    async def send_one(payload):
+        single = await backend.user_joined(payload)
+        if single.status_code == 200:
+            return DELIVERED
+        # The backend rejected this event outright; retrying will not help
+        if 400 <= single.status_code < 500:
+            return DEAD
+        return RETRY
+
+    outcomes = await asyncio.gather(*(send_one(payload) for payload in payloads), return_exceptions=True)
+    return [RETRY if isinstance(outcome, Exception) else outcome for outcome in outcomes]
+
+
+async def send_member_kicked(payloads):
+    """Deliver expiry kicks performed by the bot's expiry engine"""
+    response = await get_backend().members_kicked({"kicks": payloads})
+    if response.status_code != 200:
+        raise BackendError(f"members/kicked returned HTTP {response.status_code}")
+    return _batch_outcomes(response.json().get("results", []), len(payloads))
+
+
+SENDERS = {
+    "user_joined": send_user_joined,
+    "member_kicked": send_member_kicked,
+}
+
+
+class Outbox:
+    """Durable queue of backend events with a background batch flusher"""
+
+    def __init__(self, path=OUTBOX_PATH, senders=SENDERS, batch_size=OUTBOX_BATCH_SIZE,
+                 flush_interval=OUTBOX_FLUSH_INTERVAL, backoff_base=OUTBOX_BACKOFF_BASE,
+                 backoff_max=OUTBOX_BACKOFF_MAX, max_attempts=OUTBOX_MAX_ATTEMPTS):
+        self.path = path
+        self.senders = senders
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_attempts = max_attempts
+        # sqlite3 connections are not thread-safe; all DB work runs on this one thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="outbox")
+        self._db = None
+        self._pending_writes = []  # [(kind, payload_json, future)]
+        self._writer = None
+        self._flusher = None
+        self._wakeup = None  # set once a full batch is waiting
+        self._queued = 0  # events committed since the last flush
+        self.delivered = 0
+        self.failed_attempts = 0
+
+    # --- DATABASE (runs on the outbox thread) ---
+
+    def _open(self):
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.executescript(SCHEMA)
+
+    def _insert(self, rows):
+        now = time.time()
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT INTO outbox (kind, payload, created_at, next_attempt_at) VALUES (?, ?, ?, ?)",
+                [(kind, payload, now, now) for kind, payload in rows],
+            )
+
+    def _fetch_due(self, limit):
+        return self._db.execute(
+            "SELECT id, kind, payload, attempts FROM outbox "
+            "WHERE dead = 0 AND next_attempt_at <= ? ORDER BY next_attempt_at, id LIMIT ?",
+            (time.time(), limit),
+        ).fetchall()
+
+    def _record(self, delivered_ids, retries, dead):
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.executemany("DELETE FROM outbox WHERE id = ?", [(row_id,) for row_id in delivered_ids])
+            self._db.executemany(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                retries,
+            )
+            self._db.executemany(
+                "UPDATE outbox SET attempts = attempts + 1, dead = 1, last_error = ? WHERE id = ?",
+                dead,
+            )
+
+    def _counts(self):
+        pending, oldest = self._db.execute(
+            "SELECT COUNT(*), MIN(created_at) FROM outbox WHERE dead = 0"
+        ).fetchone()
+        dead = self._db.execute("SELECT COUNT(*) FROM outbox WHERE dead = 1").fetchone()[0]
+        return pending, dead, oldest
+
+    async def _run_db(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    # --- PUBLIC API ---
+
+    async def start(self):
+        await self._run_db(self._open)
+        self._wakeup = asyncio.Event()
+        self._flusher = asyncio.create_task(self._flush_loop())
+        pending, dead, _ = await self._run_db(self._counts)
+        logger.info(f"📮 Outbox ready at {self.path}: {pending} pending, {dead} dead event(s)")
+
+    async def stop(self):
+        """Commit outstanding enqueues and stop delivering (undelivered events stay on disk)"""
+        if self._writer is not None:
+            await asyncio.shield(self._writer)
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        if self._db is not None:
+            await self._run_db(self._db.close)
+            self._db = None
+        self._executor.shutdown(wait=False)
+
+    async def enqueue(self, kind, payload):
+        """Durably queue one event; returns once it is committed to disk"""
+        if kind not in self.senders:
+            raise ValueError(f"No sender registered for outbox event '{kind}'")
+        future = asyncio.get_running_loop().create_future()
+        self._pending_writes.append((kind, json.dumps(payload), future))
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write_pending())
+        await future
+
+    async def _write_pending(self):
+        try:
+            while self._pending_writes:
+                batch, self._pending_writes = self._pending_writes, []
+                try:
+                    await self._run_db(self._insert, [(kind, payload) for kind, payload, _ in batch])
+                except Exception as e:
+                    for _, _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+                self._queued += len(batch)
+                if self._wakeup is not None and self._queued >= self.batch_size:
+                    self._wakeup.set()
+        finally:
+            self._writer = None
+
+    async def _flush_loop(self):
+        while True:
+            failed = False
+            try:
+                sent = await self.flush_once()
+            except Exception as e:
+                logger.error(f"❌ Outbox flush failed: {e}")
+                sent, failed = 0, True
+            # Events committed while the flush ran still count toward the next batch
+            self._queued = max(0, self._queued - sent)
+            if failed or (sent < self.batch_size and self._queued < self.batch_size):
+                # Drained (or backing off): let new events gather until a batch fills or the interval ends
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def flush_once(self):
+        """Deliver one batch of due events; returns how many events were attempted"""
+        rows = await self._run_db(self._fetch_due, self.batch_size)
+        if not rows:
+            return 0
+
+        by_kind = {}
+        for row_id, kind, payload, attempts in rows:
+            by_kind.setdefault(kind, []).append((row_id, json.loads(payload), attempts))
+
+        delivered_ids, retries, dead = [], [], []
+        for kind, events in by_kind.items():
+            sender = self.senders.get(kind)
+            if sender is None:
+                dead.extend((f"No sender for '{kind}'", row_id) for row_id, _, _ in events)
+                continue
+            try:
+                outcomes = await sender([payload for _, payload, _ in events])
+                error = "Rejected by backend"
+            except Exception as e:
+                outcomes = [RETRY] * len(events)
+                error = str(e)[:200]
+
+            for (row_id, _, attempts), outcome in zip(events, outcomes):
+                if outcome == DELIVERED:
+                    delivered_ids.append(row_id)
+                elif outcome == DEAD or attempts + 1 >= self.max_attempts:
+                    dead.append((error, row_id))
+                else:
+                    retries.append((time.time() + self._backoff(attempts), error, row_id))
+
+        await self._run_db(self._record, delivered_ids, retries, dead)
+        self.delivered += len(delivered_ids)
+        self.failed_attempts += len(retries) + len(dead)
+        if retries or dead:
+            logger.warning(
+                f"📮 Outbox: {len(delivered_ids)} delivered, {len(retries)} to retry, {len(dead)} dead"
+            )
+        return len(rows)
+
+    def _backoff(self, attempts):
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempts))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def stats(self):
+        pending, dead, oldest = await self._run_db(self._counts)
+        return {
+            "pending": pending,
+            "dead": dead,
+            "oldest_age": round(time.time() - oldest, 1) if oldest else 0.0,
+            "delivered": self.delivered,
+            "failed_attempts": self.failed_attempts,
+        }
+
+
+# --- SHARED INSTANCE ---
+_outbox = None
+
+
+def get_outbox() -> Outbox:
+    global _outbox
+    if _outbox is None:
+        _outbox = Outbox()
+    return _outbox
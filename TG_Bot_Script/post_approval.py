@@ -0,0 +1,136 @@
+# Post-Approval Pipeline
+# Once a join request is approved, the Telegram side effects (revoke the
+# one-time link, welcome DM) run as independent background tasks, so the
+# handler returns as soon as the approval lands and a slow or failing step
+# never delays or drops the other.
+#
+# The backend's join notification is not one of them: it is a local outbox
+# commit, awaited in the handler, so an approved join is always recorded even
+# if these tasks are cancelled at shutdown.
+#
+# Each kind of task has its own retry policy and its own concurrency limit, so
+# a backlog of rate-limited revokes cannot hold back the DMs (or vice versa);
+# every finished task records its status (succeeded / failed / exhausted) and
+# duration in the metrics.
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden
+
+from metrics import POST_APPROVAL_TASK_SECONDS, POST_APPROVAL_TASKS
+
+# --- CONFIGURATION ---
+POST_APPROVAL_MAX_REVOKES = int(os.getenv("POST_APPROVAL_MAX_REVOKES", "100"))  # revokes running at once
+POST_APPROVAL_MAX_DMS = int(os.getenv("POST_APPROVAL_MAX_DMS", "100"))  # welcome DMs running at once
+POST_APPROVAL_DRAIN_TIMEOUT = float(os.getenv("POST_APPROVAL_DRAIN_TIMEOUT", "10"))  # seconds without progress, at shutdown
+
+# Task outcomes
+SUCCEEDED = "succeeded"
+FAILED = "failed"  # permanent error, not retried
+EXHAUSTED = "exhausted"  # retryable error on every attempt
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    attempts: int = 3
+    backoff: float = 1.0  # seconds before the 2nd attempt, doubled after each failure
+    permanent: tuple = ()  # exception types that are never retried
+
+
+# Revoking a link that is already gone, or DMing a user who blocked the bot, will not improve with retries
+REVOKE_POLICY = RetryPolicy(attempts=int(os.getenv("POST_APPROVAL_REVOKE_ATTEMPTS", "5")), permanent=(BadRequest,))
+DM_POLICY = RetryPolicy(attempts=int(os.getenv("POST_APPROVAL_DM_ATTEMPTS", "2")), permanent=(BadRequest, Forbidden))
+
+
+class PostApprovalPipeline:
+    """Runs the side effects of approved join requests concurrently, off the handler's critical path"""
+
+    def __init__(self, max_revokes=POST_APPROVAL_MAX_REVOKES, max_dms=POST_APPROVAL_MAX_DMS):
+        self._slots = {"revoke": asyncio.Semaphore(max_revokes), "dm": asyncio.Semaphore(max_dms)}
+        self._tasks = set()
+        self.submitted = 0
+        self.results = {}  # {(task, status): count}
+
+    def submit(self, bot, chat, user, invite_link_url, welcome_msg):
+        """Start the side effects of one approval; returns immediately"""
+        self.submitted += 1
+        if invite_link_url:
+            self._spawn("revoke", REVOKE_POLICY, user.id,
+                        lambda: bot.revoke_chat_invite_link(chat_id=chat.id, invite_link=invite_link_url))
+        self._spawn("dm", DM_POLICY, user.id,
+                    lambda: bot.send_message(user.id, welcome_msg, parse_mode=ParseMode.MARKDOWN))
+
+    def _spawn(self, name, policy, user_id, call):
+        task = asyncio.create_task(self._run(name, policy, user_id, call))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, name, policy, user_id, call):
+        started = time.perf_counter()
+        status = EXHAUSTED
+        async with self._slots[name]:
+            for attempt in range(1, policy.attempts + 1):
+                try:
+                    await call()
+                    status = SUCCEEDED
+                    break
+                except policy.permanent as e:
+                    logger.warning(f"⚠️ {name} for {user_id} failed permanently: {e}")
+                    status = FAILED
+                    break
+                except Exception as e:
+                    if attempt == policy.attempts:
+                        logger.error(f"❌ {name} for {user_id} failed after {attempt} attempt(s): {e}")
+                        break
+                    logger.warning(f"🔁 {name} for {user_id} failed (attempt {attempt}/{policy.attempts}), retrying: {e}")
+                    await asyncio.sleep(policy.backoff * 2 ** (attempt - 1))
+
+        POST_APPROVAL_TASKS.labels(task=name, status=status).inc()
+        POST_APPROVAL_TASK_SECONDS.labels(task=name).observe(time.perf_counter() - started)
+        self.results[(name, status)] = self.results.get((name, status), 0) + 1
+        return status
+
+    async def drain(self, timeout=POST_APPROVAL_DRAIN_TIMEOUT):
+        """
+        Wait for running side effects (at shutdown, before the bot closes).
+        A queue of rate-limited DMs is let through as long as tasks keep
+        finishing; only `timeout` seconds without any progress cancels the rest.
+        """
+        if not self._tasks:
+            return
+        logger.info(f"⏳ Waiting for {len(self._tasks)} post-approval task(s)")
+        pending = set(self._tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"⚠️ Cancelled {len(pending)} stalled post-approval task(s)")
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def stats(self):
+        summary = {"submitted": self.submitted, "running": len(self._tasks)}
+        for (name, status), count in self.results.items():
+            summary.setdefault(name, {})[status] = count
+        return summary
+
+
+_pipeline = None
+
+
+def get_post_approval():
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = PostApprovalPipeline()
+    return _pipeline
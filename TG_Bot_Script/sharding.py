@@ -0,0 +1,68 @@
+# Channel Sharding
+# Splits the bot's channels across BOT_SHARDS worker processes. bot_ingress.py
+# receives every update and forwards it to the worker that owns its chat; each
+# worker (TG_Automation_Enhanced.py with BOT_MODE=worker) only loads, serves and
+# expires the channels of its own shard.
+#
+# Ownership comes from a consistent hash ring with BOT_SHARD_VNODES points per
+# shard, so going from N to N+1 shards moves only ~1/(N+1) of the channels.
+
+import bisect
+import hashlib
+import os
+
+# --- CONFIGURATION ---
+BOT_SHARDS = int(os.getenv("BOT_SHARDS", "1"))
+BOT_SHARD_INDEX = int(os.getenv("BOT_SHARD_INDEX", "0"))
+BOT_SHARD_VNODES = int(os.getenv("BOT_SHARD_VNODES", "160"))
+
+# Update fields that carry the chat an update belongs to, in lookup order
+CHAT_FIELDS = (
+    "chat_join_request", "message", "edited_message", "channel_post", "edited_channel_post",
+    "my_chat_member", "chat_member",
+)
+
+
+def _point(key):
+    # Stable across processes and restarts, unlike hash()
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring mapping chat ids onto shard numbers"""
+
+    def __init__(self, shards=BOT_SHARDS, vnodes=BOT_SHARD_VNODES):
+        if shards < 1:
+            raise ValueError("need at least one shard")
+        self.shards = shards
+        points = sorted(
+            (_point(f"shard-{shard}#{vnode}"), shard)
+            for shard in range(shards)
+            for vnode in range(vnodes)
+        )
+        self._points = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    def shard_for(self, chat_id) -> int:
+        if self.shards == 1:
+            return 0
+        index = bisect.bisect(self._points, _point(str(chat_id)))
+        return self._owners[index % len(self._owners)]
+
+
+def update_chat_id(update):
+    """Chat id of a raw update dict (None if it has none)"""
+    for field in CHAT_FIELDS:
+        chat = (update.get(field) or {}).get("chat")
+        if chat:
+            return chat.get("id")
+    message = (update.get("callback_query") or {}).get("message") or {}
+    return (message.get("chat") or {}).get("id")
+
+
+ring = HashRing()
+
+
+def owns_channel(channel_id) -> bool:
+    """True if this process serves `channel_id` (always, when not sharded)"""
+    return BOT_SHARDS == 1 or ring.shard_for(channel_id) == BOT_SHARD_INDEX
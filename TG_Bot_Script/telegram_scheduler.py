@@ -0,0 +1,280 @@
+# Outbound Telegram Scheduler
+# Every Bot API call the bot makes goes through here (python-telegram-bot's
+# rate limiter hook), so bursts are queued and paced instead of tripping
+# Telegram's flood limits.
+#
+# - message bucket: ~30 messages/s for the whole bot (Telegram's broadcast limit)
+# - action bucket: approve/decline/revoke/ban calls, which that limit does not
+#   cover; both buckets hand out tokens in priority order
+# - per-chat bucket: messages to one group/channel (20/min)
+# - per-user bucket: DMs to one user (1/s)
+# - RetryAfter: the affected bucket is paused and the call retried
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from datetime import timedelta
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metrics import TELEGRAM_CALLS, TELEGRAM_ERRORS, TELEGRAM_QUEUE_WAIT_SECONDS
+
+# --- CONFIGURATION ---
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))  # messages per second, whole bot
+TELEGRAM_GLOBAL_BURST = int(os.getenv("TELEGRAM_GLOBAL_BURST", "30"))
+TELEGRAM_ACTION_RATE = float(os.getenv("TELEGRAM_ACTION_RATE", "100"))  # non-message calls per second, whole bot
+TELEGRAM_ACTION_BURST = int(os.getenv("TELEGRAM_ACTION_BURST", "100"))
+TELEGRAM_GROUP_RATE = float(os.getenv("TELEGRAM_GROUP_RATE", str(20 / 60)))  # messages per second per group
+TELEGRAM_GROUP_BURST = int(os.getenv("TELEGRAM_GROUP_BURST", "3"))
+TELEGRAM_DM_RATE = float(os.getenv("TELEGRAM_DM_RATE", "1"))  # messages per second per user
+TELEGRAM_DM_BURST = int(os.getenv("TELEGRAM_DM_BURST", "1"))
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+TELEGRAM_MAX_RETRY_AFTER = float(os.getenv("TELEGRAM_MAX_RETRY_AFTER", "60"))  # give up beyond this
+TELEGRAM_MAX_TRACKED_CHATS = int(os.getenv("TELEGRAM_MAX_TRACKED_CHATS", "50000"))
+
+# --- PRIORITY CLASSES ---
+PRIORITY_JOIN = 0      # approve/decline - the user is waiting on these
+PRIORITY_ADMIN = 1     # link revocation, bans, lookups
+PRIORITY_MESSAGE = 2   # welcome/decline/expiry DMs and command replies
+
+PRIORITY_NAMES = {PRIORITY_JOIN: "join", PRIORITY_ADMIN: "admin", PRIORITY_MESSAGE: "message"}
+
+ENDPOINT_PRIORITIES = {
+    "approveChatJoinRequest": PRIORITY_JOIN,
+    "declineChatJoinRequest": PRIORITY_JOIN,
+}
+
+logger = logging.getLogger(__name__)
+
+
+def _is_message(endpoint):
+    return endpoint.startswith("send") or endpoint in ("copyMessage", "forwardMessage")
+
+
+def _is_private(chat_id):
+    # Users have positive ids; groups/channels are negative or @usernames
+    try:
+        return int(chat_id) > 0
+    except (TypeError, ValueError):
+        return False
+
+
+def _seconds(retry_after):
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class TokenBucket:
+    """Reservation-style token bucket: reserve() takes a token and returns how long to wait for it"""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated_at = clock()
+
+    def reserve(self) -> float:
+        now = self.clock()
+        if now > self.updated_at:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+        self.tokens -= 1
+        # updated_at lies in the future while the bucket is paused after a RetryAfter
+        wait = self.updated_at - now
+        if self.tokens < 0:
+            wait += -self.tokens / self.rate
+        return wait
+
+    def pause(self, seconds):
+        """Hand out no tokens for `seconds` (Telegram told us to back off)"""
+        resume_at = self.clock() + seconds
+        if resume_at > self.updated_at:
+            self.tokens = min(self.tokens, 0.0)
+            self.updated_at = resume_at
+
+
+class PriorityGate:
+    """Releases waiters one token at a time, lowest priority number first (FIFO within a class)"""
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._task = None
+
+    def __len__(self):
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, priority):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._dispatch())
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._wakeup.set()
+        await future
+
+    async def _dispatch(self):
+        while True:
+            # Drop waiters whose handler was cancelled
+            while self._waiters and self._waiters[0][2].done():
+                heapq.heappop(self._waiters)
+            if not self._waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            wait = self.bucket.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            # Pop after sleeping so a higher-priority call that arrived meanwhile goes first
+            while self._waiters:
+                _, _, future = heapq.heappop(self._waiters)
+                if not future.done():
+                    future.set_result(None)
+                    break
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class OutboundScheduler(BaseRateLimiter):
+    """
+    Rate limiter for Application.builder().rate_limiter(...).
+    Handlers can override the priority of one call with rate_limit_args={"priority": PRIORITY_...}.
+    """
+
+    def __init__(self, global_rate=TELEGRAM_GLOBAL_RATE, global_burst=TELEGRAM_GLOBAL_BURST,
+                 action_rate=TELEGRAM_ACTION_RATE, action_burst=TELEGRAM_ACTION_BURST,
+                 group_rate=TELEGRAM_GROUP_RATE, group_burst=TELEGRAM_GROUP_BURST,
+                 dm_rate=TELEGRAM_DM_RATE, dm_burst=TELEGRAM_DM_BURST,
+                 max_retries=TELEGRAM_MAX_RETRIES, max_retry_after=TELEGRAM_MAX_RETRY_AFTER,
+                 max_tracked_chats=TELEGRAM_MAX_TRACKED_CHATS):
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.dm_rate = dm_rate
+        self.dm_burst = dm_burst
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self.max_tracked_chats = max_tracked_chats
+        self._messages = PriorityGate(TokenBucket(global_rate, global_burst))
+        self._actions = PriorityGate(TokenBucket(action_rate, action_burst))
+        self._chat_buckets = OrderedDict()  # {chat_id: TokenBucket}
+        self.calls = 0
+        self.retry_afters = 0
+        self.gave_up = 0
+        self._waits = {
+            name: {"count": 0, "total": 0.0, "max": 0.0, "recent": deque(maxlen=1024)}
+            for name in PRIORITY_NAMES.values()
+        }
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        await self._messages.close()
+        await self._actions.close()
+
+    def _priority(self, endpoint, rate_limit_args):
+        if rate_limit_args and "priority" in rate_limit_args:
+            return rate_limit_args["priority"]
+        if endpoint in ENDPOINT_PRIORITIES:
+            return ENDPOINT_PRIORITIES[endpoint]
+        return PRIORITY_MESSAGE if _is_message(endpoint) else PRIORITY_ADMIN
+
+    def _chat_bucket(self, chat_id):
+        key = str(chat_id)
+        bucket = self._chat_buckets.get(key)
+        if bucket is None:
+            if _is_private(chat_id):
+                bucket = TokenBucket(self.dm_rate, self.dm_burst)
+            else:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            self._chat_buckets[key] = bucket
+            while len(self._chat_buckets) > self.max_tracked_chats:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(key)
+        return bucket
+
+    def _record_wait(self, priority, seconds):
+        name = PRIORITY_NAMES.get(priority, "admin")
+        TELEGRAM_QUEUE_WAIT_SECONDS.labels(priority=name).observe(seconds)
+        entry = self._waits[name]
+        entry["count"] += 1
+        entry["total"] += seconds
+        entry["max"] = max(entry["max"], seconds)
+        entry["recent"].append(seconds)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        priority = self._priority(endpoint, rate_limit_args)
+        chat_id = data.get("chat_id")
+        is_message = _is_message(endpoint)
+        # Per-chat and broadcast limits only apply to messages; approve/decline/revoke use the action bucket
+        chat_bucket = self._chat_bucket(chat_id) if chat_id is not None and is_message else None
+        gate = self._messages if is_message else self._actions
+
+        for attempt in itertools.count():
+            queued_at = time.monotonic()
+            if chat_bucket is not None:
+                wait = chat_bucket.reserve()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            await gate.acquire(priority)
+            self._record_wait(priority, time.monotonic() - queued_at)
+            self.calls += 1
+            TELEGRAM_CALLS.labels(method=endpoint).inc()
+
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                TELEGRAM_ERRORS.labels(method=endpoint, error="RetryAfter").inc()
+                retry_after = _seconds(e.retry_after)
+                self.retry_afters += 1
+                if attempt >= self.max_retries or retry_after > self.max_retry_after:
+                    self.gave_up += 1
+                    logger.warning(f"🐢 {endpoint} flood-limited for {retry_after:.0f}s, giving up")
+                    raise
+                if chat_bucket is not None:
+                    scope = f"chat {chat_id}"
+                else:
+                    scope = "all messages" if is_message else "all actions"
+                logger.warning(f"🐢 {endpoint} hit RetryAfter, pausing {scope} for {retry_after:.0f}s")
+                (chat_bucket or gate.bucket).pause(retry_after)
+            except Exception as e:
+                TELEGRAM_ERRORS.labels(method=endpoint, error=type(e).__name__).inc()
+                raise
+
+    def stats(self):
+        waits = {}
+        for name, entry in self._waits.items():
+            recent = sorted(entry["recent"])
+            waits[name] = {
+                "count": entry["count"],
+                "avg_ms": round(entry["total"] / entry["count"] * 1000, 1) if entry["count"] else 0.0,
+                "p95_ms": round(recent[int(len(recent) * 0.95)] * 1000, 1) if recent else 0.0,
+                "max_ms": round(entry["max"] * 1000, 1),
+            }
+        return {
+            "calls": self.calls,
+            "queue_depth": len(self._messages) + len(self._actions),
+            "retry_after": self.retry_afters,
+            "gave_up": self.gave_up,
+            "tracked_chats": len(self._chat_buckets),
+            "wait": waits,
+        }
@@ -1,18 +1,21 @@
 #!/usr/bin/env python3
-import requests
+import asyncio
 import os
 from dotenv import load_dotenv
 import json
 
+from backend_client import close_backend, get_backend
+
 # Load environment variables
 load_dotenv()
 
 backend_url = os.getenv('BACKEND_URL', 'http://localhost:4000')
 
-def test_backend_connection():
+async def check_backend_connection():
+    backend = get_backend()
     try:
         print("🔗 Testing backend connection...")
-        response = requests.get(f'{backend_url}/health', timeout=10)
+        response = await backend.health()
         if response.status_code == 200:
             print(f"✅ Backend connected successfully!")
             data = response.json()
@@ -23,7 +26,7 @@ def test_backend_connection():
             print(f"❌ Backend connection failed: {response.status_code}")
         
         print("\n📺 Testing active channels...")
-        response = requests.get(f'{backend_url}/api/groups/active', timeout=10)
+        response = await backend.active_groups()
         print(f"   Active channels endpoint status: {response.status_code}")
         
         if response.status_code == 200:
@@ -39,5 +42,11 @@ def test_backend_connection():
     except Exception as e:
         print(f"❌ Error testing backend: {e}")
 
+async def main():
+    try:
+        await check_backend_connection()
+    finally:
+        await close_backend()
+
 if __name__ == "__main__":
-    test_backend_connection()
+    asyncio.run(main())
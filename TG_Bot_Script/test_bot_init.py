@@ -2,11 +2,12 @@
 import asyncio
 import logging
 import os
-import requests
 from dotenv import load_dotenv
 from telegram import Bot
 from datetime import datetime
 
+from backend_client import close_backend, get_backend
+
 # Load environment variables
 load_dotenv()
 
@@ -21,8 +22,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-async def test_bot_initialization():
+async def check_bot_initialization():
     """Test bot initialization and channel loading"""
+    backend = get_backend()
     
     if not BOT_TOKEN:
         print("❌ BOT_TOKEN not configured!")
@@ -50,7 +52,7 @@ async def test_bot_initialization():
     # Test backend connection
     try:
         print(f"\n🔗 Testing backend connection...")
-        response = requests.get(f"{BACKEND_URL}/api/payment/test-config", timeout=10)
+        response = await backend.test_config()
         if response.status_code == 200:
             print(f"✅ Backend connection successful!")
         else:
@@ -61,7 +63,7 @@ async def test_bot_initialization():
     # Test channel loading
     try:
         print(f"\n📺 Testing channel loading...")
-        response = requests.get(f"{BACKEND_URL}/api/groups/active", timeout=30)
+        response = await backend.active_groups()
         
         if response.status_code == 200:
             data = response.json()
@@ -90,5 +92,11 @@ async def test_bot_initialization():
     print(f"   ✅ Channel loading: Working")
     print(f"   ✅ All systems ready for operation!")
 
+async def main():
+    try:
+        await check_bot_initialization()
+    finally:
+        await close_backend()
+
 if __name__ == "__main__":
-    asyncio.run(test_bot_initialization())
+    asyncio.run(main())
@@ -1,17 +1,20 @@
 #!/usr/bin/env python3
-import requests
+import asyncio
 import json
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
 
+from backend_client import close_backend, get_backend
+
 # Load environment variables
 load_dotenv()
 
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:4000")
 
-def test_expiry_flow():
+async def check_expiry_flow():
     """Test the complete expiry flow by creating a test expired member"""
+    backend = get_backend()
     
     print("🧪 TESTING EXPIRY FLOW WITH TEST MEMBER")
     print("=" * 60)
@@ -49,11 +52,7 @@ def test_expiry_flow():
             "user_info": test_member_data["user_info"]
         }
         
-        response = requests.post(
-            f"{BACKEND_URL}/api/telegram/validate-join",
-            json=validation_data,
-            timeout=30
-        )
+        response = await backend.validate_join(validation_data)
         
         if response.status_code == 200:
             result = response.json()
@@ -69,7 +68,7 @@ def test_expiry_flow():
     # Step 3: Check current expiry stats
     print("\n3️⃣ CHECKING CURRENT EXPIRY STATS")
     try:
-        response = requests.get(f"{BACKEND_URL}/api/admin/expiry-stats", timeout=10)
+        response = await backend.expiry_stats()
         if response.status_code == 200:
             stats = response.json()
             print(f"   📊 Active members: {stats.get('totalActiveMembers', 0)}")
@@ -84,7 +83,7 @@ def test_expiry_flow():
     # Step 4: Manually trigger expiry check
     print("\n4️⃣ MANUALLY TRIGGERING EXPIRY CHECK")
     try:
-        response = requests.post(f"{BACKEND_URL}/api/admin/kick-expired", timeout=30)
+        response = await backend.kick_expired()
         if response.status_code == 200:
             result = response.json()
             print(f"   ✅ Manual trigger: {result.get('message')}")
@@ -97,7 +96,7 @@ def test_expiry_flow():
     # Step 5: Check stats again
     print("\n5️⃣ CHECKING STATS AFTER MANUAL TRIGGER")
     try:
-        response = requests.get(f"{BACKEND_URL}/api/admin/expiry-stats", timeout=10)
+        response = await backend.expiry_stats()
         if response.status_code == 200:
             stats = response.json()
             print(f"   📊 Active members: {stats.get('totalActiveMembers', 0)}")
@@ -124,5 +123,11 @@ def test_expiry_flow():
     
     print("\n🚀 SYSTEM IS FULLY FUNCTIONAL FOR USER REMOVAL!")
 
+async def main():
+    try:
+        await check_expiry_flow()
+    finally:
+        await close_backend()
+
 if __name__ == "__main__":
-    test_expiry_flow()
+    asyncio.run(main())
@@ -2,12 +2,13 @@
 import asyncio
 import logging
 import os
-import requests
 import json
 from dotenv import load_dotenv
 from telegram import Bot
 from datetime import datetime, timedelta
 
+from backend_client import close_backend, get_backend
+
 # Load environment variables
 load_dotenv()
 
@@ -18,8 +19,9 @@ BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:4000")
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def test_complete_integration():
+async def check_complete_integration():
     """Test complete end-to-end integration flow"""
+    backend = get_backend()
     
     print("🧪 COMPREHENSIVE TELEGRAM BOT INTEGRATION TEST")
     print("=" * 60)
@@ -37,7 +39,7 @@ async def test_complete_integration():
     # Step 2: Test backend health
     print("\n2️⃣ TESTING BACKEND HEALTH")
     try:
-        response = requests.get(f"{BACKEND_URL}/health", timeout=10)
+        response = await backend.health()
         if response.status_code == 200:
             data = response.json()
             print(f"   ✅ Backend healthy: {data['status']}")
@@ -58,11 +60,7 @@ async def test_complete_integration():
             "test_mode": True
         }
         
-        response = requests.post(
-            f"{BACKEND_URL}/api/invite/generate-test-link",
-            json=test_data,
-            timeout=30
-        )
+        response = await backend.generate_test_link(test_data)
         
         if response.status_code == 200:
             result = response.json()
@@ -93,11 +91,7 @@ async def test_complete_integration():
             }
         }
         
-        response = requests.post(
-            f"{BACKEND_URL}/api/telegram/validate-join",
-            json=validation_data,
-            timeout=30
-        )
+        response = await backend.validate_join(validation_data)
         
         print(f"   📡 Validation endpoint status: {response.status_code}")
         if response.status_code == 200:
@@ -113,7 +107,7 @@ async def test_complete_integration():
     # Step 5: Test expiry check
     print("\n5️⃣ TESTING USER EXPIRY CHECK")
     try:
-        response = requests.get(f"{BACKEND_URL}/api/telegram/check-expiry/123456789", timeout=10)
+        response = await backend.check_expiry("123456789")
         if response.status_code == 200:
             result = response.json()
             print(f"   ✅ Expiry check working")
@@ -133,11 +127,7 @@ async def test_complete_integration():
             "joined_at": datetime.now().isoformat()
         }
         
-        response = requests.post(
-            f"{BACKEND_URL}/api/telegram/user-joined",
-            json=join_data,
-            timeout=10
-        )
+        response = await backend.user_joined(join_data)
         
         print(f"   📡 Join tracking status: {response.status_code}")
         if response.status_code == 200:
@@ -150,7 +140,7 @@ async def test_complete_integration():
     # Step 7: Test active channels loading
     print("\n7️⃣ TESTING ACTIVE CHANNELS LOADING")
     try:
-        response = requests.get(f"{BACKEND_URL}/api/groups/active", timeout=10)
+        response = await backend.active_groups()
         if response.status_code == 200:
             data = response.json()
             channels = data.get('active_channels', [])
@@ -185,5 +175,11 @@ async def test_complete_integration():
     print("   • Multi-channel management is working")
     print("\n🔥 YOUR TELEGRAM BOT IS PERFECTLY LINKED TO THE BACKEND!")
 
+async def main():
+    try:
+        await check_complete_integration()
+    finally:
+        await close_backend()
+
 if __name__ == "__main__":
-    asyncio.run(test_complete_integration())
+    asyncio.run(main())
@@ -2,12 +2,13 @@
 import asyncio
 import logging
 import os
-import requests
 import json
 from dotenv import load_dotenv
 from telegram import Bot
 from datetime import datetime, timedelta
 
+from backend_client import close_backend, get_backend
+
 # Load environment variables
 load_dotenv()
 
@@ -18,8 +19,9 @@ BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:4000")
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def test_removal_system():
+async def check_removal_system():
     """Test complete removal/expiry system flow"""
+    backend = get_backend()
     
     print("🧪 COMPREHENSIVE REMOVAL SYSTEM TEST")
     print("=" * 60)
@@ -28,7 +30,7 @@ async def test_removal_system():
     # Step 1: Test Channel Expiry Service Status
     print("\n1️⃣ TESTING BACKEND EXPIRY SERVICE STATUS")
     try:
-        response = requests.get(f"{BACKEND_URL}/api/admin/expiry-stats", timeout=10)
+        response = await backend.expiry_stats()
         if response.status_code == 200:
             stats = response.json()
             print(f"   ✅ Expiry service status: {'Running' if stats.get('serviceRunning') else 'Stopped'}")
@@ -43,7 +45,7 @@ async def test_removal_system():
     # Step 2: Test Manual Expiry Trigger
     print("\n2️⃣ TESTING MANUAL EXPIRY TRIGGER")
     try:
-        response = requests.post(f"{BACKEND_URL}/api/admin/kick-expired", timeout=30)
+        response = await backend.kick_expired()
         if response.status_code == 200:
             result = response.json()
             print(f"   ✅ Manual expiry check: {result.get('message')}")
@@ -98,11 +100,7 @@ async def test_removal_system():
             "channel_id": "-1002842114460"
         }
         
-        response = requests.post(
-            f"{BACKEND_URL}/api/telegram/notify-kick",
-            json=kick_data,
-            timeout=10
-        )
+        response = await backend.notify_kick(kick_data)
         
         if response.status_code == 200:
             result = response.json()
@@ -118,7 +116,7 @@ async def test_removal_system():
     print("\n5️⃣ TESTING CHANNEL MEMBER DATABASE")
     try:
         # Check if we can access channel members data
-        response = requests.get(f"{BACKEND_URL}/api/channel-members", timeout=10)
+        response = await backend.channel_members()
         
         if response.status_code == 200:
             members_data = response.json()
@@ -151,11 +149,7 @@ async def test_removal_system():
         }
         
         # This might not exist, but let's check
-        response = requests.post(
-            f"{BACKEND_URL}/api/telegram/request-recovery",
-            json=test_recovery_data,
-            timeout=10
-        )
+        response = await backend.request_recovery(test_recovery_data)
         
         if response.status_code == 200:
             print(f"   ✅ Recovery system: Available")
@@ -193,5 +187,11 @@ async def test_removal_system():
     print("   • Database tracks all kick events for audit")
     print("   • Users can rejoin with new subscriptions")
 
+async def main():
+    try:
+        await check_removal_system()
+    finally:
+        await close_backend()
+
 if __name__ == "__main__":
-    asyncio.run(test_removal_system())
+    asyncio.run(main())
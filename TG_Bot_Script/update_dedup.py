@@ -0,0 +1,215 @@
+# Join Request Deduplication
+# Telegram re-delivers updates after a restart or a slow getUpdates
+# acknowledgement. Without a guard each copy costs a backend validation, an
+# approve that fails with "Hide_requester_missing" and sometimes a second
+# welcome DM.
+#
+# Every join request is checked against a bounded, time-windowed LRU before
+# any network I/O, under two keys:
+#   - its update_id (the same delivery seen again)
+#   - (chat, user, invite link), held while the request is in flight and kept
+#     once it was approved or held; a decline releases it, so a genuine new
+#     request on the same link still reaches the decline cache
+#
+# With DEDUP_PERSIST_PATH set, finished keys are also written (in batches) to
+# SQLite and loaded back at startup, which covers re-delivery after a restart.
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import DEDUP_CHECKS
+
+# --- CONFIGURATION ---
+DEDUP_TTL = float(os.getenv("DEDUP_TTL", "3600"))  # seconds a key is remembered
+DEDUP_MAX_ENTRIES = int(os.getenv("DEDUP_MAX_ENTRIES", "100000"))
+DEDUP_PERSIST_PATH = os.getenv("DEDUP_PERSIST_PATH", "bot_dedup.db")  # "" keeps the window in memory only
+DEDUP_FLUSH_INTERVAL = float(os.getenv("DEDUP_FLUSH_INTERVAL", "1"))  # seconds
+
+# Check results
+FRESH = "fresh"
+DUPLICATE_UPDATE = "duplicate_update"
+DUPLICATE_JOIN = "duplicate_join"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen (
+    key TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS seen_expires_at ON seen (expires_at);
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class SeenWindow:
+    """Bounded LRU of keys that expire `ttl` seconds after they were added"""
+
+    def __init__(self, ttl=DEDUP_TTL, max_entries=DEDUP_MAX_ENTRIES, clock=time.time):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()  # {key: expires_at}, oldest first
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        expires_at = self._entries.get(key)
+        if expires_at is None:
+            return False
+        if expires_at <= self.clock():
+            del self._entries[key]
+            return False
+        return True
+
+    def add(self, key, expires_at=None):
+        self._entries[key] = self.clock() + self.ttl if expires_at is None else expires_at
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return self._entries[key]
+
+    def discard(self, key):
+        self._entries.pop(key, None)
+
+
+def update_key(update):
+    return f"u:{update.update_id}"
+
+
+def join_key(update):
+    request = update.chat_join_request
+    invite_link = request.invite_link.invite_link if request.invite_link else ""
+    return f"j:{request.chat.id}:{request.from_user.id}:{invite_link}"
+
+
+class JoinDeduplicator:
+    """Drops re-delivered join requests; optionally remembers them across restarts"""
+
+    def __init__(self, ttl=DEDUP_TTL, max_entries=DEDUP_MAX_ENTRIES, persist_path=DEDUP_PERSIST_PATH,
+                 flush_interval=DEDUP_FLUSH_INTERVAL):
+        self.window = SeenWindow(ttl, max_entries)
+        self.persist_path = persist_path
+        self.flush_interval = flush_interval
+        # sqlite3 connections are not thread-safe; all DB work runs on this one thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dedup")
+        self._db = None
+        self._buffer = {}  # {key: expires_at} waiting to be written
+        self._flush_handle = None
+        self.checks = 0
+        self.duplicates = 0
+
+    # --- DATABASE (runs on the dedup thread) ---
+
+    def _open(self):
+        self._db = sqlite3.connect(self.persist_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._db.execute("DELETE FROM seen WHERE expires_at <= ?", (time.time(),))
+        return self._db.execute("SELECT key, expires_at FROM seen ORDER BY expires_at").fetchall()
+
+    def _write(self, rows):
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT INTO seen (key, expires_at) VALUES (?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET expires_at = excluded.expires_at",
+                rows,
+            )
+            self._db.execute("DELETE FROM seen WHERE expires_at <= ?", (time.time(),))
+
+    async def _run_db(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    # --- LIFECYCLE ---
+
+    async def start(self):
+        if not self.persist_path:
+            return
+        rows = await self._run_db(self._open)
+        for key, expires_at in rows:
+            self.window.add(key, expires_at)
+        logger.info(f"🔁 Dedup window warm-started from {self.persist_path}: {len(rows)} key(s)")
+
+    async def stop(self):
+        await self.flush()
+        if self._db is not None:
+            await self._run_db(self._db.close)
+            self._db = None
+        self._executor.shutdown(wait=False)
+
+    # --- PUBLIC API ---
+
+    def begin(self, update):
+        """
+        Check a join request update before any I/O.
+
+        Returns FRESH (and marks it as in flight) or the duplicate kind.
+        Every FRESH result must be followed by finish().
+        """
+        self.checks += 1
+        if update_key(update) in self.window:
+            result = DUPLICATE_UPDATE
+        elif join_key(update) in self.window:
+            result = DUPLICATE_JOIN
+        else:
+            result = FRESH
+            self.window.add(update_key(update))
+            self.window.add(join_key(update))
+        if result != FRESH:
+            self.duplicates += 1
+        DEDUP_CHECKS.labels(result=result).inc()
+        return result
+
+    def finish(self, update, keep):
+        """
+        Done with a request: its update_id is remembered either way; the
+        (chat, user, link) key only if `keep` (approved or held)
+        """
+        self._persist(update_key(update), self.window.add(update_key(update)))
+        if keep:
+            self._persist(join_key(update), self.window.add(join_key(update)))
+        else:
+            self.window.discard(join_key(update))
+
+    def _persist(self, key, expires_at):
+        if not self.persist_path or self._db is None:
+            return
+        self._buffer[key] = expires_at
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.flush_interval, lambda: loop.create_task(self.flush()))
+
+    async def flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._buffer or self._db is None:
+            return
+        rows, self._buffer = list(self._buffer.items()), {}
+        try:
+            await self._run_db(self._write, rows)
+        except Exception as e:
+            # The in-memory window still has them; only restart protection is lost
+            logger.warning(f"⚠️ Could not persist {len(rows)} dedup key(s): {e}")
+
+    def __len__(self):
+        return len(self.window)
+
+    def stats(self):
+        return {
+            "size": len(self.window),
+            "checks": self.checks,
+            "duplicates": self.duplicates,
+            "hit_rate": round(self.duplicates / self.checks, 4) if self.checks else 0.0,
+            "evictions": self.window.evictions,
+            "persistent": bool(self.persist_path),
+        }
@@ -0,0 +1,104 @@
+# Keyed Concurrent Update Processor
+# Lets python-telegram-bot process updates concurrently while keeping every
+# update for the same (chat, user) pair strictly in arrival order.
+
+import asyncio
+import contextlib
+import logging
+import os
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# --- CONFIGURATION ---
+BOT_MAX_CONCURRENT_UPDATES = int(os.getenv("BOT_MAX_CONCURRENT_UPDATES", "64"))
+BOT_MAX_PENDING_UPDATES = int(os.getenv("BOT_MAX_PENDING_UPDATES", "10000"))
+
+logger = logging.getLogger(__name__)
+
+
+def update_key(update):
+    """Ordering key for an update: (chat_id, user_id), or None if unordered"""
+    if not isinstance(update, Update):
+        return None
+    if update.chat_join_request:
+        request = update.chat_join_request
+        return (request.chat.id, request.from_user.id)
+    chat = update.effective_chat
+    user = update.effective_user
+    if chat is None and user is None:
+        return None
+    return (chat.id if chat else None, user.id if user else None)
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Runs up to `max_workers` updates at once.
+
+    Updates sharing a key wait for their predecessor before taking a worker
+    slot, so a queued duplicate never blocks unrelated chats. The base class
+    semaphore caps how many updates may be pending in total.
+    """
+
+    def __init__(self, max_workers=BOT_MAX_CONCURRENT_UPDATES, max_pending=BOT_MAX_PENDING_UPDATES):
+        super().__init__(max_concurrent_updates=max(max_pending, max_workers))
+        self.max_workers = max_workers
+        self._workers = None
+        self._key_locks = {}  # {key: [asyncio.Lock, holders]}
+        self._pending = 0
+        self._in_flight = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Updates received but waiting for their key or a worker slot"""
+        return self._pending
+
+    @property
+    def in_flight(self) -> int:
+        """Updates currently being handled"""
+        return self._in_flight
+
+    def stats(self):
+        return {
+            "max_workers": self.max_workers,
+            "queue_depth": self._pending,
+            "in_flight": self._in_flight,
+            "ordered_keys": len(self._key_locks),
+        }
+
+    async def initialize(self) -> None:
+        self._workers = asyncio.Semaphore(self.max_workers)
+
+    async def shutdown(self) -> None:
+        if self._in_flight or self._pending:
+            logger.info(f"Update processor shutting down with {self._in_flight} in flight, {self._pending} queued")
+
+    async def do_process_update(self, update, coroutine) -> None:
+        if self._workers is None:
+            await self.initialize()
+
+        key = update_key(update)
+        entry = None
+        if key is not None:
+            entry = self._key_locks.setdefault(key, [asyncio.Lock(), 0])
+            entry[1] += 1
+
+        self._pending += 1
+        started = False
+        try:
+            async with entry[0] if entry else contextlib.nullcontext():
+                async with self._workers:
+                    self._pending -= 1
+                    started = True
+                    self._in_flight += 1
+                    try:
+                        await coroutine
+                    finally:
+                        self._in_flight -= 1
+        finally:
+            if not started:
+                self._pending -= 1
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._key_locks[key]
@@ -0,0 +1,139 @@
+# Validate-Join Micro-Batcher
+# Coalesces join-request validations that arrive close together into one
+# call to /api/telegram/validate-join/batch.
+#
+# When the bot is idle a request is sent straight away on the single
+# endpoint, so light traffic sees no extra latency. Only while another
+# validation is already in flight do new requests wait (at most
+# BACKEND_VALIDATE_BATCH_WINDOW_MS) to be sent together.
+
+import asyncio
+import logging
+import os
+
+from backend_client import BackendError, get_backend
+
+# --- CONFIGURATION ---
+BACKEND_VALIDATE_BATCH_MAX = int(os.getenv("BACKEND_VALIDATE_BATCH_MAX", "50"))
+BACKEND_VALIDATE_BATCH_WINDOW_MS = float(os.getenv("BACKEND_VALIDATE_BATCH_WINDOW_MS", "10"))
+
+logger = logging.getLogger(__name__)
+
+
+class ValidationBatcher:
+    """Hands each caller the backend verdict for its own validation payload"""
+
+    def __init__(self, backend_factory=get_backend, max_batch=BACKEND_VALIDATE_BATCH_MAX,
+                 window_ms=BACKEND_VALIDATE_BATCH_WINDOW_MS):
+        self.backend_factory = backend_factory
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self._pending = []  # [(payload, future)]
+        self._timer = None
+        self._in_flight = 0
+        self._batch_supported = True
+        self.requests_sent = 0
+        self.items_validated = 0
+
+    async def validate(self, payload) -> dict:
+        """
+        Validate one join request.
+
+        Returns the backend verdict ({"approve": bool, "reason": ...}).
+        Raises BackendError if the backend is unreachable or answers non-200.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((payload, future))
+
+        if len(self._pending) >= self.max_batch or self._in_flight == 0:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+
+        return await future
+
+    def stats(self):
+        return {
+            "requests_sent": self.requests_sent,
+            "items_validated": self.items_validated,
+            "pending": len(self._pending),
+            "in_flight": self._in_flight,
+        }
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._pending:
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            self._in_flight += 1
+            asyncio.create_task(self._send(batch))
+
+    async def _send(self, batch):
+        try:
+            verdicts = await self._request(batch)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e if isinstance(e, BackendError) else BackendError(str(e)))
+        else:
+            for (_, future), verdict in zip(batch, verdicts):
+                if future.done():
+                    continue
+                if isinstance(verdict, BaseException):
+                    future.set_exception(verdict)
+                else:
+                    future.set_result(verdict)
+        finally:
+            self._in_flight -= 1
+            # Anything that queued up behind this request goes out now
+            if self._pending and self._in_flight == 0:
+                self._flush()
+
+    async def _request(self, batch):
+        backend = self.backend_factory()
+        self.requests_sent += 1
+        self.items_validated += len(batch)
+
+        if len(batch) > 1 and self._batch_supported:
+            response = await backend.validate_join_batch({"requests": [payload for payload, _ in batch]})
+            if response.status_code == 200:
+                results = response.json().get("results", [])
+                if len(results) != len(batch):
+                    raise BackendError(f"Batch validation returned {len(results)} results for {len(batch)} requests")
+                return results
+            if response.status_code != 404:
+                raise BackendError(
+                    f"Batch validation failed with status {response.status_code}: {response.text[:200]}",
+                    status_code=response.status_code,
+                )
+            # Older backend without the batch endpoint
+            logger.warning("⚠️ Backend has no batch validation endpoint, falling back to single requests")
+            self._batch_supported = False
+
+        return await asyncio.gather(
+            *(self._validate_single(backend, payload) for payload, _ in batch),
+            return_exceptions=True,
+        )
+
+    async def _validate_single(self, backend, payload):
+        response = await backend.validate_join(payload)
+        if response.status_code != 200:
+            raise BackendError(
+                f"Backend validation failed with status {response.status_code}: {response.text[:200]}",
+                status_code=response.status_code,
+            )
+        return response.json()
+
+
+# --- SHARED INSTANCE ---
+_batcher = None
+
+
+def get_validation_batcher() -> ValidationBatcher:
+    global _batcher
+    if _batcher is None:
+        _batcher = ValidationBatcher()
+    return _batcher
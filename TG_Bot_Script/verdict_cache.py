@@ -0,0 +1,130 @@
+# Decline Verdict Cache and Join Throttle
+# Lets the bot decline repeat join requests on a dead link locally,
+# without another backend validation or another decline DM.
+
+import os
+import time
+from collections import OrderedDict
+
+# --- CONFIGURATION ---
+DECLINE_CACHE_TTL = float(os.getenv("DECLINE_CACHE_TTL", "300"))  # seconds
+DECLINE_CACHE_MAX_ENTRIES = int(os.getenv("DECLINE_CACHE_MAX_ENTRIES", "10000"))
+JOIN_THROTTLE_RATE = float(os.getenv("JOIN_THROTTLE_RATE", "0.1"))  # tokens per second
+JOIN_THROTTLE_BURST = int(os.getenv("JOIN_THROTTLE_BURST", "5"))
+JOIN_THROTTLE_MAX_USERS = int(os.getenv("JOIN_THROTTLE_MAX_USERS", "50000"))  # (user, channel) pairs tracked
+
+
+class DeclineCache:
+    """
+    Bounded LRU of recent decline verdicts keyed by (invite_link, user_id, channel_id).
+    Entries expire after `ttl` seconds; the oldest entry is evicted when full.
+    """
+
+    def __init__(self, ttl=DECLINE_CACHE_TTL, max_entries=DECLINE_CACHE_MAX_ENTRIES, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()  # {key: (expires_at, reason)}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached decline reason for `key`, or None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, reason = entry
+        if expires_at <= self.clock():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return reason
+
+    def put(self, key, reason):
+        self._entries[key] = (self.clock() + self.ttl, reason)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id, invite_link=None, channel_id=None):
+        """Drop every entry for `user_id`, optionally narrowed to one link/channel"""
+        doomed = [
+            key for key in self._entries
+            if key[1] == user_id
+            and (invite_link is None or key[0] == invite_link)
+            and (channel_id is None or key[2] == channel_id)
+        ]
+        for key in doomed:
+            del self._entries[key]
+        self.invalidations += len(doomed)
+        return len(doomed)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+class JoinThrottle:
+    """
+    Token bucket per (user, channel) for repeat join requests (bounded, least
+    recently seen pairs dropped first). The first request for a pair costs
+    nothing, so a customer opening every link of a large bundle at once is
+    never throttled; only coming back to the same channel again and again is.
+    """
+
+    def __init__(self, rate=JOIN_THROTTLE_RATE, burst=JOIN_THROTTLE_BURST,
+                 max_users=JOIN_THROTTLE_MAX_USERS, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self.clock = clock
+        self._buckets = OrderedDict()  # {(user_id, channel_id): [tokens, updated_at]}
+        self.throttled = 0
+
+    def allow(self, user_id, channel_id) -> bool:
+        """Charge a repeat request of `user_id` in `channel_id`; False when they are over the limit"""
+        now = self.clock()
+        key = (user_id, channel_id)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            # A first request is free; only requests that come back are charged
+            self._buckets[key] = [float(self.burst), now]
+            while len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+            return True
+        self._buckets.move_to_end(key)
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return True
+        self.throttled += 1
+        return False
+
+    def reset(self, user_id, channel_id=None):
+        """Forget `user_id`'s buckets, optionally only the one for `channel_id`"""
+        if channel_id is not None:
+            self._buckets.pop((user_id, channel_id), None)
+            return
+        for key in [key for key in self._buckets if key[0] == user_id]:
+            del self._buckets[key]
+
+    def stats(self):
+        return {"tracked_pairs": len(self._buckets), "throttled": self.throttled}
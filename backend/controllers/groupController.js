@@ -221,15 +221,51 @@ const getDefaultGroup = async (req, res) => {
 };
 
 // Get active groups for Telegram bot (Public endpoint)
+// Delta cursors are moved back a little so updates racing with the query
+// are picked up again on the next sync (applying them twice is harmless)
+const ACTIVE_SYNC_CURSOR_OVERLAP_MS = 5000;
+
 const getActiveGroups = async (req, res) => {
   try {
+    const { updated_since } = req.query;
+
+    // Conditional request: unchanged registry costs one aggregate and a 304
+    const etag = `W/"channels-${await groupService.getActiveChannelsVersion()}"`;
+    res.set('ETag', etag);
+    if (req.headers['if-none-match'] === etag) {
+      return res.status(304).end();
+    }
+
+    const cursor = new Date(Date.now() - ACTIVE_SYNC_CURSOR_OVERLAP_MS).toISOString();
+
+    // Delta request: only groups changed since the bot's last cursor
+    if (updated_since) {
+      const since = new Date(updated_since);
+      if (isNaN(since.getTime())) {
+        return res.status(400).json({ message: 'updated_since must be an ISO date' });
+      }
+
+      const { changedGroupIds, removedGroupIds, channels } = await groupService.getChangedChannelsForBot(since);
+      return res.json({
+        success: true,
+        mode: 'delta',
+        changed_groups: changedGroupIds,
+        removed_groups: removedGroupIds,
+        active_channels: channels,
+        count: channels.length,
+        cursor
+      });
+    }
+
     // Use the new service method that handles both legacy and multi-channel groups
     const activeChannels = await groupService.getActiveChannelsForBot();
     
     res.json({
       success: true,
+      mode: 'full',
       active_channels: activeChannels,
-      count: activeChannels.length
+      count: activeChannels.length,
+      cursor
     });
   } catch (error) {
     console.error('Get active groups error:', error);
@@ -333,7 +369,7 @@ const getGroupByRoute = async (req, res) => {
 const addChannelToGroup = async (req, res) => {
   try {
     const { id: groupId } = req.params;
-    const { chatId, chatType, chatTitle } = req.body;
+    const { chatId, chatType, chatTitle, joinLink } = req.body;
 
     if (!chatId) {
       return res.status(400).json({
@@ -380,7 +416,8 @@ const addChannelToGroup = async (req, res) => {
 
     const updatedGroup = await groupService.addChannelToGroup(groupId, {
       chatId,
-      chatTitle
+      chatTitle,
+      joinLink
     });
 
     res.json({
@@ -389,6 +426,13 @@ const addChannelToGroup = async (req, res) => {
       message: 'Channel added successfully'
     });
   } catch (error) {
+    // Lost a race with a concurrent add of the same channel
+    if (error.message === 'Channel already exists in this bundle') {
+      return res.status(409).json({
+        success: false,
+        message: error.message
+      });
+    }
     console.error('Add channel error:', error);
     res.status(500).json({
       success: false,
@@ -454,6 +498,14 @@ const generateChannelJoinLink = async (req, res) => {
     });
   } catch (error) {
     console.error('Generate join link error:', error);
+    if (error.retryAfter) {
+      res.set('Retry-After', String(error.retryAfter));
+      return res.status(429).json({
+        success: false,
+        retry_after: error.retryAfter,
+        message: error.message
+      });
+    }
     res.status(500).json({
       success: false,
       message: error.message
@@ -143,6 +143,175 @@ const validateJoinRequest = async (req, res) => {
   }
 };
 
+// Maximum number of join requests accepted by the batch validation endpoint
+const MAX_VALIDATION_BATCH = 100;
+
+// Batch variant of validateJoinRequest used by the bot during join storms.
+// Resolves every invite link, payment and channel member in a handful of
+// queries instead of several round trips per request.
+// Results are returned in the same order as the requests.
+const validateJoinBatch = async (req, res) => {
+  try {
+    const { requests } = req.body;
+
+    if (!Array.isArray(requests) || requests.length === 0) {
+      return res.status(400).json({ error: 'requests must be a non-empty array' });
+    }
+    if (requests.length > MAX_VALIDATION_BATCH) {
+      return res.status(400).json({ error: `At most ${MAX_VALIDATION_BATCH} requests per batch` });
+    }
+
+    const ChannelMember = require('../models/ChannelMember');
+    const PaymentLink = require('../models/paymentLinkModel');
+
+    const results = new Array(requests.length);
+    const pending = [];
+
+    requests.forEach((item, index) => {
+      if (!item || !item.invite_link || !item.telegram_user_id) {
+        results[index] = {
+          approve: false,
+          reason: 'Missing required fields: invite_link and telegram_user_id'
+        };
+      } else {
+        pending.push({ index, item });
+      }
+    });
+
+    // 1. Resolve all unused links at once
+    const links = [...new Set(pending.map(({ item }) => item.invite_link))];
+    const linkRecords = await InviteLink.find({ link: { $in: links }, is_used: false }).lean();
+    const linksByUrl = new Map(linkRecords.map(record => [record.link, record]));
+
+    // A link can only be used once, even inside a single batch
+    const claims = [];
+    const claimedLinks = new Set();
+    pending.forEach(({ index, item }) => {
+      const linkRecord = linksByUrl.get(item.invite_link);
+      if (!linkRecord || claimedLinks.has(item.invite_link)) {
+        results[index] = { approve: false, reason: 'Link not found or already used' };
+        return;
+      }
+      claimedLinks.add(item.invite_link);
+      claims.push({ index, item, linkRecord });
+    });
+
+    if (claims.length === 0) {
+      return res.status(200).json({ results });
+    }
+
+    // 2. Mark links as used. The is_used filter keeps this safe against a
+    // concurrent single validation; the re-read tells us which claims won.
+    const joinTime = new Date();
+    await InviteLink.bulkWrite(claims.map(({ item, linkRecord }) => ({
+      updateOne: {
+        filter: { _id: linkRecord._id, is_used: false },
+        update: {
+          is_used: true,
+          used_by: item.telegram_user_id,
+          used_at: joinTime,
+          telegramUserId: item.telegram_user_id
+        }
+      }
+    })), { ordered: false });
+
+    const wonIds = new Set((await InviteLink.find({
+      _id: { $in: claims.map(({ linkRecord }) => linkRecord._id) },
+      used_at: joinTime
+    }).select('_id used_by').lean())
+      .map(record => `${record._id}:${record.used_by}`));
+
+    const approved = claims.filter(({ index, item, linkRecord }) => {
+      if (wonIds.has(`${linkRecord._id}:${item.telegram_user_id}`)) return true;
+      results[index] = { approve: false, reason: 'Link not found or already used' };
+      return false;
+    });
+
+    // 3. Resolve subscription expiry from payments in two queries at most
+    const paymentIds = approved
+      .filter(({ linkRecord }) => linkRecord.paymentLinkId)
+      .map(({ linkRecord }) => linkRecord.paymentLinkId);
+    const userIds = approved
+      .filter(({ linkRecord }) => !linkRecord.paymentLinkId && linkRecord.userId)
+      .map(({ linkRecord }) => linkRecord.userId);
+
+    const paymentsById = new Map();
+    if (paymentIds.length) {
+      const payments = await PaymentLink.find({ _id: { $in: paymentIds } }).select('expiry_date').lean();
+      payments.forEach(payment => paymentsById.set(String(payment._id), payment));
+    }
+
+    const latestPaymentByUser = new Map();
+    if (userIds.length) {
+      const payments = await PaymentLink.find({ userid: { $in: userIds }, status: 'SUCCESS' })
+        .sort({ createdAt: -1 })
+        .select('userid expiry_date')
+        .lean();
+      payments.forEach(payment => {
+        const key = String(payment.userid);
+        if (!latestPaymentByUser.has(key)) latestPaymentByUser.set(key, payment);
+      });
+    }
+
+    // 4. Upsert all channel members in one bulk write
+    const memberOps = approved.map(({ index, item, linkRecord }) => {
+      const payment = linkRecord.paymentLinkId
+        ? paymentsById.get(String(linkRecord.paymentLinkId))
+        : latestPaymentByUser.get(String(linkRecord.userId));
+
+      let expiryTime = payment && payment.expiry_date ? new Date(payment.expiry_date) : null;
+      if (!expiryTime) {
+        const duration = linkRecord.duration || 86400;
+        expiryTime = new Date(joinTime.getTime() + (duration * 1000));
+      }
+
+      const channelId = item.channel_id || linkRecord.channelId || process.env.CHANNEL_ID;
+      const remainingSeconds = Math.floor((expiryTime.getTime() - joinTime.getTime()) / 1000);
+
+      results[index] = {
+        approve: true,
+        message: 'Access granted - link used',
+        expires_at: expiryTime.toISOString(),
+        duration_seconds: remainingSeconds
+      };
+
+      return {
+        updateOne: {
+          filter: { telegramUserId: item.telegram_user_id, channelId },
+          update: {
+            telegramUserId: item.telegram_user_id,
+            channelId,
+            joinedAt: joinTime,
+            expiresAt: expiryTime,
+            isActive: true,
+            inviteLinkUsed: item.invite_link,
+            userInfo: {
+              firstName: item.user_info?.first_name || 'Unknown',
+              lastName: item.user_info?.last_name || '',
+              username: item.user_info?.username || ''
+            }
+          },
+          upsert: true
+        }
+      };
+    });
+
+    if (memberOps.length) {
+      await ChannelMember.bulkWrite(memberOps, { ordered: false });
+    }
+
+    console.log(`✅ Batch validation: ${approved.length}/${requests.length} approved`);
+
+    return res.status(200).json({ results });
+
+  } catch (error) {
+    console.error('❌ Error in batch validation:', error.message);
+    return res.status(500).json({
+      error: 'Server error'
+    });
+  }
+};
+
 // Endpoint to check if a user should be kicked (for expiry checks)
 const checkUserExpiry = async (req, res) => {
   try {
@@ -208,6 +377,173 @@ const notifyUserKicked = async (req, res) => {
   }
 };
 
+// Export of members for the bot's expiry engine
+// GET /api/telegram/expiring?until=<iso>[&from=<iso>] - active members expiring in (from, until]
+// GET /api/telegram/expiring?updated_since=<iso>       - members changed since the cursor
+// Both page by after_id; `cursor` is the value to send as updated_since next time.
+// Optional channel_id limits either query to one channel (the single-channel bot).
+// GET /api/telegram/expiring?telegram_user_ids=<id,...>  - every active membership of those users
+// (re-checks members a bot has due locally; add until to bound the expiry).
+const EXPIRING_PAGE_MAX = 5000;
+const EXPIRING_USER_IDS_MAX = 1000;
+const EXPIRING_CURSOR_OVERLAP_MS = 5000;
+
+const getExpiringMembers = async (req, res) => {
+  try {
+    const ChannelMember = require('../models/ChannelMember');
+    const { from, until, updated_since, after_id, channel_id, telegram_user_ids } = req.query;
+    const limit = Math.min(parseInt(req.query.limit, 10) || 1000, EXPIRING_PAGE_MAX);
+    const cursor = new Date(Date.now() - EXPIRING_CURSOR_OVERLAP_MS);
+
+    let query;
+    if (updated_since) {
+      const since = new Date(updated_since);
+      if (isNaN(since.getTime())) {
+        return res.status(400).json({ error: 'Invalid updated_since' });
+      }
+      // Renewals, kicks and new joins, whatever their expiry
+      query = { updatedAt: { $gt: since } };
+    } else if (telegram_user_ids) {
+      const userIds = String(telegram_user_ids).split(',').map(id => id.trim()).filter(Boolean);
+      if (userIds.length === 0 || userIds.length > EXPIRING_USER_IDS_MAX) {
+        return res.status(400).json({ error: `telegram_user_ids takes 1 to ${EXPIRING_USER_IDS_MAX} ids` });
+      }
+      query = { isActive: true, telegramUserId: { $in: userIds } };
+      if (until) {
+        const untilDate = new Date(until);
+        if (isNaN(untilDate.getTime())) {
+          return res.status(400).json({ error: 'Invalid until' });
+        }
+        query.expiresAt = { $lte: untilDate };
+      }
+    } else {
+      const untilDate = until ? new Date(until) : new Date(Date.now() + 60 * 60 * 1000);
+      const fromDate = from ? new Date(from) : null;
+      if (isNaN(untilDate.getTime()) || (fromDate && isNaN(fromDate.getTime()))) {
+        return res.status(400).json({ error: 'Invalid from/until' });
+      }
+      query = { isActive: true, expiresAt: fromDate ? { $gt: fromDate, $lte: untilDate } : { $lte: untilDate } };
+    }
+    if (channel_id) {
+      query.channelId = String(channel_id);
+    }
+    if (after_id) {
+      query._id = { $gt: after_id };
+    }
+
+    const members = await ChannelMember.find(query)
+      .sort({ _id: 1 })
+      .limit(limit)
+      .select('telegramUserId channelId expiresAt isActive channelInfo.title')
+      .lean();
+
+    return res.status(200).json({
+      members: members.map(member => ({
+        member_id: member._id.toString(),
+        telegram_user_id: member.telegramUserId,
+        channel_id: member.channelId,
+        expires_at: member.expiresAt,
+        is_active: member.isActive,
+        channel_title: member.channelInfo?.title || null
+      })),
+      has_more: members.length === limit,
+      cursor: cursor.toISOString()
+    });
+
+  } catch (error) {
+    console.error('Error exporting expiring members:', error);
+    return res.status(500).json({ error: 'Internal server error' });
+  }
+};
+
+// Active members of one channel, ordered by telegramUserId, for membership reconciliation
+// GET /api/telegram/channels/:channelId/members[?after=<telegram_user_id>&limit=N]
+// Ids compare as strings (byte order), like the bot's merge; send next_after back as after.
+const MEMBER_EXPORT_PAGE_MAX = 5000;
+
+const exportChannelMembers = async (req, res) => {
+  try {
+    const ChannelMember = require('../models/ChannelMember');
+    const { channelId } = req.params;
+    const { after } = req.query;
+    const limit = Math.min(parseInt(req.query.limit, 10) || 1000, MEMBER_EXPORT_PAGE_MAX);
+
+    const query = { channelId, isActive: true };
+    if (after) {
+      query.telegramUserId = { $gt: String(after) };
+    }
+
+    const members = await ChannelMember.find(query)
+      .sort({ telegramUserId: 1 })
+      .limit(limit)
+      .select('telegramUserId expiresAt')
+      .lean();
+
+    return res.status(200).json({
+      members: members.map(member => ({
+        member_id: member._id.toString(),
+        telegram_user_id: member.telegramUserId,
+        expires_at: member.expiresAt
+      })),
+      has_more: members.length === limit,
+      next_after: members.length ? members[members.length - 1].telegramUserId : null
+    });
+
+  } catch (error) {
+    console.error('Error exporting channel members:', error);
+    return res.status(500).json({ error: 'Internal server error' });
+  }
+};
+
+// Kicks performed by the bot's expiry engine (delivered in batches by its outbox)
+// POST /api/telegram/members/kicked { kicks: [{ member_id, kicked_at, reason }] }
+const MAX_KICK_BATCH = 500;
+
+const recordMemberKicks = async (req, res) => {
+  try {
+    const ChannelMember = require('../models/ChannelMember');
+    const { kicks } = req.body || {};
+
+    if (!Array.isArray(kicks) || kicks.length === 0) {
+      return res.status(400).json({ error: 'kicks must be a non-empty array' });
+    }
+    if (kicks.length > MAX_KICK_BATCH) {
+      return res.status(413).json({ error: `At most ${MAX_KICK_BATCH} kicks per batch` });
+    }
+
+    const results = new Array(kicks.length);
+    const ops = [];
+    const now = Date.now();
+    kicks.forEach((kick, index) => {
+      // Never later than our own clock, so a kick cannot close a membership that has not expired yet
+      const kickedAt = new Date(Math.min(new Date(kick?.kicked_at).getTime(), now));
+      if (!kick?.member_id || !/^[a-f0-9]{24}$/i.test(kick.member_id) || isNaN(kickedAt.getTime())) {
+        results[index] = { success: false, retryable: false, message: 'member_id and kicked_at are required' };
+        return;
+      }
+      results[index] = { success: true };
+      // A member who renewed after the kick was scheduled stays active
+      ops.push({
+        updateOne: {
+          filter: { _id: kick.member_id, isActive: true, expiresAt: { $lte: kickedAt } },
+          update: { $set: { isActive: false, kickedAt, kickReason: kick.reason || 'Subscription expired' } }
+        }
+      });
+    });
+
+    if (ops.length > 0) {
+      const outcome = await ChannelMember.bulkWrite(ops, { ordered: false });
+      console.log(`👢 Recorded ${outcome.modifiedCount}/${ops.length} expiry kicks from bot`);
+    }
+
+    return res.status(200).json({ results });
+
+  } catch (error) {
+    console.error('Error recording member kicks:', error);
+    return res.status(500).json({ error: 'Internal server error' });
+  }
+};
+
 // Endpoint to store test invite links from bot
 const storeTestLink = async (req, res) => {
   try {
@@ -270,6 +606,30 @@ const handleUserJoined = async (req, res) => {
   }
 };
 
+// Batch variant used by the bot's outbox: { events: [...] } -> { results: [...] } in request order
+const MAX_USER_JOINED_BATCH = 500;
+
+const handleUserJoinedBatch = async (req, res) => {
+  const { events } = req.body || {};
+
+  if (!Array.isArray(events) || events.length === 0) {
+    return res.status(400).json({ error: 'events must be a non-empty array' });
+  }
+  if (events.length > MAX_USER_JOINED_BATCH) {
+    return res.status(413).json({ error: `At most ${MAX_USER_JOINED_BATCH} events per batch` });
+  }
+
+  const results = events.map((event) => {
+    if (!event || !event.telegram_user_id || !event.channel_id) {
+      return { success: false, retryable: false, message: 'telegram_user_id and channel_id are required' };
+    }
+    return { success: true, message: 'Join acknowledged' };
+  });
+
+  console.log(`✅ Acknowledged ${results.filter(result => result.success).length}/${events.length} user joins`);
+  return res.status(200).json({ results });
+};
+
 // Store for pending link verifications (in production, use Redis or database)
 const pendingLinks = new Map();
 
@@ -495,10 +855,15 @@ const unlinkTelegramAccount = async (req, res) => {
 
 module.exports = {
   validateJoinRequest,
+  validateJoinBatch,
   checkUserExpiry,
   notifyUserKicked,
+  getExpiringMembers,
+  exportChannelMembers,
+  recordMemberKicks,
   storeTestLink,
   handleUserJoined,
+  handleUserJoinedBatch,
   linkTelegramAccount,
   verifyTelegramLink,
   unlinkTelegramAccount
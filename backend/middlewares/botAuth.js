@@ -0,0 +1,26 @@
+// middlewares/botAuth.js
+// Shared secret for bot -> backend routes that expose or change memberships.
+// The bot sends BOT_API_SECRET in the X-Bot-Api-Secret header.
+const crypto = require('crypto');
+
+const BOT_API_SECRET_HEADER = 'X-Bot-Api-Secret';
+
+const verifyBot = (req, res, next) => {
+  const secret = process.env.BOT_API_SECRET || '';
+  if (!secret) {
+    // Fail closed: without a configured secret these routes would be public
+    console.error('❌ BOT_API_SECRET is not set; refusing bot API request');
+    return res.status(503).json({ error: 'Bot API is not configured' });
+  }
+
+  const supplied = Buffer.from(req.header(BOT_API_SECRET_HEADER) || '');
+  const expected = Buffer.from(secret);
+  if (supplied.length !== expected.length || !crypto.timingSafeEqual(supplied, expected)) {
+    return res.status(401).json({ error: 'Unauthorized' });
+  }
+  next();
+};
+
+module.exports = verifyBot;
+module.exports.verifyBot = verifyBot;
+module.exports.BOT_API_SECRET_HEADER = BOT_API_SECRET_HEADER;
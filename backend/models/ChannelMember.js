@@ -81,8 +81,11 @@ channelMemberSchema.index({ telegramUserId: 1, channelId: 1 }, { unique: true })
 // Index for expiry checks
 channelMemberSchema.index({ expiresAt: 1, isActive: 1 });
 
-// Index for channel-specific queries
-channelMemberSchema.index({ channelId: 1, isActive: 1 });
+// Index for the bot's expiry engine delta sync
+channelMemberSchema.index({ updatedAt: 1 });
+
+// Index for channel-specific queries; telegramUserId keeps the reconciliation export in index order
+channelMemberSchema.index({ channelId: 1, isActive: 1, telegramUserId: 1 });
 
 // Methods
 channelMemberSchema.methods.isExpired = function() {
@@ -0,0 +1,21 @@
+const mongoose = require('mongoose');
+
+// Tombstone of a hard-deleted channel bundle, so the bot's delta sync
+// (GET /api/groups/active?updated_since=...) can report its channels as removed.
+// Kept well past the bot's hourly full resync, then dropped by the TTL index.
+const TOMBSTONE_TTL_SECONDS = 7 * 24 * 60 * 60;
+
+const deletedGroupSchema = new mongoose.Schema({
+  groupId: {
+    type: mongoose.Schema.Types.ObjectId,
+    required: true
+  },
+  deletedAt: {
+    type: Date,
+    default: Date.now
+  }
+});
+
+deletedGroupSchema.index({ deletedAt: 1 }, { expireAfterSeconds: TOMBSTONE_TTL_SECONDS });
+
+module.exports = mongoose.model('DeletedGroup', deletedGroupSchema);
@@ -2,18 +2,27 @@ const express = require('express');
 const router = express.Router();
 const {
   validateJoinRequest,
+  validateJoinBatch,
   checkUserExpiry,
   notifyUserKicked,
+  getExpiringMembers,
+  exportChannelMembers,
+  recordMemberKicks,
   storeTestLink,
   linkTelegramAccount,
   verifyTelegramLink,
   unlinkTelegramAccount
 } = require('../controllers/telegramController');
+const verifyBot = require('../middlewares/botAuth');
 
 // Webhook endpoint for Telegram bot to validate join requests
 // POST /api/telegram/validate-join
 router.post('/validate-join', validateJoinRequest);
 
+// Batch variant used by the bot to validate several join requests at once
+// POST /api/telegram/validate-join/batch
+router.post('/validate-join/batch', validateJoinBatch);
+
 // Endpoint to check if a user should be kicked from Telegram
 // GET /api/telegram/check-expiry/:telegram_user_id
 router.get('/check-expiry/:telegram_user_id', checkUserExpiry);
@@ -22,6 +31,18 @@ router.get('/check-expiry/:telegram_user_id', checkUserExpiry);
 // POST /api/telegram/notify-kick
 router.post('/notify-kick', notifyUserKicked);
 
+// Upcoming expiries and changes for the bot's expiry engine (bot secret required)
+// GET /api/telegram/expiring
+router.get('/expiring', verifyBot, getExpiringMembers);
+
+// Sorted active-member export for membership reconciliation (bot secret required)
+// GET /api/telegram/channels/:channelId/members
+router.get('/channels/:channelId/members', verifyBot, exportChannelMembers);
+
+// Batched kicks performed by the bot's expiry engine (bot secret required)
+// POST /api/telegram/members/kicked
+router.post('/members/kicked', verifyBot, recordMemberKicks);
+
 // Endpoint for bot to store test invite links
 // POST /api/telegram/store-test-link
 router.post('/store-test-link', storeTestLink);
@@ -30,6 +51,10 @@ router.post('/store-test-link', storeTestLink);
 // POST /api/telegram/user-joined
 router.post('/user-joined', require('../controllers/telegramController').handleUserJoined);
 
+// Batched join notifications from the bot's outbox
+// POST /api/telegram/user-joined/batch
+router.post('/user-joined/batch', require('../controllers/telegramController').handleUserJoinedBatch);
+
 // Telegram account linking endpoints
 // POST /api/telegram/link-account
 router.post('/link-account', linkTelegramAccount);
@@ -0,0 +1,69 @@
+const axios = require('axios');
+
+// Local control API exposed by the Telegram bot (TG_Bot_Script/control_server.py)
+const BOT_CONTROL_URL = process.env.BOT_CONTROL_URL;
+const BOT_CONTROL_TOKEN = process.env.BOT_CONTROL_TOKEN;
+
+const botControlRequest = async (method, path, data) => {
+  if (!BOT_CONTROL_URL) {
+    return null;
+  }
+
+  const response = await axios({
+    method,
+    url: `${BOT_CONTROL_URL}${path}`,
+    data,
+    timeout: 2000,
+    headers: BOT_CONTROL_TOKEN ? { 'X-Bot-Control-Token': BOT_CONTROL_TOKEN } : {}
+  });
+  return response.data;
+};
+
+// Drop cached decline verdicts for a user once their payment completes,
+// so their next join request is validated against the backend again.
+// Never throws: the bot cache expires on its own if this call fails.
+const invalidateDeclineCache = async (telegramUserId, channelId = null) => {
+  if (!telegramUserId) {
+    return null;
+  }
+
+  try {
+    const result = await botControlRequest('post', '/cache/invalidate', {
+      telegram_user_id: String(telegramUserId),
+      channel_id: channelId ? String(channelId) : null
+    });
+    if (result) {
+      console.log(`🧊 Bot decline cache invalidated for ${telegramUserId}: ${result.removed} entries`);
+    }
+    return result;
+  } catch (error) {
+    console.warn(`⚠️ Could not invalidate bot decline cache for ${telegramUserId}:`, error.message);
+    return null;
+  }
+};
+
+// Take a pre-created join-request link from the bot's link pool.
+// Never throws: returns null when the pool is unavailable, so the caller can
+// create the link itself.
+const allocatePoolLink = async (channelId, allocatedTo = null) => {
+  if (!channelId) {
+    return null;
+  }
+
+  try {
+    const result = await botControlRequest('post', '/links/allocate', {
+      channel_id: String(channelId),
+      allocated_to: allocatedTo ? String(allocatedTo) : null
+    });
+    return result?.invite_link || null;
+  } catch (error) {
+    console.warn(`⚠️ Bot link pool unavailable for ${channelId}:`, error.message);
+    return null;
+  }
+};
+
+module.exports = {
+  botControlRequest,
+  invalidateDeclineCache,
+  allocatePoolLink
+};
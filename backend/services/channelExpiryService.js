@@ -2,11 +2,42 @@ const ChannelMember = require('../models/ChannelMember');
 const axios = require('axios');
 const cron = require('node-cron');
 
+// Space Bot API calls under Telegram's ~30/s global limit and wait out 429s
+const TELEGRAM_MIN_INTERVAL_MS = parseInt(process.env.TELEGRAM_MIN_INTERVAL_MS || '40', 10);
+const TELEGRAM_MAX_RETRIES = 3;
+const TELEGRAM_MAX_RETRY_AFTER = 60; // seconds
+
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
 class ChannelExpiryService {
   constructor() {
     this.botToken = process.env.BOT_TOKEN;
     this.telegramApiUrl = `https://api.telegram.org/bot${this.botToken}`;
     this.isRunning = false;
+    this.nextCallAt = 0;
+  }
+
+  // POST to the Bot API through a shared pacer; retries when Telegram answers 429 retry_after
+  async telegramCall(method, payload) {
+    for (let attempt = 0; ; attempt++) {
+      const now = Date.now();
+      const waitMs = this.nextCallAt - now;
+      this.nextCallAt = Math.max(now, this.nextCallAt) + TELEGRAM_MIN_INTERVAL_MS;
+      if (waitMs > 0) {
+        await sleep(waitMs);
+      }
+
+      try {
+        return await axios.post(`${this.telegramApiUrl}/${method}`, payload);
+      } catch (error) {
+        const retryAfter = error.response?.data?.parameters?.retry_after;
+        if (!retryAfter || attempt >= TELEGRAM_MAX_RETRIES || retryAfter > TELEGRAM_MAX_RETRY_AFTER) {
+          throw error;
+        }
+        console.warn(`🐢 ${method} rate limited by Telegram, retrying in ${retryAfter}s`);
+        this.nextCallAt = Date.now() + retryAfter * 1000;
+      }
+    }
   }
 
   // Start the expiry monitoring service
@@ -16,6 +47,12 @@ class ChannelExpiryService {
       return;
     }
 
+    // EXPIRY_ENGINE=bot: the Telegram bot schedules kicks itself from /api/telegram/expiring
+    if ((process.env.EXPIRY_ENGINE || 'backend') === 'bot') {
+      console.log('⏭️ Channel expiry cron disabled - expiries are handled by the bot (EXPIRY_ENGINE=bot)');
+      return;
+    }
+
     console.log('🚀 Starting Channel Expiry Service...');
     
     // Run expiry check every minute
@@ -86,10 +123,8 @@ class ChannelExpiryService {
   // Kick a specific member from Telegram channel
   async kickMember(member) {
     try {
-      const kickUrl = `${this.telegramApiUrl}/banChatMember`;
-      
       // Ban the user (this removes them from the channel)
-      const banResponse = await axios.post(kickUrl, {
+      const banResponse = await this.telegramCall('banChatMember', {
         chat_id: member.channelId,
         user_id: member.telegramUserId,
         until_date: Math.floor(Date.now() / 1000) + 60 // Unban after 60 seconds
@@ -101,8 +136,7 @@ class ChannelExpiryService {
         // Immediately unban them so they can rejoin later with a new subscription
         setTimeout(async () => {
           try {
-            const unbanUrl = `${this.telegramApiUrl}/unbanChatMember`;
-            await axios.post(unbanUrl, {
+            await this.telegramCall('unbanChatMember', {
               chat_id: member.channelId,
               user_id: member.telegramUserId,
               only_if_banned: true
@@ -115,8 +149,7 @@ class ChannelExpiryService {
 
         // Try to send notification to user
         try {
-          const messageUrl = `${this.telegramApiUrl}/sendMessage`;
-          await axios.post(messageUrl, {
+          await this.telegramCall('sendMessage', {
             chat_id: member.telegramUserId,
             text: `⏰ Your subscription to channel ${member.channelInfo?.title || 'Premium Channel'} has expired.\n\nTo continue accessing premium content, please renew your subscription.\n\n📞 Contact support for assistance.`,
             parse_mode: 'Markdown'
@@ -7,6 +7,7 @@ const { convertDurationToSeconds } = require('../utils/durationConverter');
 
 // Import email service for sending invite links
 const emailService = require('./emailService');
+const { invalidateDeclineCache, allocatePoolLink } = require('./botControlService');
 
 // Use environment variables for bot configuration
 const BOT_TOKEN = process.env.BOT_TOKEN;
@@ -62,24 +63,30 @@ async function generateInviteLinkForChannel(userId, channelId, channelTitle = nu
 
   try {
     console.log(`Generating join request invite link for user: ${userId || 'anonymous'} in channel: ${channelId}`);
-    
-    // Make API request to Telegram to create the join request invite link
-    const response = await axios.post(url, {
-      chat_id: channelId,
-      creates_join_request: true // This creates a join request that needs approval
-    });
-
-    console.log('Telegram API Response:', {
-      status: response.status,
-      chat_id: channelId,
-      creates_join_request: true
-    });
 
-    // Extract invite link from the response
-    const { invite_link } = response.data.result;
-
-    console.log("✅ Join request invite link generated successfully:", invite_link);
-    console.log("📋 Response data:", response.data.result);
+    // Prefer a link the bot created ahead of time; fall back to creating one now
+    let invite_link = await allocatePoolLink(channelId, userId);
+    if (invite_link) {
+      console.log("🔗 Join request invite link taken from the bot link pool:", invite_link);
+    } else {
+      // Make API request to Telegram to create the join request invite link
+      const response = await axios.post(url, {
+        chat_id: channelId,
+        creates_join_request: true // This creates a join request that needs approval
+      });
+
+      console.log('Telegram API Response:', {
+        status: response.status,
+        chat_id: channelId,
+        creates_join_request: true
+      });
+
+      // Extract invite link from the response
+      invite_link = response.data.result.invite_link;
+
+      console.log("✅ Join request invite link generated successfully:", invite_link);
+      console.log("📋 Response data:", response.data.result);
+    }
 
     // Helper function to convert string to ObjectId if valid, otherwise set to null
     const toObjectIdOrNull = (value) => {
@@ -280,6 +287,19 @@ async function generateInviteLinksForChannelBundle(userId, groupId, duration = 8
       expiryDate: expiryDate
     };
 
+    // Payment completed: let the bot forget any earlier declines for this user
+    if (generatedLinks.length > 0 && userId) {
+      try {
+        const User = require('../models/user.model');
+        const user = await User.findById(userId).select('telegramUserId');
+        if (user?.telegramUserId) {
+          await invalidateDeclineCache(user.telegramUserId);
+        }
+      } catch (error) {
+        console.warn('⚠️ Could not look up Telegram ID for decline cache invalidation:', error.message);
+      }
+    }
+
     // Send email with all invite links if requested and we have successful links
     if (sendEmail && generatedLinks.length > 0) {
       try {
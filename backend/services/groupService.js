@@ -1,5 +1,6 @@
 
 const Group = require('../models/group.model');
+const DeletedGroup = require('../models/deletedGroup.model');
 const Plan = require('../models/plan');
 const { Telegraf } = require('telegraf');
 
@@ -124,6 +125,8 @@ class GroupService {
       if (group.isDefault) throw new Error('Cannot delete default group');
 
       await Group.findByIdAndDelete(groupId);
+      // Tombstone, so the bot's delta sync drops the bundle's channels
+      await DeletedGroup.create({ groupId });
       return { message: 'Group deleted successfully' };
     } catch (error) {
       throw new Error(`Failed to delete group: ${error.message}`);
@@ -412,6 +415,10 @@ async testBotConnection(chatId) {
         isActive: true,
         addedAt: new Date()
       };
+      // Set when the channel arrives with its join-request link already created (batch provisioning)
+      if (channelData.joinLink) {
+        newChannel.joinLink = channelData.joinLink;
+      }
 
       const updatedGroup = await Group.findByIdAndUpdate(
         groupId,
@@ -478,10 +485,15 @@ async testBotConnection(chatId) {
 
         return inviteLink.invite_link;
       } catch (telegramError) {
-        throw new Error(`Failed to create invite link: ${telegramError.message}`);
+        const wrapped = new Error(`Failed to create invite link: ${telegramError.message}`);
+        // Flood limit: tell the caller how long Telegram wants us to wait
+        wrapped.retryAfter = telegramError.response?.parameters?.retry_after;
+        throw wrapped;
       }
     } catch (error) {
-      throw new Error(`Failed to generate join link: ${error.message}`);
+      const wrapped = new Error(`Failed to generate join link: ${error.message}`);
+      wrapped.retryAfter = error.retryAfter;
+      throw wrapped;
     }
   }
 
@@ -496,47 +508,92 @@ async testBotConnection(chatId) {
         ]
       }).populate('createdBy', 'email firstName lastName');
 
-      const channelConfigs = [];
-
-      groups.forEach(group => {
-        // Handle legacy single channel
-        if (group.telegramChatId && !group.channels?.length) {
-          channelConfigs.push({
-            channel_id: group.telegramChatId,
-            admin_id: group.createdBy?._id,
-            name: group.name,
-            group_id: group._id,
-            chat_title: group.telegramChatTitle || group.name,
-            join_link: group.telegramInviteLink || null,
-            is_legacy: true
-          });
-        }
+      return this.buildBotChannelConfigs(groups);
+    } catch (error) {
+      throw new Error(`Failed to get active channels for bot: ${error.message}`);
+    }
+  }
 
-        // Handle new channel bundle structure
-        if (group.channels?.length) {
-          group.channels.forEach(channel => {
-            if (channel.isActive) {
-              channelConfigs.push({
-                channel_id: channel.chatId,
-                admin_id: group.createdBy?._id,
-                name: group.name,
-                group_id: group._id,
-                chat_title: channel.chatTitle || group.name,
-                channel_db_id: channel._id,
-                join_link: channel.joinLink,
-                is_legacy: false
-              });
-            }
-          });
-        }
-      });
+  // Channels of groups changed after `since`, for the bot's delta sync.
+  // Groups that became inactive are reported in changedGroupIds with no
+  // channels so the bot drops them.
+  async getChangedChannelsForBot(since) {
+    try {
+      const [groups, deleted] = await Promise.all([
+        Group.find({ updatedAt: { $gt: since } }).populate('createdBy', 'email firstName lastName'),
+        DeletedGroup.find({ deletedAt: { $gt: since } }).select('groupId').lean()
+      ]);
 
-      return channelConfigs;
+      return {
+        changedGroupIds: groups.map(group => group._id),
+        removedGroupIds: deleted.map(tombstone => tombstone.groupId),
+        channels: this.buildBotChannelConfigs(groups.filter(group => group.status === 'active'))
+      };
     } catch (error) {
-      throw new Error(`Failed to get active channels for bot: ${error.message}`);
+      throw new Error(`Failed to get changed channels for bot: ${error.message}`);
     }
   }
 
+  // Cheap fingerprint of the bot's channel registry (active group count and
+  // latest update), used as the ETag of /api/groups/active
+  async getActiveChannelsVersion() {
+    try {
+      const [[stats], lastDeleted] = await Promise.all([
+        Group.aggregate([
+          { $match: { status: 'active' } },
+          { $group: { _id: null, count: { $sum: 1 }, lastUpdated: { $max: '$updatedAt' } } }
+        ]),
+        DeletedGroup.findOne().sort({ deletedAt: -1 }).select('deletedAt').lean()
+      ]);
+
+      // A deletion changes the version even when a create at the same time keeps the count
+      const deletedAt = lastDeleted ? new Date(lastDeleted.deletedAt).getTime() : 0;
+      if (!stats) return `empty-${deletedAt}`;
+      return `${stats.count}-${stats.lastUpdated ? new Date(stats.lastUpdated).getTime() : 0}-${deletedAt}`;
+    } catch (error) {
+      throw new Error(`Failed to get active channels version: ${error.message}`);
+    }
+  }
+
+  buildBotChannelConfigs(groups) {
+    const channelConfigs = [];
+
+    groups.forEach(group => {
+      // Handle legacy single channel
+      if (group.telegramChatId && !group.channels?.length) {
+        channelConfigs.push({
+          channel_id: group.telegramChatId,
+          admin_id: group.createdBy?._id,
+          name: group.name,
+          group_id: group._id,
+          chat_title: group.telegramChatTitle || group.name,
+          join_link: group.telegramInviteLink || null,
+          is_legacy: true
+        });
+      }
+
+      // Handle new channel bundle structure
+      if (group.channels?.length) {
+        group.channels.forEach(channel => {
+          if (channel.isActive) {
+            channelConfigs.push({
+              channel_id: channel.chatId,
+              admin_id: group.createdBy?._id,
+              name: group.name,
+              group_id: group._id,
+              chat_title: channel.chatTitle || group.name,
+              channel_db_id: channel._id,
+              join_link: channel.joinLink,
+              is_legacy: false
+            });
+          }
+        });
+      }
+    });
+
+    return channelConfigs;
+  }
+
   // Add plan to group
   async addPlanToGroup(groupId, planData) {
     try {
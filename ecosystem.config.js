@@ -37,5 +37,24 @@ module.exports = {
       log_file: './logs/bot-combined.log',
       time: true
     }
+    // Multi-channel bot on several cores: one ingress process supervising
+    // BOT_SHARDS worker processes (see TG_Bot_Script/sharding.py). Keep PM2 at
+    // one instance - the ingress restarts its own workers.
+    // {
+    //   name: 'telegram-bot-sharded',
+    //   script: 'bot_ingress.py',
+    //   cwd: './TG_Bot_Script',
+    //   interpreter: 'python3',
+    //   instances: 1,
+    //   watch: false,
+    //   kill_timeout: 30000,
+    //   env_production: {
+    //     BOT_SHARDS: 4
+    //   },
+    //   error_file: './logs/bot-sharded-error.log',
+    //   out_file: './logs/bot-sharded-out.log',
+    //   log_file: './logs/bot-sharded-combined.log',
+    //   time: true
+    // }
   ]
 };
\ No newline at end of file
@@ -6,20 +6,263 @@ This script helps you connect to Telegram groups and generate invite links.
 
 import asyncio
 import logging
-from telethon import TelegramClient
-from telethon.tl.functions.messages import GetDialogsRequest
-from telethon.tl.functions.channels import CreateChannelRequest, InviteToChannelRequest
+from telethon import TelegramClient, errors, utils
+from telethon.tl import types
+from telethon.tl.functions.messages import (
+    CheckChatInviteRequest, ExportChatInviteRequest, GetDialogsRequest, ImportChatInviteRequest
+)
+from telethon.tl.functions.channels import (
+    CreateChannelRequest, EditAdminRequest, EditBannedRequest, GetFullChannelRequest, GetParticipantsRequest,
+    JoinChannelRequest
+)
 from telethon.tl.functions.messages import CreateChatRequest
 from telethon.tl.types import InputPeerEmpty
+from datetime import datetime, timedelta, timezone
 import json
 import os
+import re
+import sqlite3
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+# Dialog listing
+DIALOG_PAGE_SIZE = int(os.getenv("DIALOG_PAGE_SIZE", "100"))  # Telegram caps a page at 100
+MAX_FLOOD_WAIT = int(os.getenv("MAX_FLOOD_WAIT", "300"))  # longer flood waits are raised, not slept
+FLOOD_WAIT_RETRIES = int(os.getenv("FLOOD_WAIT_RETRIES", "5"))
+GROUP_SNAPSHOT_PATH = os.getenv("GROUP_SNAPSHOT_PATH", "")  # e.g. groups_snapshot.jsonl; "" disables
+GROUP_SNAPSHOT_MAX_AGE = int(os.getenv("GROUP_SNAPSHOT_MAX_AGE", "86400"))  # seconds before a full re-listing
+
+GROUP_KINDS = ("group", "supergroup", "channel")
+KIND_LABELS = {"group": "Group", "supergroup": "Supergroup", "channel": "Channel"}
+SNAPSHOT_VERSION = 1
+
+# Sessions and entity cache
+TELEGRAM_SESSION = os.getenv("TELEGRAM_SESSION", "")  # default: one session per phone number
+ENTITY_CACHE_TTL = int(os.getenv("ENTITY_CACHE_TTL", "86400"))  # seconds before a cached chat is re-fetched
+LEGACY_SESSION = "session_name"
+
+ENTITY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    peer_id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    access_hash INTEGER,
+    title TEXT,
+    username TEXT COLLATE NOCASE,
+    invite_hash TEXT,
+    is_member INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entities_username ON entities (username);
+CREATE INDEX IF NOT EXISTS entities_invite_hash ON entities (invite_hash);
+"""
+
+# Batch provisioning
+BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:4000")
+BACKEND_ADMIN_TOKEN = os.getenv("BACKEND_ADMIN_TOKEN", "")  # admin JWT for the groups API
+BOT_API_SECRET = os.getenv("BOT_API_SECRET", "")  # bot secret for the membership routes (member export, kicks)
+BOT_USERNAME = os.getenv("BOT_USERNAME", "")  # the bot promoted to admin in every new chat
+PROVISION_CONCURRENCY = int(os.getenv("PROVISION_CONCURRENCY", "3"))  # chats set up at once
+PROVISION_CHECKPOINT = os.getenv("PROVISION_CHECKPOINT", "provision_checkpoint.jsonl")
+PROVISION_BACKEND_ATTEMPTS = int(os.getenv("PROVISION_BACKEND_ATTEMPTS", "3"))
+
+# Provisioning steps, in order; the checkpoint records the last one finished per spec
+PROVISION_STEPS = ("created", "bot_admin", "join_link", "registered")
+PROVISION_KINDS = ("supergroup", "channel")
+
+# What the bot needs: create join-request links, approve them and remove expired members
+BOT_ADMIN_RIGHTS = dict(invite_users=True, ban_users=True, delete_messages=True)
+
+# Membership reconciliation
+RECONCILE_PAGE_SIZE = 200  # Telegram caps a participants page at 200
+RECONCILE_EXPORT_PAGE = int(os.getenv("RECONCILE_EXPORT_PAGE", "1000"))  # backend members per page
+RECONCILE_SEARCH_QUERIES = os.getenv("RECONCILE_SEARCH_QUERIES", "abcdefghijklmnopqrstuvwxyz0123456789")
+RECONCILE_MAX_KICKS = int(os.getenv("RECONCILE_MAX_KICKS", "200"))  # more unpaid members than this: report only
+RECONCILE_STAGING_DIR = os.getenv("RECONCILE_STAGING_DIR", "")  # "" uses the system temp dir
+RECONCILE_KICK_BATCH = 500  # /api/telegram/members/kicked accepts at most 500
+RECONCILE_SAMPLE = 20  # differences of each kind included in the returned report
+
+# Differences
+UNPAID_PRESENT = "unpaid_present"  # in the channel without an active, unexpired membership
+PAID_ABSENT = "paid_absent"  # active membership, not in the channel
+
+RECONCILE_SCHEMA = """
+CREATE TABLE participants (
+    user_id TEXT PRIMARY KEY,
+    access_hash INTEGER,
+    exempt INTEGER NOT NULL
+);
+CREATE TABLE diffs (
+    user_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    member_id TEXT,
+    expires_at TEXT,
+    access_hash INTEGER,
+    action TEXT
+);
+"""
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(_name_)
+logger = logging.getLogger(__name__)
+
+
+def group_kind(entity):
+    """'group', 'supergroup' or 'channel' for a chat we can still use, else None"""
+    if isinstance(entity, types.Channel):
+        return "supergroup" if entity.megagroup or entity.gigagroup else "channel"
+    if isinstance(entity, types.Chat) and not entity.deactivated and not entity.migrated_to:
+        return "group"
+    return None  # users, bots, chats we were removed from, basic groups upgraded to supergroups
+
+
+def default_session_name(phone_number):
+    """One session file per account, e.g. telegram_manager_15551234567"""
+    name = f"telegram_manager_{re.sub(r'[^0-9]', '', phone_number or '') or 'default'}"
+    # Keep using the session logged in before sessions were named per account
+    if not os.path.exists(f"{name}.session") and os.path.exists(f"{LEGACY_SESSION}.session"):
+        return LEGACY_SESSION
+    return name
+
+
+def provision_key(spec):
+    """Stable identity of a provisioning spec, used by the checkpoint"""
+    return spec.get('key') or f"{spec.get('group_id') or '-'}:{spec['title']}"
+
+
+def load_provision_checkpoint(path):
+    """Progress of earlier runs: {key: state}, where state['step'] is the last step finished"""
+    progress = {}
+    if not path or not os.path.exists(path):
+        return progress
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash
+            progress.setdefault(entry['key'], {}).update(entry['state'])
+    return progress
+
+
+class EntityCache:
+    """
+    Chats this account can address, persisted in SQLite next to the session
+
+    Access hashes are per account, so each session gets its own cache. Entries
+    are found by id (bare or marked), username or invite hash and are treated
+    as stale after ENTITY_CACHE_TTL seconds. `is_member` marks chats the
+    account is known to be in (listed dialogs, joins, creations); chats only
+    looked up keep it unset.
+    """
+
+    def __init__(self, path, ttl=ENTITY_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._db = None
+        self._by_peer = {}  # {peer_id: record}
+        self._by_id = {}  # {bare id: peer_id}
+        self._by_username = {}  # {lowercase username: peer_id}
+        self._by_invite = {}  # {invite hash: peer_id}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        """Open the cache file and warm the in-memory indexes"""
+        self._db = sqlite3.connect(self.path)
+        self._db.executescript(ENTITY_SCHEMA)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(entities)")}
+        if 'is_member' not in columns:
+            # Cache files written before the membership flag
+            self._db.execute("ALTER TABLE entities ADD COLUMN is_member INTEGER NOT NULL DEFAULT 0")
+            self._db.commit()
+        self._db.row_factory = sqlite3.Row
+        for row in self._db.execute("SELECT * FROM entities"):
+            self._index(dict(row))
+        logger.info(f"Entity cache warm-loaded {len(self._by_peer)} chat(s) from {self.path}")
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _index(self, record):
+        self._by_peer[record['peer_id']] = record
+        self._by_id[record['id']] = record['peer_id']
+        if record.get('username'):
+            self._by_username[record['username'].lower()] = record['peer_id']
+        if record.get('invite_hash'):
+            self._by_invite[record['invite_hash']] = record['peer_id']
+
+    def remember(self, entity, invite_hash=None, commit=True, member=None):
+        """
+        Store (or refresh) a chat; returns its record, or None for entities we do not cache
+
+        `member` records whether the account is in the chat; None keeps what was known.
+        """
+        kind = group_kind(entity)
+        if kind is None:
+            return None
+        peer_id = utils.get_peer_id(entity)
+        previous = self._by_peer.get(peer_id, {})
+        record = {
+            'peer_id': peer_id,
+            'kind': kind,
+            'id': entity.id,
+            'access_hash': getattr(entity, 'access_hash', None),
+            'title': entity.title,
+            'username': getattr(entity, 'username', None),
+            'invite_hash': invite_hash or previous.get('invite_hash'),
+            'is_member': int(member) if member is not None else previous.get('is_member', 0),
+            'updated_at': time.time(),
+        }
+        self._index(record)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entities "
+                "(peer_id, kind, id, access_hash, title, username, invite_hash, is_member, updated_at) "
+                "VALUES (:peer_id, :kind, :id, :access_hash, :title, :username, :invite_hash, :is_member, :updated_at)",
+                record,
+            )
+            if commit:
+                self._db.commit()
+        return record
+
+    def commit(self):
+        if self._db is not None:
+            self._db.commit()
+
+    def lookup(self, key):
+        """Cached record for an id, @username, t.me link or invite link, fresh or stale; None if unknown"""
+        peer_id = None
+        if isinstance(key, int) or (isinstance(key, str) and re.fullmatch(r"-?\d+", key.strip())):
+            key = int(key)
+            peer_id = key if key in self._by_peer else self._by_id.get(key)
+        elif isinstance(key, str):
+            name, is_invite = utils.parse_username(key.strip())
+            if name:
+                peer_id = self._by_invite.get(name) if is_invite else self._by_username.get(name.lower())
+        return self._by_peer.get(peer_id)
+
+    def is_fresh(self, record):
+        return time.time() - record['updated_at'] < self.ttl
+
+    @staticmethod
+    def input_peer(record):
+        if record['kind'] == 'group':
+            return types.InputPeerChat(record['id'])
+        return types.InputPeerChannel(record['id'], record['access_hash'])
+
+    def __len__(self):
+        return len(self._by_peer)
+
 
 class TelegramGroupManager:
-    def _init_(self, api_id, api_hash, phone_number):
+    def __init__(self, api_id, api_hash, phone_number, session_name=None):
         """
         Initialize the Telegram Group Manager
         
@@ -27,50 +270,222 @@ class TelegramGroupManager:
             api_id (int): Your Telegram API ID
             api_hash (str): Your Telegram API Hash
             phone_number (str): Your phone number with country code
+            session_name (str, optional): Session file name (default: TELEGRAM_SESSION, or one per phone number)
         """
         self.api_id = api_id
         self.api_hash = api_hash
         self.phone_number = phone_number
-        self.client = TelegramClient('session_name', api_id, api_hash)
+        self.session_name = session_name or TELEGRAM_SESSION or default_session_name(phone_number)
+        self.client = TelegramClient(self.session_name, api_id, api_hash)
+        self.entities = EntityCache(f"{self.session_name}.entities.db")
+        self._flood_until = 0.0  # monotonic time the account's current flood wait ends
+        self._bot_user = None
         
     async def connect(self):
         """Connect to Telegram"""
         try:
             await self.client.start(phone=self.phone_number)
+            self.entities.load()
             logger.info("Successfully connected to Telegram!")
             return True
         except Exception as e:
             logger.error(f"Failed to connect: {e}")
             return False
-    
-    async def get_all_groups(self):
-        """Get all groups and channels you're part of"""
-        try:
-            dialogs = await self.client(GetDialogsRequest(
-                offset_date=None,
-                offset_id=0,
-                offset_peer=InputPeerEmpty(),
-                limit=100,
-                hash=0
+
+    async def _call(self, request):
+        """
+        Send a raw API request, sleeping through flood waits
+
+        Telethon already sleeps through waits below client.flood_sleep_threshold;
+        longer ones up to MAX_FLOOD_WAIT are waited out here, anything above is raised.
+        While one call waits, every other _call on this client waits with it.
+        """
+        for attempt in range(FLOOD_WAIT_RETRIES + 1):
+            # A flood wait is per account: concurrent callers hold back until it has passed
+            while (delay := self._flood_until - time.monotonic()) > 0:
+                await asyncio.sleep(delay)
+            try:
+                return await self.client(request)
+            except errors.FloodWaitError as e:
+                if e.seconds > MAX_FLOOD_WAIT or attempt == FLOOD_WAIT_RETRIES:
+                    raise
+                logger.warning(f"Flood wait of {e.seconds}s on {type(request).__name__}, sleeping")
+                self._flood_until = max(self._flood_until, time.monotonic() + e.seconds + 1)
+
+    async def _iter_dialog_pages(self, page_size=DIALOG_PAGE_SIZE, archived=False):
+        """
+        Yield (dialog, entity) for every dialog, one GetDialogsRequest page at a time
+
+        Pages are chained with offset cursors taken from the last dialog's top message.
+        """
+        offset_date, offset_id, offset_peer = None, 0, InputPeerEmpty()
+        while True:
+            result = await self._call(GetDialogsRequest(
+                offset_date=offset_date,
+                offset_id=offset_id,
+                offset_peer=offset_peer,
+                limit=page_size,
+                hash=0,
+                folder_id=1 if archived else None
             ))
-            
-            groups = []
-            for dialog in dialogs.dialogs:
-                entity = dialog.entity
-                if hasattr(entity, 'megagroup') or hasattr(entity, 'broadcast'):
-                    groups.append({
-                        'id': entity.id,
-                        'title': entity.title,
-                        'username': getattr(entity, 'username', None),
-                        'type': 'Supergroup' if hasattr(entity, 'megagroup') else 'Channel'
-                    })
-            
-            return groups
+            if isinstance(result, types.messages.DialogsNotModified) or not result.dialogs:
+                return
+
+            entities = {utils.get_peer_id(entity): entity for entity in [*result.users, *result.chats]}
+            messages = {
+                (utils.get_peer_id(message.peer_id), message.id): message
+                for message in result.messages if not isinstance(message, types.MessageEmpty)
+            }
+            for dialog in result.dialogs:
+                entity = entities.get(utils.get_peer_id(dialog.peer))
+                if entity is not None:
+                    yield dialog, entity
+
+            # A plain Dialogs result (not a slice) or a short page is the last one
+            if isinstance(result, types.messages.Dialogs) or len(result.dialogs) < page_size:
+                return
+
+            last = result.dialogs[-1]
+            last_peer_id = utils.get_peer_id(last.peer)
+            message = messages.get((last_peer_id, last.top_message))
+            cursor = (
+                message.date if message else None,
+                last.top_message,
+                utils.get_input_peer(entities[last_peer_id]) if last_peer_id in entities else InputPeerEmpty(),
+            )
+            if cursor == (offset_date, offset_id, offset_peer):
+                return  # no progress; never loop on the same page
+            offset_date, offset_id, offset_peer = cursor
+
+    async def iter_groups(self, kinds=None, snapshot_path=GROUP_SNAPSHOT_PATH, refresh=False, archived=False):
+        """
+        Yield every group and channel you're part of, page by page, as they arrive
+        
+        Args:
+            kinds (iterable, optional): Any of 'group', 'supergroup', 'channel' (default: all)
+            snapshot_path (str, optional): JSONL snapshot that makes later listings incremental
+            refresh (bool): Ignore the snapshot and list everything from Telegram
+            archived (bool): List the archive folder instead of the main chat list
+
+        GetDialogs cannot filter by chat type, so the filter runs on each page as
+        it arrives; users and bots are dropped without building anything for them.
+
+        With a snapshot, paging stops at the first (unpinned) chat whose latest
+        message is unchanged since the snapshot: dialogs come newest-activity
+        first, so everything after it is unchanged too and is read from the file.
+        """
+        kinds = set(kinds or GROUP_KINDS)
+        known_tops = {} if refresh else self._load_snapshot_tops(snapshot_path)
+        snapshot_file = open(f"{snapshot_path}.tmp", "w") if snapshot_path else None
+        seen = set()
+        completed = False
+        try:
+            if snapshot_file:
+                snapshot_file.write(json.dumps({"snapshot_version": SNAPSHOT_VERSION, "created_at": time.time()}) + "\n")
+
+            reached_unchanged = False
+            async for dialog, entity in self._iter_dialog_pages(archived=archived):
+                kind = group_kind(entity)
+                if kind is None:
+                    continue
+                peer_id = utils.get_peer_id(dialog.peer)
+                if not dialog.pinned and known_tops.get(peer_id) == dialog.top_message:
+                    reached_unchanged = True
+                    break
+                seen.add(peer_id)
+                self.entities.remember(entity, commit=False, member=True)
+                group = {
+                    'id': entity.id,
+                    'title': entity.title,
+                    'username': getattr(entity, 'username', None),
+                    'type': KIND_LABELS[kind]
+                }
+                if snapshot_file:
+                    snapshot_file.write(json.dumps(
+                        {**group, 'peer_id': peer_id, 'kind': kind, 'top_message': dialog.top_message}
+                    ) + "\n")
+                if kind in kinds:
+                    yield group
+
+            if reached_unchanged:
+                logger.info(f"Reached chats unchanged since the snapshot; reading the rest from {snapshot_path}")
+                for record in self._read_snapshot(snapshot_path):
+                    if record['peer_id'] in seen:
+                        continue
+                    snapshot_file.write(json.dumps(record) + "\n")
+                    if record['kind'] in kinds:
+                        yield {key: record[key] for key in ('id', 'title', 'username', 'type')}
+            completed = True
+        finally:
+            self.entities.commit()
+            if snapshot_file:
+                snapshot_file.close()
+                # A listing cut short (error, or the caller stopped early) must not replace the snapshot
+                if completed:
+                    os.replace(f"{snapshot_path}.tmp", snapshot_path)
+                else:
+                    os.remove(f"{snapshot_path}.tmp")
+
+    @staticmethod
+    def _read_snapshot(path):
+        """Stream snapshot records (header skipped)"""
+        with open(path) as f:
+            next(f, None)
+            for line in f:
+                yield json.loads(line)
+
+    @staticmethod
+    def _load_snapshot_tops(path):
+        """{peer_id: top_message} from a usable snapshot, or {} (missing, stale or unreadable)"""
+        if not path or not os.path.exists(path):
+            return {}
+        try:
+            with open(path) as f:
+                header = json.loads(next(f))
+            if header.get("snapshot_version") != SNAPSHOT_VERSION:
+                return {}
+            if time.time() - header.get("created_at", 0) > GROUP_SNAPSHOT_MAX_AGE:
+                logger.info("Group snapshot is stale, listing everything again")
+                return {}
+            return {record['peer_id']: record['top_message'] for record in TelegramGroupManager._read_snapshot(path)}
+        except (OSError, ValueError, KeyError, StopIteration) as e:
+            logger.warning(f"Ignoring unreadable group snapshot {path}: {e}")
+            return {}
+
+    async def get_all_groups(self, kinds=None):
+        """Get all groups and channels you're part of (as a list; prefer iter_groups for large accounts)"""
+        try:
+            return [group async for group in self.iter_groups(kinds=kinds)]
         except Exception as e:
             logger.error(f"Error getting groups: {e}")
             return []
     
-    async def create_invite_link(self, group_id, expire_date=None, usage_limit=None):
+    async def resolve_group(self, key):
+        """
+        Cached record for a group, fetching it from Telegram only when unknown or stale
+        
+        Args:
+            key: Group id, @username or t.me link
+        """
+        record = self.entities.lookup(key)
+        if record is not None and self.entities.is_fresh(record):
+            self.entities.hits += 1
+            return record
+        self.entities.misses += 1
+        try:
+            target = self.entities.input_peer(record) if record else key
+            entity = await self.client.get_entity(target)
+        except Exception:
+            if record is None:
+                raise
+            logger.warning(f"Could not refresh {record['title']}, using the cached entry")
+            return record
+        refreshed = self.entities.remember(entity)
+        if refreshed is None:
+            raise ValueError(f"{key} is not a group or channel")
+        return refreshed
+
+    async def create_invite_link(self, group_id, expire_date=None, usage_limit=None, request_needed=None):
         """
         Create an invite link for a group
         
@@ -78,22 +493,24 @@ class TelegramGroupManager:
             group_id (int): ID of the group
             expire_date (int, optional): Expiration date (Unix timestamp)
             usage_limit (int, optional): Maximum number of uses
+            request_needed (bool, optional): Joining through the link needs admin approval
         """
         try:
-            # Get the group entity
-            group = await self.client.get_entity(group_id)
+            # Resolved from the entity cache when the group is known
+            group = await self.resolve_group(group_id)
             
             # Create invite link
-            invite_link = await self.client.create_invite_link(
-                group,
+            invite_link = await self._call(ExportChatInviteRequest(
+                peer=self.entities.input_peer(group),
                 expire_date=expire_date,
-                usage_limit=usage_limit
-            )
+                usage_limit=usage_limit,
+                request_needed=request_needed
+            ))
             
             return {
                 'success': True,
                 'invite_link': invite_link.link,
-                'group_title': group.title,
+                'group_title': group['title'],
                 'expire_date': expire_date,
                 'usage_limit': usage_limit
             }
@@ -139,6 +556,445 @@ class TelegramGroupManager:
                 'error': str(e)
             }
     
+    async def provision_channels(self, specs, concurrency=PROVISION_CONCURRENCY, checkpoint_path=PROVISION_CHECKPOINT,
+                                 fresh=False, on_result=None):
+        """
+        Create and set up many supergroups/channels; returns a report with one result per spec
+
+        Args:
+            specs (list): Dicts with 'title' and optionally 'about', 'kind' ('supergroup' or
+                'channel', default supergroup), 'group_id' (backend bundle to register in) and 'key'
+            concurrency (int): Chats set up at once
+            checkpoint_path (str): JSONL file recording finished steps ('' disables resuming)
+            fresh (bool): Ignore progress recorded by earlier runs
+            on_result (callable, optional): Called with each result as it finishes
+
+        Each chat goes through PROVISION_STEPS: create, promote BOT_USERNAME to admin,
+        create a join-request link, register it with the backend bundle. Every finished
+        step is appended to the checkpoint, so a rerun continues a failed chat where it
+        stopped instead of creating it again.
+        """
+        started_at = datetime.now(timezone.utc)
+        started = time.perf_counter()
+        for spec in specs:
+            if not spec.get('title'):
+                raise ValueError(f"Spec without a title: {spec}")
+            if spec.setdefault('kind', 'supergroup') not in PROVISION_KINDS:
+                raise ValueError(f"Unknown kind {spec['kind']!r} for {spec['title']}")
+        keys = [provision_key(spec) for spec in specs]
+        if len(set(keys)) != len(keys):
+            raise ValueError("Specs must be unique (give repeated titles a 'key')")
+
+        bot = await self._resolve_bot()
+        progress = {} if fresh else load_provision_checkpoint(checkpoint_path)
+        semaphore = asyncio.Semaphore(concurrency)
+        checkpoint_file = open(checkpoint_path, "a") if checkpoint_path else None
+
+        def save(key, state):
+            if checkpoint_file:
+                checkpoint_file.write(json.dumps({'key': key, 'state': state, 'at': time.time()}) + "\n")
+                checkpoint_file.flush()
+
+        async def run(spec, key):
+            async with semaphore:
+                result = await self._provision_one(spec, key, dict(progress.get(key, {})), bot, save)
+            if on_result:
+                on_result(result)
+            return result
+
+        try:
+            results = await asyncio.gather(*(run(spec, key) for spec, key in zip(specs, keys)))
+        finally:
+            self.entities.commit()
+            if checkpoint_file:
+                checkpoint_file.close()
+
+        return {
+            'started_at': started_at.isoformat(),
+            'duration_s': round(time.perf_counter() - started, 2),
+            'total': len(results),
+            'provisioned': sum(1 for r in results if r['status'] == 'provisioned'),
+            'checkpointed': sum(1 for r in results if r['status'] == 'checkpointed'),
+            'failed': sum(1 for r in results if r['status'] == 'failed'),
+            'results': results,
+        }
+
+    async def _resolve_bot(self):
+        """InputUser of BOT_USERNAME, looked up once per client"""
+        if self._bot_user is None:
+            if not BOT_USERNAME:
+                raise ValueError("Set BOT_USERNAME to the bot that should administer the new chats")
+            self._bot_user = utils.get_input_user(await self.client.get_input_entity(BOT_USERNAME))
+        return self._bot_user
+
+    async def _provision_one(self, spec, key, state, bot, save):
+        """Run the steps a spec has not finished yet; never raises"""
+        started = time.perf_counter()
+        result = {
+            'key': key,
+            'title': spec['title'],
+            'kind': spec['kind'],
+            'group_id': spec.get('group_id'),
+            'status': 'failed',
+            'step': None,  # the step that failed
+            'channel_id': None,
+            'invite_link': None,
+            'registered': None,
+            'error': None,
+        }
+        if state.get('step') == PROVISION_STEPS[-1]:
+            result['status'] = 'checkpointed'
+        else:
+            done = PROVISION_STEPS.index(state['step']) + 1 if state.get('step') else 0
+            try:
+                for step in PROVISION_STEPS[done:]:
+                    result['step'] = step
+                    await getattr(self, f"_provision_{step}")(spec, key, state, bot, save)
+                    state['step'] = step
+                    save(key, state)
+                result['status'] = 'provisioned'
+                result['step'] = None
+                logger.info(f"Provisioned {spec['title']} ({state['channel_id']})")
+            except Exception as e:
+                result['error'] = f"{type(e).__name__}: {e}"
+                logger.error(f"Provisioning {spec['title']} failed at {result['step']}: {result['error']}")
+
+        result['channel_id'] = state.get('channel_id')
+        result['invite_link'] = state.get('invite_link')
+        result['registered'] = state.get('registered')
+        result['elapsed_ms'] = round((time.perf_counter() - started) * 1000)
+        return result
+
+    async def _provision_created(self, spec, key, state, bot, save):
+        entity = None
+        if state.get('creating_at'):
+            # An earlier run sent the create request but stopped before recording the result
+            entity = await self._find_created(spec['title'], spec['kind'], state['creating_at'])
+        if entity is None:
+            state['creating_at'] = time.time()
+            save(key, state)
+            updates = await self._call(CreateChannelRequest(
+                title=spec['title'],
+                about=spec.get('about', ""),
+                broadcast=spec['kind'] == 'channel',
+                megagroup=spec['kind'] == 'supergroup'
+            ))
+            entity = updates.chats[0]
+        self.entities.remember(entity, member=True)
+        state['channel_id'] = utils.get_peer_id(entity)
+
+    async def _find_created(self, title, kind, since):
+        """A chat of ours with this title created after `since` (newest dialogs only), or None"""
+        checked = 0
+        async for dialog, entity in self._iter_dialog_pages():
+            if (group_kind(entity) == kind and entity.creator and entity.title == title
+                    and entity.date.timestamp() >= since - 60):
+                return entity
+            checked += 1
+            if checked >= DIALOG_PAGE_SIZE:
+                return None
+        return None
+
+    async def _provision_bot_admin(self, spec, key, state, bot, save):
+        group = await self.resolve_group(state['channel_id'])
+        await self._call(EditAdminRequest(
+            channel=types.InputChannel(group['id'], group['access_hash']),
+            user_id=bot,
+            admin_rights=types.ChatAdminRights(**BOT_ADMIN_RIGHTS),
+            rank="bot"
+        ))
+
+    async def _provision_join_link(self, spec, key, state, bot, save):
+        # Private chats have no chat-wide approval switch; joining through this link needs approval
+        link = await self.create_invite_link(state['channel_id'], request_needed=True)
+        if not link['success']:
+            raise RuntimeError(link['error'])
+        state['invite_link'] = link['invite_link']
+
+    async def _provision_registered(self, spec, key, state, bot, save):
+        if not spec.get('group_id'):
+            state['registered'] = False  # no bundle to add it to
+            return
+        payload = {
+            'chatId': str(state['channel_id']),
+            'chatType': spec['kind'],
+            'chatTitle': spec['title'],
+            'joinLink': state['invite_link'],
+        }
+        for attempt in range(1, PROVISION_BACKEND_ATTEMPTS + 1):
+            try:
+                status, body = await self._backend_request("POST", f"/api/groups/{spec['group_id']}/channels", payload)
+            except urllib.error.URLError as e:
+                status, body = None, str(e.reason)
+            # A duplicate is a 400/409 from the controller, or a 500 from backends that predate the 409
+            if status == 200 or (status in (400, 409, 500) and "already exists" in body):
+                state['registered'] = True
+                return
+            if status is not None and status < 500:
+                break  # unknown bundle, access denied: retrying will not help
+            if attempt < PROVISION_BACKEND_ATTEMPTS:
+                await asyncio.sleep(2 ** attempt)
+        raise RuntimeError(f"backend registration failed ({status or 'unreachable'}): {body[:200]}")
+
+    @staticmethod
+    async def _backend_request(method, path, payload=None):
+        """Send a request to the backend (JSON body if given); returns (status, body text)"""
+        request = urllib.request.Request(
+            f"{BACKEND_URL}{path}",
+            data=json.dumps(payload).encode() if payload is not None else None,
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': f"Bearer {BACKEND_ADMIN_TOKEN}",
+                'X-Bot-Api-Secret': BOT_API_SECRET,
+            },
+            method=method
+        )
+
+        def send():
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    return response.status, response.read().decode()
+            except urllib.error.HTTPError as e:
+                return e.code, e.read().decode()
+
+        return await asyncio.to_thread(send)
+
+    async def reconcile_channel(self, channel, act=False, report_path=None, max_kicks=RECONCILE_MAX_KICKS):
+        """
+        Compare who is in a channel with the backend's active memberships
+
+        Args:
+            channel: Channel id, @username or t.me link
+            act (bool): Remove unpaid members (at most max_kicks; above that only report)
+            report_path (str, optional): JSONL file receiving every difference
+            max_kicks (int): Guard against acting on a truncated or wrong export
+
+        Participants arrive in no particular order, so they are staged in a
+        temporary SQLite file and read back sorted by user id, then merged with
+        the backend export (same order) one page at a time. Memory stays flat
+        however large the channel is.
+
+        Telegram lists at most ~10k participants per filter; when the recent
+        listing falls short of the participant count, name searches widen it. A
+        listing that still falls short is marked incomplete, and active members
+        not seen in it are reported as not_seen rather than paid_absent.
+        """
+        started_at = datetime.now(timezone.utc)
+        started = time.perf_counter()
+        group = await self.resolve_group(channel)
+        if group['kind'] == 'group':
+            raise ValueError(f"{group['title']} is a basic group; memberships are tracked for channels")
+        input_channel = types.InputChannel(group['id'], group['access_hash'])
+        full = await self._call(GetFullChannelRequest(input_channel))
+        expected = full.full_chat.participants_count
+
+        fd, staging_path = tempfile.mkstemp(suffix=".reconcile.db", dir=RECONCILE_STAGING_DIR or None)
+        os.close(fd)
+        db = sqlite3.connect(staging_path)
+        try:
+            db.executescript(RECONCILE_SCHEMA)
+            listed = await self._stage_participants(db, input_channel, expected)
+            complete = not expected or listed >= expected
+            counts = await self._merge_members(db, str(group['peer_id']), complete)
+
+            kicked, refused = 0, False
+            if act and counts[UNPAID_PRESENT]:
+                if counts[UNPAID_PRESENT] > max_kicks:
+                    refused = True
+                    logger.warning(f"{counts[UNPAID_PRESENT]} unpaid members in {group['title']} exceeds "
+                                   f"max_kicks={max_kicks}; reporting only")
+                else:
+                    kicked = await self._kick_unpaid(db, input_channel)
+
+            if report_path:
+                with open(report_path, "w") as f:
+                    for row in db.execute("SELECT * FROM diffs ORDER BY kind, user_id"):
+                        f.write(json.dumps(self._diff_record(row)) + "\n")
+            sample = {
+                kind: [self._diff_record(row) for row in db.execute(
+                    "SELECT * FROM diffs WHERE kind = ? ORDER BY user_id LIMIT ?", (kind, RECONCILE_SAMPLE)
+                )]
+                for kind in (UNPAID_PRESENT, PAID_ABSENT)
+            }
+        finally:
+            db.close()
+            os.remove(staging_path)
+
+        logger.info(f"Reconciled {group['title']}: {counts[UNPAID_PRESENT]} unpaid present, "
+                    f"{counts[PAID_ABSENT]} paid absent, {kicked} removed")
+        return {
+            'channel_id': group['peer_id'],
+            'title': group['title'],
+            'started_at': started_at.isoformat(),
+            'duration_s': round(time.perf_counter() - started, 2),
+            'participants_count': expected,
+            'listed': listed,
+            'complete': complete,
+            **counts,
+            'kicked': kicked,
+            'kicks_refused': refused,
+            'report_path': report_path,
+            'sample': sample,
+        }
+
+    async def _stage_participants(self, db, channel, expected):
+        """Write every participant we can list into the staging table; returns how many were found"""
+        async def stage(participant_filter):
+            offset = 0
+            while True:
+                result = await self._call(GetParticipantsRequest(
+                    channel=channel,
+                    filter=participant_filter,
+                    offset=offset,
+                    limit=RECONCILE_PAGE_SIZE,
+                    hash=0
+                ))
+                if not result.participants:
+                    return
+                users = {user.id: user for user in result.users}
+                rows = []
+                for participant in result.participants:
+                    user = users.get(getattr(participant, 'user_id', None))
+                    if user is None:
+                        continue
+                    # Admins, the owner, bots and this account are never reconciled
+                    exempt = bool(isinstance(participant, (types.ChannelParticipantAdmin, types.ChannelParticipantCreator))
+                                  or user.bot or user.is_self)
+                    rows.append((str(user.id), user.access_hash, int(exempt)))
+                db.executemany("INSERT OR IGNORE INTO participants (user_id, access_hash, exempt) VALUES (?, ?, ?)",
+                               rows)
+                db.commit()
+                offset += len(result.participants)
+
+        def listed():
+            return db.execute("SELECT COUNT(*) FROM participants").fetchone()[0]
+
+        await stage(types.ChannelParticipantsRecent())
+        if expected and listed() < expected:
+            logger.info(f"Listed {listed()} of {expected} participants, widening with name searches")
+            for query in RECONCILE_SEARCH_QUERIES:
+                await stage(types.ChannelParticipantsSearch(query))
+                if listed() >= expected:
+                    break
+        return listed()
+
+    async def _iter_active_members(self, channel_id):
+        """Active memberships of a channel from the backend export, ordered by telegram user id"""
+        after = None
+        while True:
+            query = urllib.parse.urlencode({'limit': RECONCILE_EXPORT_PAGE, **({'after': after} if after else {})})
+            status, body = await self._backend_request(
+                "GET", f"/api/telegram/channels/{urllib.parse.quote(channel_id)}/members?{query}"
+            )
+            if status != 200:
+                raise RuntimeError(f"member export failed ({status}): {body[:200]}")
+            page = json.loads(body)
+            for member in page['members']:
+                yield member
+            if not page.get('has_more') or not page.get('next_after'):
+                return
+            after = page['next_after']
+
+    async def _merge_members(self, db, channel_id, complete):
+        """Merge the sorted participants with the sorted export, writing differences to the diffs table"""
+        now = time.time()
+        counts = {'active_records': 0, 'matched': 0, 'exempt': 0, UNPAID_PRESENT: 0, PAID_ABSENT: 0,
+                  'not_seen': 0, 'expired_absent': 0}
+        pending = []
+
+        def diff(kind, reason, user_id, member=None, access_hash=None):
+            counts[kind] += 1
+            pending.append((user_id, kind, reason, member and member['member_id'],
+                            member and member['expires_at'], access_hash))
+            if len(pending) >= 500:
+                flush()
+
+        def flush():
+            db.executemany("INSERT INTO diffs (user_id, kind, reason, member_id, expires_at, access_hash) "
+                           "VALUES (?, ?, ?, ?, ?, ?)", pending)
+            pending.clear()
+
+        def present_only(participant):
+            user_id, access_hash, exempt = participant
+            if exempt:
+                counts['exempt'] += 1
+            else:
+                diff(UNPAID_PRESENT, "no_active_membership", user_id, access_hash=access_hash)
+
+        # Both sides order ids as strings, byte by byte (SQLite TEXT and MongoDB agree)
+        participants = db.execute("SELECT user_id, access_hash, exempt FROM participants ORDER BY user_id")
+        participant = participants.fetchone()
+        async for member in self._iter_active_members(channel_id):
+            counts['active_records'] += 1
+            user_id = member['telegram_user_id']
+            while participant is not None and participant[0] < user_id:
+                present_only(participant)
+                participant = participants.fetchone()
+            expires_at = member.get('expires_at')
+            expired = bool(expires_at) and datetime.fromisoformat(expires_at.replace("Z", "+00:00")).timestamp() <= now
+            if participant is not None and participant[0] == user_id:
+                if participant[2]:
+                    counts['exempt'] += 1
+                elif expired:
+                    # Usually a kick that failed after the membership expired
+                    diff(UNPAID_PRESENT, "expired", user_id, member, participant[1])
+                else:
+                    counts['matched'] += 1
+                participant = participants.fetchone()
+            elif expired:
+                counts['expired_absent'] += 1  # already gone; the expiry job will close the record
+            elif complete:
+                diff(PAID_ABSENT, "not_in_channel", user_id, member)
+            else:
+                counts['not_seen'] += 1
+        while participant is not None:
+            present_only(participant)
+            participant = participants.fetchone()
+        flush()
+        db.commit()
+        return counts
+
+    async def _kick_unpaid(self, db, channel):
+        """Remove every unpaid participant (banned for a minute, like kickMember); returns how many left"""
+        rows = db.execute("SELECT user_id, access_hash, member_id FROM diffs WHERE kind = ?", (UNPAID_PRESENT,)).fetchall()
+        kicked, kicks = 0, []
+        for user_id, access_hash, member_id in rows:
+            try:
+                await self._call(EditBannedRequest(
+                    channel=channel,
+                    participant=types.InputPeerUser(int(user_id), access_hash),
+                    banned_rights=types.ChatBannedRights(
+                        until_date=datetime.now(timezone.utc) + timedelta(seconds=60), view_messages=True
+                    )
+                ))
+            except Exception as e:
+                action = f"kick_failed: {type(e).__name__}: {e}"
+                logger.warning(f"Could not remove {user_id}: {e}")
+            else:
+                action = "kicked"
+                kicked += 1
+                if member_id:
+                    kicks.append({'member_id': member_id, 'kicked_at': datetime.now(timezone.utc).isoformat(),
+                                  'reason': "Removed by membership reconciliation"})
+            db.execute("UPDATE diffs SET action = ? WHERE user_id = ?", (action, user_id))
+        db.commit()
+
+        # Close the expired memberships we just enforced
+        for start in range(0, len(kicks), RECONCILE_KICK_BATCH):
+            status, body = await self._backend_request(
+                "POST", "/api/telegram/members/kicked", {'kicks': kicks[start:start + RECONCILE_KICK_BATCH]}
+            )
+            if status != 200:
+                logger.warning(f"Backend did not record {len(kicks[start:start + RECONCILE_KICK_BATCH])} kick(s) "
+                               f"({status}): {body[:200]}")
+        return kicked
+
+    @staticmethod
+    def _diff_record(row):
+        user_id, kind, reason, member_id, expires_at, _access_hash, action = row
+        return {'telegram_user_id': user_id, 'kind': kind, 'reason': reason, 'member_id': member_id,
+                'expires_at': expires_at, 'action': action}
+
     async def join_group_by_link(self, invite_link):
         """
         Join a group using an invite link
@@ -147,14 +1003,56 @@ class TelegramGroupManager:
             invite_link (str): The invite link to join
         """
         try:
+            record = self.entities.lookup(invite_link)
+            # Only chats known to be joined; public groups resolved by lookups are cached too
+            if record is not None and record['is_member'] and self.entities.is_fresh(record):
+                self.entities.hits += 1
+                return {
+                    'success': True,
+                    'group_id': record['id'],
+                    'group_title': record['title'],
+                    'message': f"Already a member of: {record['title']}"
+                }
+            self.entities.misses += 1
+
+            invite_hash, is_invite = utils.parse_username(invite_link)
+            if not is_invite:
+                # Public @username or t.me/name link
+                group = await self.resolve_group(invite_link)
+                updates = await self._call(JoinChannelRequest(self.entities.input_peer(group)))
+                chat = updates.chats[0] if getattr(updates, 'chats', None) else None
+                if chat is not None:
+                    group = self.entities.remember(chat, member=True) or group
+                return {
+                    'success': True,
+                    'group_id': group['id'],
+                    'group_title': group['title'],
+                    'message': f"Successfully joined group: {group['title']}"
+                }
+
             # Extract group info from invite link
-            group = await self.client.get_entity(invite_link)
+            invite = await self._call(CheckChatInviteRequest(invite_hash))
+            if isinstance(invite, types.ChatInviteAlready):
+                chat = invite.chat
+                message = f"Already a member of: {chat.title}"
+            else:
+                updates = await self._call(ImportChatInviteRequest(invite_hash))
+                chat = updates.chats[0]
+                message = f"Successfully joined group: {chat.title}"
+            self.entities.remember(chat, invite_hash=invite_hash, member=True)
             
             return {
                 'success': True,
-                'group_id': group.id,
-                'group_title': group.title,
-                'message': f"Successfully joined group: {group.title}"
+                'group_id': chat.id,
+                'group_title': chat.title,
+                'message': message
+            }
+        except errors.InviteRequestSentError:
+            return {
+                'success': True,
+                'group_id': None,
+                'group_title': None,
+                'message': "Join request sent; an admin has to approve it"
             }
         except Exception as e:
             logger.error(f"Error joining group: {e}")
@@ -166,6 +1064,8 @@ class TelegramGroupManager:
     async def disconnect(self):
         """Disconnect from Telegram"""
         await self.client.disconnect()
+        logger.info(f"Entity cache: {self.entities.hits} local lookups, {self.entities.misses} fetched")
+        self.entities.close()
         logger.info("Disconnected from Telegram")
 
 async def main():
@@ -195,26 +1095,29 @@ async def main():
         print("2. Create new group")
         print("3. Generate invite link for existing group")
         print("4. Join group by invite link")
-        print("5. Exit")
+        print("5. Provision channels from a spec file")
+        print("6. Reconcile channel members with the backend")
+        print("7. Exit")
         
         while True:
-            choice = input("\nEnter your choice (1-5): ").strip()
+            choice = input("\nEnter your choice (1-7): ").strip()
             
             if choice == "1":
                 # List all groups
                 print("\nFetching your groups...")
-                groups = await manager.get_all_groups()
-                
-                if groups:
-                    print(f"\nFound {len(groups)} groups:")
-                    for i, group in enumerate(groups, 1):
-                        print(f"{i}. {group['title']} ({group['type']})")
+                count = 0
+                try:
+                    # Printed as each page arrives
+                    async for group in manager.iter_groups():
+                        count += 1
+                        print(f"{count}. {group['title']} ({group['type']})")
                         if group['username']:
                             print(f"   Username: @{group['username']}")
                         print(f"   ID: {group['id']}")
                         print()
-                else:
-                    print("No groups found.")
+                except Exception as e:
+                    print(f"❌ Error: {e}")
+                print(f"Found {count} groups." if count else "No groups found.")
             
             elif choice == "2":
                 # Create new group
@@ -292,11 +1195,55 @@ async def main():
                     print("Please enter a valid invite link!")
             
             elif choice == "5":
+                # Batch provisioning: a JSON list of specs, see provision_channels()
+                spec_path = input("Spec file (JSON list): ").strip()
+                try:
+                    with open(spec_path) as f:
+                        specs = json.load(f)
+                    print(f"Provisioning {len(specs)} chat(s), {PROVISION_CONCURRENCY} at a time...")
+                    report = await manager.provision_channels(specs, on_result=lambda r: print(
+                        f"✅ {r['title']}: {r['invite_link']}" if r['status'] != 'failed'
+                        else f"❌ {r['title']} (at {r['step']}): {r['error']}"
+                    ))
+                    with open(f"{spec_path}.report.json", "w") as f:
+                        json.dump(report, f, indent=2)
+                    print(f"{report['provisioned']} provisioned, {report['checkpointed']} already done, "
+                          f"{report['failed']} failed; report written to {spec_path}.report.json")
+                    if report['failed']:
+                        print("Run this again with the same spec file to resume the failed ones.")
+                except (OSError, ValueError) as e:
+                    print(f"❌ Error: {e}")
+            
+            elif choice == "6":
+                # Membership reconciliation: who is in the channel vs. who has paid
+                channel = input("Channel id, @username or link: ").strip()
+                act = input("Remove unpaid members? (y/N): ").strip().lower() == "y"
+                if channel:
+                    report_path = f"reconcile_{re.sub(r'[^A-Za-z0-9_-]', '_', channel)}.jsonl"
+                    print("Reconciling members...")
+                    try:
+                        report = await manager.reconcile_channel(channel, act=act, report_path=report_path)
+                        print(f"Listed {report['listed']} of {report['participants_count']} participants"
+                              + ("" if report['complete'] else " (incomplete listing)"))
+                        print(f"Active memberships: {report['active_records']}, matched: {report['matched']}")
+                        print(f"❗ Unpaid but present: {report[UNPAID_PRESENT]}")
+                        print(f"❗ Paid but absent: {report[PAID_ABSENT]}"
+                              + (f" (+{report['not_seen']} not seen)" if report['not_seen'] else ""))
+                        if act:
+                            print("⚠️ Too many unpaid members to remove automatically; check the report"
+                                  if report['kicks_refused'] else f"✅ Removed {report['kicked']} member(s)")
+                        print(f"Differences written to {report_path}")
+                    except Exception as e:
+                        print(f"❌ Error: {e}")
+                else:
+                    print("Please enter a channel!")
+            
+            elif choice == "7":
                 print("Goodbye!")
                 break
             
             else:
-                print("Invalid choice! Please select 1-5.")
+                print("Invalid choice! Please select 1-7.")
     
     except KeyboardInterrupt:
         print("\nOperation cancelled by user.")
@@ -305,5 +1252,5 @@ async def main():
     finally:
         await manager.disconnect()
 
-if _name_ == "_main_":
+if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file